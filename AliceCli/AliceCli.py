@@ -23,6 +23,7 @@ import click
 from . import MainMenu
 from .alice import alice
 from .install import install
+from .transfer import transfer
 from .utils import commons, utils
 
 
@@ -47,6 +48,10 @@ cli.add_command(utils.systemLogs)
 cli.add_command(utils.changeHostname)
 cli.add_command(utils.changePassword)
 cli.add_command(utils.disableRespeakerLeds)
+cli.add_command(utils.controlDaemon)
+cli.add_command(utils.runCommand)
+cli.add_command(utils.deviceFacts)
+cli.add_command(utils.deviceStatus)
 cli.add_command(alice.updateAlice)
 cli.add_command(alice.systemctl)
 cli.add_command(alice.reportBug)
@@ -54,3 +59,6 @@ cli.add_command(install.installAlice)
 cli.add_command(install.installSoundDevice)
 cli.add_command(install.uninstallSoundDevice)
 cli.add_command(install.prepareSdCard)
+cli.add_command(transfer.upload)
+cli.add_command(transfer.download)
+cli.add_command(transfer.sync)
@@ -18,9 +18,9 @@
 #  Last modified: 2021.03.03 at 13:15:43 CET
 #  Last modified by: Psycho
 import click
-import time
 
 from AliceCli.utils import commons
+from AliceCli.utils.ssh import Step
 from AliceCli.utils.decorators import checkConnection
 
 
@@ -31,14 +31,13 @@ def updateAlice(ctx: click.Context):
 	click.secho('Updating Alice, please wait', fg='yellow')
 
 	commons.waitAnimation()
-	commons.sshCmd('sudo systemctl stop ProjectAlice')
-	time.sleep(2)
-	commons.sshCmd('rm ~/ProjectAlice/requirements.hash')
-	commons.sshCmd('rm ~/ProjectAlice/sysrequirements.hash')
-	commons.sshCmd('rm ~/ProjectAlice/pipuninstalls.hash')
-	commons.sshCmd('cd ~/ProjectAlice && git pull && git submodules foreach git pull')
-	time.sleep(2)
-	commons.sshCmd('sudo systemctl start ProjectAlice')
+	commons.sshScript([
+		Step('sudo systemctl stop ProjectAlice', 'Stopping Alice'),
+		Step('rm -f ~/ProjectAlice/requirements.hash ~/ProjectAlice/sysrequirements.hash ~/ProjectAlice/pipuninstalls.hash', hide=True),
+		Step('cd ~/ProjectAlice && git pull && git submodules foreach git pull', 'Pulling the updates'),
+		Step('sudo systemctl start ProjectAlice', 'Starting Alice')
+	])
+	commons.forgetFacts()
 	commons.printSuccess('Alice updated!')
 	commons.returnToMainMenu(ctx, pause=True)
 
@@ -19,6 +19,7 @@
 import click
 import json
 import os
+import paramiko
 import platform
 import psutil
 import requests
@@ -35,9 +36,9 @@ from shutil import which
 from tqdm import tqdm
 from typing import List
 
-from AliceCli.utils import commons
-from AliceCli.utils.commons import sshCmd, sshCmdWithReturn
+from AliceCli.utils import commons, facts, transfers
 from AliceCli.utils.decorators import checkConnection
+from AliceCli.utils.ssh import CommandInterrupted, Step
 from AliceCli.utils.utils import reboot, systemLogs
 
 
@@ -55,11 +56,18 @@ def installSoundDevice(ctx: click.Context, device: str):
 
 	ctx.invoke(uninstallSoundDevice, device=device, return_to_main_menu=False)
 	commons.waitAnimation()
-	sshCmd('sudo apt-get install git -y')
-	if device.lower() in {'respeaker2mics', 'respeaker4mics', 'respeaker4miclineararray', 'respeaker6micarray'}:
-		sshCmd('git clone https://github.com/HinTak/seeed-voicecard.git ~/seeed-voicecard/')
-		sshCmd('git -C ~/seeed-voicecard/ checkout v5.9 && git -C ~/seeed-voicecard/ pull')
-		sshCmd('cd ~/seeed-voicecard/ && sudo ./install.sh')
+	steps = [Step('sudo apt-get install git -y', 'Installing git')]
+	respeaker = device.lower() in {'respeaker2mics', 'respeaker4mics', 'respeaker4miclineararray', 'respeaker6micarray'}
+	if respeaker:
+		steps.extend([
+			Step('git clone https://github.com/HinTak/seeed-voicecard.git ~/seeed-voicecard/', 'Cloning the sound card drivers'),
+			Step('git -C ~/seeed-voicecard/ checkout v5.9 && git -C ~/seeed-voicecard/ pull'),
+			Step('cd ~/seeed-voicecard/ && sudo ./install.sh', 'Installing the sound card drivers')
+		])
+
+	commons.sshScript(steps)
+	commons.forgetFacts()
+	if respeaker:
 		ctx.invoke(reboot, return_to_main_menu=False)
 		commons.printSuccess('Sound device installed!')
 
@@ -79,10 +87,18 @@ def uninstallSoundDevice(ctx: click.Context, device: str, return_to_main_menu: b
 			return
 
 	if device.lower() in {'respeaker2Mics', 'respeaker4Mics', 'respeaker4miclineararray', 'respeaker6micarray'}:
-		result = sshCmdWithReturn('test -d ~/seeed-voicecard/ && echo "1"')[0].readline()
-		if result:
-			sshCmd('cd ~/seeed-voicecard/ && sudo ./uninstall.sh')
-			sshCmd('sudo rm -rf ~/seeed-voicecard/')
+		try:
+			driver = commons.deviceFact('soundDriver')
+		except (CommandInterrupted, paramiko.SSHException, OSError) as e:
+			commons.printError(f'Failed checking the device for sound card drivers: {e}')
+			driver = None
+
+		if driver == facts.DRIVER_SEEED:
+			commons.sshScript([
+				Step('cd ~/seeed-voicecard/ && sudo ./uninstall.sh', 'Uninstalling the sound card drivers'),
+				Step('sudo rm -rf ~/seeed-voicecard/')
+			])
+			commons.forgetFacts()
 			ctx.invoke(reboot, return_to_main_menu=return_to_main_menu)
 			commons.printSuccess('Sound device uninstalled!')
 
@@ -105,8 +121,14 @@ def getDeviceName() -> str:
 def install(ctx: click.Context, force: bool, name: str):
 	click.secho(f'\nInstalling {name}!', fg='yellow')
 
-	result = sshCmdWithReturn('test -d ~/ProjectAlice/ && echo "1"')[0].readline()
-	if result:
+	try:
+		installed = commons.deviceFact('aliceInstalled')
+	except (CommandInterrupted, paramiko.SSHException, OSError) as e:
+		commons.printError(f'Failed checking the device for an existing install: {e}')
+		commons.returnToMainMenu(ctx)
+		return
+
+	if installed:
 		if not force:
 			commons.printError('Alice seems to already exist on that host')
 			confirm = inquirer.confirm(
@@ -119,8 +141,11 @@ def install(ctx: click.Context, force: bool, name: str):
 				return
 
 		commons.waitAnimation()
-		sshCmd('sudo systemctl stop ProjectAlice')
-		sshCmd('sudo rm -rf ~/ProjectAlice')
+		commons.sshScript([
+			Step('sudo systemctl stop ProjectAlice'),
+			Step('sudo rm -rf ~/ProjectAlice')
+		])
+		commons.forgetFacts()
 		commons.stopAnimation()
 
 	releaseType = inquirer.select(
@@ -171,27 +196,28 @@ def install(ctx: click.Context, force: bool, name: str):
 
 	commons.printSuccess(f'Generated {name}.yaml')
 
-	commons.printInfo('Updating system')
-	sshCmd('sudo apt-get update')
-	sshCmd('sudo apt-get install git -y')
-	sshCmd('git config --global user.name "Han Oter"')
-	sshCmd('git config --global user.email "anotheruser@projectalice.io"')
-
-	commons.printInfo('Cloning Alice')
-	sshCmd(f'git clone https://github.com/project-alice-assistant/{name}.git ~/ProjectAlice')
+	steps = [
+		Step('sudo apt-get update', 'Updating system'),
+		Step('sudo apt-get install git -y'),
+		Step('git config --global user.name "Han Oter"'),
+		Step('git config --global user.email "anotheruser@projectalice.io"'),
+		Step(f'git clone https://github.com/project-alice-assistant/{name}.git ~/ProjectAlice', 'Cloning Alice')
+	]
 	if name == 'ProjectAliceSatellite':
-		sshCmd(f'git checkout 1.0.0-rc1')
-		sshCmd(f'git pull')
-
-	sftp = commons.SSH.open_sftp()
-	sftp.put(str(confFile), f'/home/pi/ProjectAlice/{name}.yaml')
-	sftp.close()
-
-	sshCmd(f'sudo rm /boot/{name}.yaml')
-	sshCmd(f'sudo cp ~/ProjectAlice/{name}.yaml /boot/{name}.yaml')
-
-	commons.printInfo('Start install process')
-	sshCmd('cd ~/ProjectAlice/ && python3 main.py')
+		steps.extend([
+			Step(f'git checkout 1.0.0-rc1'),
+			Step(f'git pull')
+		])
+	commons.sshScript(steps)
+	commons.forgetFacts()
+
+	transfers.upload(commons.SESSIONS.session(), confFile, f'/home/pi/ProjectAlice/{name}.yaml')
+
+	commons.sshScript([
+		Step(f'sudo rm /boot/{name}.yaml'),
+		Step(f'sudo cp ~/ProjectAlice/{name}.yaml /boot/{name}.yaml'),
+		Step('cd ~/ProjectAlice/ && python3 main.py', 'Start install process')
+	])
 
 	commons.printSuccess('Alice has completed the basic installation! She\'s now working further to complete the installation, let\'s see what she does!')
 	ctx.invoke(systemLogs)
@@ -0,0 +1,72 @@
+#  Copyright (c) 2021
+#
+#  This file, launcher.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import argparse
+import sys
+from typing import List, Optional
+
+from AliceCli.utils import daemon
+
+
+class _Parser(argparse.ArgumentParser):
+
+	def error(self, message: str):
+		raise ValueError(message)
+
+
+def fastRun(arguments: List[str]) -> Optional[int]:
+	"""
+	Runs `alice run` through the control daemon without loading the CLI, whose imports take most of a second, and
+	returns the command's exit status. None when the full CLI has to handle it: another command, arguments for click
+	to complain about, or no daemon listening. Keep this module and daemon's client side to the standard library.
+	"""
+	if not arguments or arguments[0] != 'run' or not daemon.isSupported():
+		return None
+
+	parser = _Parser(add_help=False)
+	parser.add_argument('-i', '--ip_address', required=True)
+	parser.add_argument('-p', '--port', type=int, default=22)
+	parser.add_argument('-c', '--command', required=True)
+	parser.add_argument('-t', '--timeout', type=float)
+	parser.add_argument('--idle_timeout', type=float)
+	try:
+		options = parser.parse_args(arguments[1:])
+	except ValueError:
+		return None
+
+	if any(limit is not None and limit <= 0 for limit in (options.timeout, options.idle_timeout)):
+		return None
+
+	def echo(stream: str, line: str):
+		output = sys.stderr if stream == 'stderr' else sys.stdout
+		output.write(line)
+		output.flush()
+
+	try:
+		return daemon.run(options.ip_address, options.command, echo, options.port, timeout=options.timeout, idleTimeout=options.idle_timeout)
+	except (daemon.DaemonError, OSError, ValueError) as e:
+		sys.stderr.write(f'✘ {e}\n')
+		return 255
+
+
+def main():
+	exitStatus = fastRun(sys.argv[1:])
+	if exitStatus is not None:
+		sys.exit(exitStatus)
+
+	from AliceCli.AliceCli import cli
+	cli()
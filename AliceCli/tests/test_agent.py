@@ -0,0 +1,65 @@
+#  Copyright (c) 2021
+#
+#  This file, test_agent.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import paramiko
+
+from AliceCli.tests.test_ssh import _serve
+from AliceCli.utils import agent
+
+
+class Test_Agent(TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directory.cleanup)
+		Path(self.directory.name, 'config.json').write_text('{"adminPinCode": 1234}')
+
+		key = paramiko.RSAKey.generate(1024)
+		self.client = paramiko.SSHClient()
+		self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy)
+		self.client.connect('127.0.0.1', port=_serve(key, self.directory.name), username='pi', pkey=key, look_for_keys=False, allow_agent=False)
+		self.addCleanup(self.client.close)
+
+
+	def test_batch(self):
+		with agent.Agent(self.client) as remote:
+			config = str(Path(self.directory.name, 'config.json'))
+			stat, content, missing, processes, audio = remote.batch([
+				('stat', {'path': config}),
+				('read', {'path': config, 'limit': 5}),
+				('read', {'path': str(Path(self.directory.name, 'missing'))}),
+				('processes', dict()),
+				('audio', dict())
+			])
+
+			self.assertEqual((stat['exists'], stat['isDir'], stat['size']), (True, False, 22))
+			self.assertEqual(content, '{"adm')
+			self.assertIsInstance(missing, agent.AgentError)
+			self.assertTrue(any('python3' in process['command'] for process in processes))
+			self.assertIsInstance(audio, list)
+
+			# The same channel keeps answering
+			self.assertFalse(remote.call('stat', path=str(Path(self.directory.name, 'nothing')))['exists'])
+			with self.assertRaises(agent.AgentError):
+				remote.call('reboot')
+			self.assertTrue(remote.alive)
+
+		self.assertFalse(remote.alive)
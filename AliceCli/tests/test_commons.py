@@ -18,21 +18,79 @@
 #  Last modified: 2021.03.07 at 13:37:37 CET
 #  Last modified by: Psycho
 
+import tempfile
+import time
+from pathlib import Path
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
 
 import click
+import paramiko
+from InquirerPy.base.control import Choice
+from click.testing import CliRunner
 
-from AliceCli.utils import commons
+from AliceCli.tests.test_ssh import _serve
+from AliceCli.utils import commons, configs, discovery, inventory, ssh
 
 
 class Test_Commons(TestCase):
 
 	def test_discover(self):
-		pass  # Nothing to test
+		known = {
+			'10.0.0.5'   : {'name': 'alice', 'lastSeen': time.time()},
+			'192.168.1.5': {'name': 'kitchen', 'lastSeen': time.time()}
+		}
+		offered = list()
+
+		def select(devices, checkAuth=False):
+			offered.append([choice.value for choice in devices])
+			return 'Return to main menu'
+
+		with patch.object(inventory, 'loadInventory', return_value=known), \
+				patch.object(inventory, 'revalidateInBackground'), \
+				patch.object(commons, '_sweep', return_value=[Choice('172.16.0.9')]) as sweep, \
+				patch.object(commons, '_selectDevice', side_effect=select), \
+				patch.object(commons, 'returnToMainMenu'), \
+				patch.object(click, 'clear'):
+			CliRunner().invoke(commons.discover, ['--all_devices'])
+			CliRunner().invoke(commons.discover, ['--all_devices', '--network', '192.168.1.0/24'])
+			CliRunner().invoke(commons.discover, ['--all_devices', '--method', 'tcp'])
+
+		self.assertEqual(offered[0], ['10.0.0.5', '192.168.1.5', commons.RESCAN])
+		self.assertEqual(offered[1], ['192.168.1.5', commons.RESCAN])
+		self.assertEqual(offered[2], ['172.16.0.9'])
+		sweep.assert_called_once()
+
+
+	def test_discover_full_scan(self):
+		with patch.object(discovery, 'neighborCandidates', return_value=['10.0.0.5']) as neighbors, \
+				patch.object(discovery, 'localNetworks', return_value={'10.0.0.0/24': 'eth0'}), \
+				patch.object(discovery, 'resolveHosts', return_value=[]), \
+				patch.object(inventory, 'recordDevices'), \
+				patch.object(commons, '_sweep', return_value=[Choice('10.0.0.9')]) as sweep, \
+				patch.object(commons, '_selectDevice', return_value='Return to main menu'), \
+				patch.object(commons, 'returnToMainMenu'), \
+				patch.object(click, 'clear'):
+			CliRunner().invoke(commons.discover, ['--full_scan'])
+
+		neighbors.assert_not_called()
+		sweep.assert_called_once()
 
 
 	def test_connect(self):
-		pass  # Nothing to test
+		with tempfile.TemporaryDirectory() as directory, \
+				patch('AliceCli.utils.configs.CONFIG_FILE', Path(directory, 'configs.json')), \
+				patch('AliceCli.utils.configs.SSH_DIR', Path(directory)), \
+				patch.object(commons.SESSIONS, 'activate', return_value=True), \
+				patch.object(commons.SESSIONS, 'session', return_value='client'), \
+				patch.object(commons, 'remoteAgent', return_value=None) as remoteAgent, \
+				patch.object(commons, 'printSuccess'), \
+				patch.object(commons, 'printInfo') as printInfo:
+			client = CliRunner().invoke(commons.connect, ['-i', '10.0.0.5', '-r', 'false', '--agent'], standalone_mode=False).return_value
+
+		self.assertEqual(client, 'client')
+		remoteAgent.assert_called_once()
+		printInfo.assert_called_once()
 
 
 	def test_print_error(self):
@@ -86,3 +144,44 @@ class Test_Commons(TestCase):
 		self.assertRaises(click.BadParameter, commons.validateHostname, 'project alice')
 		self.assertRaises(click.BadParameter, commons.validateHostname, 'project?alice')
 		self.assertEqual(commons.validateHostname('ProjectAlice'), 'ProjectAlice')
+
+
+	def test_validate_networks(self):
+		self.assertEqual(commons.validateNetworks(['192.168.1.12/24', '10.0.0.0/16,10.0.1.0/24']), ('10.0.0.0/16', '192.168.1.0/24'))
+		self.assertRaises(click.BadParameter, commons.validateNetworks, ['192.168.1.300/24'])
+
+
+	@patch('AliceCli.utils.commons.printSuccess')
+	@patch('AliceCli.utils.commons.printInfo')
+	def test_try_reconnect(self, *_):
+		with tempfile.TemporaryDirectory() as directory, \
+				patch('AliceCli.utils.configs.CONFIG_FILE', Path(directory, 'configs.json')), \
+				patch('AliceCli.utils.configs.SSH_DIR', Path(directory)), \
+				patch('AliceCli.utils.inventory.INVENTORY_FILE', Path(directory, 'inventory.json')):
+			key = paramiko.RSAKey.generate(1024)
+			key.write_private_key_file(str(Path(directory, 'id_rsa_127.0.0.1')))
+			port = _serve(key)
+			confs = configs.loadConfigs()
+			confs['servers']['127.0.0.1'] = {'keyFile': 'id_rsa_127.0.0.1', 'user': 'pi'}
+			configs.saveConfigs(confs)
+
+			waitForPort, waitForPortClosed, openSession = ssh.waitForPort, ssh.waitForPortClosed, ssh.openSession
+			with patch('AliceCli.utils.ssh.waitForPort', side_effect=lambda address, timeout: waitForPort(address, port, timeout)), \
+					patch('AliceCli.utils.ssh.waitForPortClosed', side_effect=lambda address, timeout: waitForPortClosed(address, port, timeout)), \
+					patch('AliceCli.utils.ssh.openSession', side_effect=lambda address, **options: openSession(address, port, **options)):
+				currentBoot = Path(ssh.BOOT_ID_FILE).read_text().strip()
+				self.assertFalse(commons.tryReconnect(MagicMock(), '127.0.0.1', currentBoot, timeout=1, afterReboot=True))
+				self.assertTrue(commons.tryReconnect(MagicMock(), '127.0.0.1', 'previous-boot', timeout=5, afterReboot=True))
+				self.assertIn('127.0.0.1', commons.SESSIONS)
+				commons.SESSIONS.closeAll()
+
+				# Nothing to compare with, the device never went down: not rebooted
+				self.assertFalse(commons.tryReconnect(MagicMock(), '127.0.0.1', None, timeout=1, afterReboot=True))
+
+				# The new boot cannot be read, it does not count as a different one
+				with patch('AliceCli.utils.ssh.BOOT_ID_FILE', str(Path(directory, 'missing'))):
+					self.assertFalse(commons.tryReconnect(MagicMock(), '127.0.0.1', 'previous-boot', timeout=1, afterReboot=True))
+
+				# A lost link is no reboot, any session will do
+				self.assertTrue(commons.tryReconnect(MagicMock(), '127.0.0.1', timeout=5))
+				commons.SESSIONS.closeAll()
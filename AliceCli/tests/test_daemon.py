@@ -0,0 +1,91 @@
+#  Copyright (c) 2021
+#
+#  This file, test_daemon.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import io
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+import paramiko
+
+from AliceCli.tests.test_ssh import _serve
+from AliceCli import launcher
+from AliceCli.utils import configs, daemon
+
+
+class Test_Daemon(TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		for target, value in (
+				('AliceCli.utils.daemon.DAEMON_SOCKET', Path(self.directory.name, 'control.sock')),
+				('AliceCli.utils.configs.CONFIG_FILE', Path(self.directory.name, 'configs.json')),
+				('AliceCli.utils.configs.SSH_DIR', Path(self.directory.name))
+		):
+			patcher = patch(target, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		self.addCleanup(self.directory.cleanup)
+
+
+	def test_not_running(self):
+		self.assertFalse(daemon.isRunning())
+		self.assertIsNone(daemon.run('127.0.0.1', 'true'))
+		self.assertFalse(daemon.stop())
+
+
+	def test_launcher_stays_light(self):
+		self.assertIsNone(launcher.fastRun(['run', '-i', '127.0.0.1', '-c', 'true']))  # No daemon listening
+		loaded = subprocess.run([sys.executable, '-c', 'import sys, AliceCli.launcher; print(sorted({"click", "paramiko"} & set(sys.modules)))'], stdout=subprocess.PIPE, universal_newlines=True, check=True)
+		self.assertEqual(loaded.stdout.strip(), '[]')
+
+
+	def test_run(self):
+		key = paramiko.RSAKey.generate(1024)
+		key.write_private_key_file(str(Path(self.directory.name, 'id_rsa_127.0.0.1')))
+		port = _serve(key)
+		confs = configs.loadConfigs()
+		confs['servers']['127.0.0.1'] = {'keyFile': 'id_rsa_127.0.0.1', 'user': 'pi'}
+		configs.saveConfigs(confs)
+
+		server = threading.Thread(target=daemon.serve, daemon=True)
+		server.start()
+		while not daemon.isRunning():
+			self.assertTrue(server.is_alive())
+
+		lines = list()
+		self.assertEqual(daemon.run('127.0.0.1', 'echo hello; echo world >&2; exit 5', lambda *line: lines.append(line), port), 5)
+		self.assertEqual(sorted(lines), [('stderr', 'world\n'), ('stdout', 'hello\n')])
+		self.assertEqual(daemon.status()['sessions'], ['127.0.0.1'])
+
+		with self.assertRaises(daemon.DaemonError):
+			daemon.run('127.0.0.2', 'true')
+
+		with patch('sys.stdout', io.StringIO()) as stdout:
+			self.assertEqual(launcher.fastRun(['run', '-i', '127.0.0.1', '-p', str(port), '-c', 'echo fast; exit 3']), 3)
+		self.assertEqual(stdout.getvalue(), 'fast\n')
+		self.assertIsNone(launcher.fastRun(['run', '-i', '127.0.0.1', '--unknown']))
+		self.assertIsNone(launcher.fastRun(['connect', '-i', '127.0.0.1']))
+
+		self.assertTrue(daemon.stop())
+		server.join(timeout=5)
+		self.assertFalse(server.is_alive())
+		self.assertFalse(daemon.DAEMON_SOCKET.exists())
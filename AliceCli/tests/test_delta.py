@@ -0,0 +1,91 @@
+#  Copyright (c) 2021
+#
+#  This file, test_delta.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import paramiko
+
+from AliceCli.tests.test_ssh import _serve
+from AliceCli.utils import delta
+
+
+class Test_Delta(TestCase):
+
+	def setUp(self):
+		self.local = tempfile.TemporaryDirectory()
+		self.remote = tempfile.TemporaryDirectory()
+		self.addCleanup(self.local.cleanup)
+		self.addCleanup(self.remote.cleanup)
+
+		key = paramiko.RSAKey.generate(1024)
+		self.client = paramiko.SSHClient()
+		self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy)
+		self.client.connect('127.0.0.1', port=_serve(key, self.remote.name), username='pi', pkey=key, look_for_keys=False, allow_agent=False)
+		self.addCleanup(self.client.close)
+
+
+	def test_rolling_checksum(self):
+		data = os.urandom(5000)
+		a, b = delta.weakChecksum(data[:1024])
+		for position in range(1, 100):
+			outgoing, incoming = data[position - 1], data[position + 1023]
+			a = (a - outgoing + incoming) % delta.MODULUS
+			b = (b - 1024 * outgoing + a) % delta.MODULUS
+			self.assertEqual((a, b), delta.weakChecksum(data[position:position + 1024]))
+
+
+	def test_delta_finds_shifted_blocks(self):
+		old = os.urandom(8192)
+		new = b'inserted' + old[:4096] + b'changed' + old[5120:]
+		blocks = list()
+		for offset in range(0, len(old), 1024):
+			a, b = delta.weakChecksum(old[offset:offset + 1024])
+			blocks.append((a | b << 16, delta.hashlib.md5(old[offset:offset + 1024]).hexdigest()))
+
+		ops = delta.delta(new, 1024, blocks)
+		self.assertEqual(ops, [(delta.DATA, b'inserted'), (delta.COPY, 0, 4), (delta.DATA, b'changed'), (delta.COPY, 5, 3)])
+
+
+	def test_sync(self):
+		source = Path(self.local.name, 'skill')
+		Path(source, 'i18n').mkdir(parents=True)
+		config = os.urandom(200000)
+		Path(source, 'config.json').write_bytes(config)
+		Path(source, 'i18n', 'en.json').write_text('{"hello": "world"}')
+		Path(source, 'empty').write_bytes(b'')
+
+		plans = delta.sync(self.client, source, 'skills/skill', dryRun=True)
+		self.assertEqual({plan.status for plan in plans}, {delta.NEW})
+		self.assertFalse(Path(self.remote.name, 'skills').exists())
+
+		delta.sync(self.client, source, 'skills/skill')
+		target = Path(self.remote.name, 'skills', 'skill')
+		self.assertEqual(Path(target, 'config.json').read_bytes(), config)
+		self.assertEqual(Path(target, 'i18n', 'en.json').read_text(), '{"hello": "world"}')
+		self.assertEqual(Path(target, 'empty').read_bytes(), b'')
+
+		edited = config[:50000] + b'edited' + config[60000:]
+		Path(source, 'config.json').write_bytes(edited)
+		plans = {plan.path: plan for plan in delta.sync(self.client, source, 'skills/skill')}
+		self.assertEqual(plans['i18n/en.json'].status, delta.UNCHANGED)
+		self.assertEqual(plans['config.json'].status, delta.CHANGED)
+		self.assertLess(plans['config.json'].sent, 2 * 10000)
+		self.assertEqual(Path(target, 'config.json').read_bytes(), edited)
+		self.assertEqual(list(target.glob('*.pacli-sync')), [])
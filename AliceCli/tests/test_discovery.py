@@ -0,0 +1,247 @@
+#  Copyright (c) 2021
+#
+#  This file, test_discovery.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import errno
+import socket
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from networkscan import networkscan
+
+from AliceCli.utils import discovery, inventory
+
+
+def _fakeLookup(host: str):
+	if host == '10.0.0.2':
+		raise socket.herror('no PTR')
+	if host == '10.0.0.3':
+		time.sleep(1)
+	return f'host-{host}', list(), [host]
+
+
+class Test_Discovery(TestCase):
+
+	def test_is_alice_name(self):
+		self.assertTrue(discovery.isAliceName('ProjectAlice.home'))
+		self.assertTrue(discovery.isAliceName('raspberrypi'))
+		self.assertFalse(discovery.isAliceName('printer'))
+
+
+	@patch('AliceCli.utils.discovery.socket.gethostbyaddr', side_effect=_fakeLookup)
+	def test_resolve_hosts(self, _):
+		start = time.monotonic()
+		result = dict(discovery.resolveHosts(['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.1'], workers=4, timeout=0.2))
+		self.assertLess(time.monotonic() - start, 0.9)
+		self.assertEqual(result, {'10.0.0.1': 'host-10.0.0.1'})
+
+
+	def test_network_hosts(self):
+		self.assertEqual(discovery.networkHosts('192.168.1.5/30'), ['192.168.1.5', '192.168.1.6'])
+
+
+	def test_tcp_scan(self):
+		with socket.socket() as server:
+			server.bind(('127.0.0.1', 0))
+			server.listen()
+			port = server.getsockname()[1]
+			self.assertEqual(discovery.tcpScan(['127.0.0.1', '127.0.0.2'], ports=[port], budget=1), ['127.0.0.1'])
+
+
+	def test_icmp_sweep_backs_off_without_buffers(self):
+		sock = MagicMock()
+		sock.type = socket.SOCK_RAW
+		sock.__enter__.return_value = sock
+		sock.sendto.side_effect = OSError(errno.ENOBUFS, 'No buffer space available')
+		waits = list()
+
+		def alwaysWritable(readable, writable, _, timeout):
+			waits.append(timeout)
+			time.sleep(timeout)
+			return [], writable, []
+
+		with patch('AliceCli.utils.discovery.select.select', side_effect=alwaysWritable):
+			self.assertEqual(list(discovery._icmpReplies(sock, ['192.168.1.20'], budget=0.3)), list())
+		self.assertLess(len(waits), 100)
+
+
+	def test_icmp_echo_request(self):
+		packet = discovery.icmpEchoRequest(0x1234, 7)
+		self.assertEqual(discovery.icmpChecksum(packet), 0)
+		reply = bytes([discovery.ICMP_ECHO_REPLY]) + packet[1:]
+		self.assertEqual(discovery.parseEchoReply(reply), (0x1234, 7))
+		self.assertIsNone(discovery.parseEchoReply(packet))
+
+
+	def test_eui64_to_mac(self):
+		self.assertEqual(discovery.eui64ToMac('fe80::ba27:ebff:fe12:3456'), 'b8:27:eb:12:34:56')
+		self.assertIsNone(discovery.eui64ToMac('fe80::1'))
+
+
+	@patch('AliceCli.utils.discovery.neighborTable', return_value=[
+		discovery.Neighbor('192.168.1.20', 'b8:27:eb:12:34:56', 'eth0'),
+		discovery.Neighbor('fe80::abcd', 'dc:a6:32:00:00:01', 'eth0'),
+		discovery.Neighbor('192.168.1.21', 'dc:a6:32:00:00:01', 'eth0')
+	])
+	def test_map_to_usable_addresses(self, _):
+		result = discovery.mapToUsableAddresses({'fe80::ba27:ebff:fe12:3456': 'eth0', 'fe80::abcd': 'eth0', 'fe80::1': 'wlan0'})
+		self.assertEqual(result, ['192.168.1.20', '192.168.1.21', 'fe80::1%wlan0'])
+
+
+	@patch('AliceCli.utils.discovery.socket.gethostbyaddr', side_effect=_fakeLookup)
+	def test_resolve_hosts_streams(self, _):
+		def slowScan():
+			yield '10.0.0.1'
+			time.sleep(0.5)
+			yield '10.0.0.4'
+
+		start = time.monotonic()
+		results = discovery.resolveHosts(slowScan(), timeout=0.2)
+		self.assertEqual(next(results), ('10.0.0.1', 'host-10.0.0.1'))
+		self.assertLess(time.monotonic() - start, 0.4)
+		self.assertEqual(list(results), [('10.0.0.4', 'host-10.0.0.4')])
+
+
+	def test_resolve_hosts_abandoned(self):
+		looked = list()
+
+		def slowLookup(host: str):
+			looked.append(host)
+			time.sleep(0.1)
+			return f'host-{host}', list(), [host]
+
+		with patch('AliceCli.utils.discovery.socket.gethostbyaddr', side_effect=slowLookup):
+			results = discovery.resolveHosts([f'10.0.0.{index}' for index in range(1, 21)], workers=2, timeout=1)
+			next(results)
+			results.close()
+			time.sleep(0.5)
+		# The lookups queued behind the running ones never start
+		self.assertLessEqual(len(looked), 4)
+
+
+	def test_parse_networks(self):
+		self.assertEqual(discovery.parseNetworks(['192.168.1.0/24,192.168.1.128/25', '10.0.0.5/22']), ['10.0.0.0/22', '192.168.1.0/24'])
+		self.assertEqual(discovery.parseNetworks('172.16.0.0/16'), ['172.16.0.0/16'])
+		self.assertRaises(ValueError, discovery.parseNetworks, 'not a network')
+
+
+	def test_in_networks(self):
+		self.assertTrue(discovery.inNetworks('192.168.1.20', ['10.0.0.0/8', '192.168.1.0/24']))
+		self.assertFalse(discovery.inNetworks('192.168.2.20', '192.168.1.0/24'))
+		self.assertTrue(discovery.inNetworks('fe80::1%eth0', 'fe80::/64'))
+		self.assertFalse(discovery.inNetworks('fe80::1', '192.168.1.0/24'))
+		self.assertFalse(discovery.inNetworks('raspberrypi.local', '192.168.1.0/24'))
+
+
+	def test_shard_networks(self):
+		shards = discovery.shardNetworks(['10.0.0.0/22', '192.168.1.0/25'])
+		self.assertEqual(shards, ['10.0.0.0/24', '10.0.1.0/24', '10.0.2.0/24', '10.0.3.0/24', '192.168.1.0/25'])
+
+
+	def test_rate_limiter(self):
+		now = [0.0]
+		sleeps = list()
+		limiter = discovery.RateLimiter(100, burst=1, clock=lambda: now[0], sleep=sleeps.append)
+		for expected, delay in zip([0.0, 0.01, 0.02, 0.03, 0.04], [limiter.reserve() for _ in range(5)]):
+			self.assertAlmostEqual(delay, expected)
+
+		now[0] = 1.0
+		self.assertEqual(limiter.reserve(count=10), 0)
+		limiter.acquire()
+		self.assertEqual(len(sleeps), 1)
+		self.assertAlmostEqual(sleeps[0], 0.09)  # The ten slots were booked from 0.99, one burst before now
+
+
+	@patch('AliceCli.utils.discovery._pingHosts', side_effect=lambda hosts: [host for host in hosts if host.endswith('.20')])
+	def test_ping_scan_is_rate_limited(self, pingHosts):
+		limiter = MagicMock()
+		with ThreadPoolExecutor(max_workers=1) as pool:
+			self.assertEqual(list(discovery.streamNetwork('192.168.1.0/24', limiter=limiter, pool=pool, exclude=['192.168.1.1'])), ['192.168.1.20'])
+		self.assertEqual([batch.args for batch in limiter.acquire.call_args_list], [(32,)] * 7 + [(29,)])
+		self.assertNotIn('192.168.1.1', [host for batch in pingHosts.call_args_list for host in batch.args[0]])
+
+
+	def test_ping_hosts(self):
+		pinged = list()
+
+		async def ping(command, host):
+			pinged.append(host)
+			if host != '10.0.0.7':
+				networkscan.list_of_hosts_found.append(host)
+
+		with patch.object(networkscan, 'ping_coroutine', side_effect=ping):
+			self.assertEqual(sorted(discovery._pingHosts(['10.0.0.5', '10.0.0.7', '10.0.0.9'])), ['10.0.0.5', '10.0.0.9'])
+			self.assertEqual(discovery._pingHosts(['10.0.0.5']), ['10.0.0.5'])
+		self.assertEqual(sorted(pinged), ['10.0.0.5', '10.0.0.5', '10.0.0.7', '10.0.0.9'])
+
+
+	def test_ping_shards_run_in_parallel(self):
+		def ping(hosts):
+			time.sleep(0.2)
+			return [host for host in hosts if host.endswith('.20')]
+
+		# Every shard gets a process of its own, a thread pool stands in for it here
+		with patch('AliceCli.utils.discovery.ProcessPoolExecutor', ThreadPoolExecutor), patch('AliceCli.utils.discovery._pingHosts', side_effect=ping):
+			begin = time.monotonic()
+			found = sorted(discovery.streamNetworks(['192.168.1.0/27', '192.168.2.0/27', '192.168.3.0/27'], rate=0, workers=3))
+		self.assertEqual(found, ['192.168.1.20', '192.168.2.20', '192.168.3.20'])
+		self.assertLess(time.monotonic() - begin, 0.5)
+
+
+	@patch('AliceCli.utils.discovery._neighbors6', return_value=[discovery.Neighbor('fe80::1', 'dc:a6:32:00:00:01', 'eth1')])
+	@patch('AliceCli.utils.discovery._neighbors4', return_value=[
+		discovery.Neighbor('192.168.1.20', 'b8:27:eb:12:34:56', 'eth0'),
+		discovery.Neighbor('192.168.1.21', '00:11:22:33:44:55', 'eth0'),
+		discovery.Neighbor('10.0.0.20', 'dc:a6:32:00:00:01', 'eth1')
+	])
+	def test_neighbor_candidates(self, _, neighbors6):
+		self.assertEqual(discovery.neighborCandidates(), ['192.168.1.20', '10.0.0.20'])
+		self.assertEqual(discovery.neighborCandidates(['192.168.1.0/24']), ['192.168.1.20'])
+		# The fast path has no use for the IPv6 table, not even to record what it found
+		with tempfile.TemporaryDirectory() as directory, patch('AliceCli.utils.inventory.INVENTORY_FILE', Path(directory, 'inventory.json')):
+			inventory.recordDevices({'192.168.1.20': ''})
+			neighbors6.assert_not_called()
+			inventory.recordDevices({'fe80::1%eth1': ''})
+			neighbors6.assert_called_once()
+		self.assertTrue(discovery.isAliceDevice('printer', 'B8-27-EB-00-00-01'))
+		self.assertFalse(discovery.isAliceDevice('printer', ''))
+
+
+	@patch('AliceCli.utils.discovery.psutil.net_if_stats', return_value={
+		'eth0'   : SimpleNamespace(isup=True),
+		'wlan0'  : SimpleNamespace(isup=True),
+		'docker0': SimpleNamespace(isup=True),
+		'lo'     : SimpleNamespace(isup=True),
+		'eth1'   : SimpleNamespace(isup=False)
+	})
+	@patch('AliceCli.utils.discovery.psutil.net_if_addrs', return_value={
+		'eth0'   : [SimpleNamespace(family=socket.AF_INET, address='192.168.1.10', netmask='255.255.255.0')],
+		'wlan0'  : [SimpleNamespace(family=socket.AF_INET, address='10.20.30.40', netmask='255.255.0.0')],
+		'docker0': [SimpleNamespace(family=socket.AF_INET, address='172.17.0.1', netmask='255.255.0.0')],
+		'lo'     : [SimpleNamespace(family=socket.AF_INET, address='127.0.0.1', netmask='255.0.0.0')],
+		'eth1'   : [SimpleNamespace(family=socket.AF_INET, address='192.168.2.10', netmask='255.255.255.0')]
+	})
+	def test_local_networks(self, *_):
+		networks = discovery.localNetworks()
+		self.assertEqual(networks, {'192.168.1.0/24': 'eth0', '10.20.28.0/22': 'wlan0'})
+		self.assertEqual(discovery.interfaceFor('10.20.31.2', networks), 'wlan0')
+		self.assertEqual(discovery.interfaceFor('fe80::1%eth0', networks), 'eth0')
+		self.assertEqual(discovery.interfaceFor('8.8.8.8', networks), '')
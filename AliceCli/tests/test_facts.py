@@ -0,0 +1,76 @@
+#  Copyright (c) 2021
+#
+#  This file, test_facts.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import platform
+import socket
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+import paramiko
+
+from AliceCli.tests.test_ssh import _serve
+from AliceCli.utils import facts, ssh
+
+
+class Test_Facts(TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directory.cleanup)
+		patcher = patch('AliceCli.utils.facts.FACTS_FILE', Path(self.directory.name, 'facts.json'))
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+		key = paramiko.RSAKey.generate(1024)
+		self.client = paramiko.SSHClient()
+		self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy)
+		self.client.connect('127.0.0.1', port=_serve(key, self.directory.name), username='pi', pkey=key, look_for_keys=False, allow_agent=False)
+		self.addCleanup(self.client.close)
+
+
+	def test_gather(self):
+		found = facts.gather(self.client)
+		self.assertEqual(found['kernel'], platform.release())
+		self.assertEqual(found['hostname'], socket.gethostname())
+		self.assertIsInstance(found['aliceInstalled'], bool)
+		self.assertGreater(found['diskTotal'], 0)
+		self.assertIn('soundDriver', found)
+
+
+	def test_probe(self):
+		self.assertEqual(facts.probe(self.client, 'kernel'), platform.release())
+		self.assertIsInstance(facts.probe(self.client, 'aliceInstalled'), bool)
+		self.assertEqual(set(facts.gather(self.client)), set(facts.PROBES))
+
+
+	def test_cache_and_invalidate(self):
+		execute = ssh.execute
+		with patch('AliceCli.utils.ssh.execute', side_effect=execute) as probe:
+			first = facts.deviceFacts('192.168.1.20', self.client)
+			self.assertEqual(facts.deviceFacts('192.168.1.20', self.client), first)
+			self.assertEqual(probe.call_count, 1)
+
+			facts.deviceFacts('192.168.1.20', self.client, ttl=0)
+			self.assertEqual(probe.call_count, 2)
+
+			facts.invalidate('192.168.1.20')
+			self.assertEqual(facts.deviceFacts('192.168.1.20'), dict())
+			facts.deviceFacts('192.168.1.20', self.client)
+			self.assertEqual(probe.call_count, 3)
+			self.assertGreater(facts.gatheredAt('192.168.1.20'), 0)
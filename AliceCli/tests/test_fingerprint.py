@@ -0,0 +1,89 @@
+#  Copyright (c) 2021
+#
+#  This file, test_fingerprint.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import asyncio
+import socket
+import threading
+import time
+from unittest import TestCase
+
+from AliceCli.utils import fingerprint
+
+
+class Test_Fingerprint(TestCase):
+
+	def test_classify(self):
+		self.assertEqual(fingerprint.classify({'banner': 'SSH-2.0-OpenSSH_8.4p1 Raspbian-5+deb11u1', 'aliceInterface': True}), fingerprint.KIND_ALICE)
+		self.assertEqual(fingerprint.classify({'banner': '', 'mac': 'dc:a6:32:01:02:03'}), fingerprint.KIND_RASPBERRY)
+		self.assertEqual(fingerprint.classify({'banner': 'SSH-2.0-OpenSSH_9.6'}), fingerprint.KIND_SSH)
+		self.assertEqual(fingerprint.classify({'aliceInterface': True}), fingerprint.KIND_UNKNOWN)
+
+
+	def test_classify_other_web_servers(self):
+		# A Mac, its AirPlay receiver on port 5000, is no Alice
+		self.assertEqual(fingerprint.classify({'banner': 'SSH-2.0-OpenSSH_9.0', 'mac': 'a4:83:e7:01:02:03', 'aliceInterface': False}), fingerprint.KIND_SSH)
+		# Signals cached before the web interface got checked only held whether the port was open
+		self.assertEqual(fingerprint.classify({'banner': 'SSH-2.0-OpenSSH_9.0', 'webInterface': True}), fingerprint.KIND_SSH)
+
+
+	def test_is_alice_interface(self):
+		pages = {
+			b'HTTP/1.0 200 OK\r\nContent-Type: text/html\r\n\r\n<html><head><title>Project Alice</title></head></html>': True,
+			b'HTTP/1.1 403 Forbidden\r\nServer: AirTunes/620.8.2\r\n\r\n': False,
+			b'HTTP/1.0 200 OK\r\nServer: Werkzeug/2.0.1\r\n\r\n<html><title>My Flask app</title></html>': False
+		}
+		for page, expected in pages.items():
+			with socket.socket() as server:
+				server.bind(('127.0.0.1', 0))
+				server.listen()
+
+				def answer():
+					connection, _ = server.accept()
+					with connection:
+						connection.recv(1024)
+						connection.sendall(page)
+
+				threading.Thread(target=answer, daemon=True).start()
+				self.assertEqual(asyncio.run(fingerprint.isAliceInterface('127.0.0.1', server.getsockname()[1], timeout=1)), expected)
+
+
+	def test_is_candidate(self):
+		self.assertTrue(fingerprint.isCandidate('renamed', {'kind': fingerprint.KIND_ALICE}))
+		self.assertTrue(fingerprint.isCandidate('projectalice.home'))
+		self.assertFalse(fingerprint.isCandidate('nas', {'kind': fingerprint.KIND_SSH}))
+
+
+	def test_cached_signals(self):
+		signals = {'mac': 'b8:27:eb:00:00:01', 'probed': time.time()}
+		self.assertEqual(fingerprint.cachedSignals({'signals': signals}, 'b8:27:eb:00:00:01'), signals)
+		self.assertIsNone(fingerprint.cachedSignals({'signals': signals}, 'b8:27:eb:00:00:02'))
+		self.assertIsNone(fingerprint.cachedSignals({'signals': {'probed': 0}}))
+
+
+	def test_read_banner(self):
+		with socket.socket() as server:
+			server.bind(('127.0.0.1', 0))
+			server.listen()
+
+			def answer():
+				connection, _ = server.accept()
+				with connection:
+					connection.sendall(b'SSH-2.0-OpenSSH_8.4p1 Raspbian-5\r\n')
+
+			threading.Thread(target=answer, daemon=True).start()
+			banner = asyncio.run(fingerprint.readBanner('127.0.0.1', server.getsockname()[1], timeout=1))
+			self.assertEqual(banner, 'SSH-2.0-OpenSSH_8.4p1 Raspbian-5')
@@ -19,10 +19,49 @@
 #  Last modified by: Psycho
 
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from AliceCli.install import install
+from AliceCli.utils import commons, facts, ssh
+
+
+class _Stop(Exception):
+	pass
 
 
 class Test_Install(TestCase):
 
+	def _install(self, probed):
+		with patch.object(commons, 'deviceFacts', side_effect=ssh.CommandTimeout('Timed out after 30s')), \
+				patch.object(facts, 'probe', side_effect=probed) as probe, \
+				patch.object(commons, 'sshScript') as script, \
+				patch.object(commons, 'printError') as printError, \
+				patch.object(commons, 'printSuccess'), \
+				patch.object(commons, 'waitAnimation'), \
+				patch.object(commons, 'stopAnimation'), \
+				patch.object(commons, 'forgetFacts'), \
+				patch.object(commons, 'returnToMainMenu'), \
+				patch.object(install.inquirer, 'select', side_effect=_Stop):
+			try:
+				install.install(MagicMock(), force=True, name='Alice')
+			except _Stop:
+				pass  # Past the existing install check, the release type question comes next
+		return probe, script, printError
+
+
+	def test_install_probes_alone_after_timeout(self):
+		probe, script, printError = self._install([True])
+		self.assertEqual(probe.call_args[0][1], 'aliceInstalled')
+		script.assert_called_once()
+		printError.assert_not_called()
+
+
+	def test_install_reports_unreachable_device(self):
+		_, script, printError = self._install(ssh.CommandTimeout('Timed out after 30s'))
+		script.assert_not_called()
+		printError.assert_called_once()
+
+
 	def test_install_sound_device(self):
 		pass  # Nothing to test
 
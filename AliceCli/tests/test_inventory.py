@@ -0,0 +1,78 @@
+#  Copyright (c) 2021
+#
+#  This file, test_inventory.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+from AliceCli.utils import inventory
+
+
+class Test_Inventory(TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		patcher = patch('AliceCli.utils.inventory.INVENTORY_FILE', Path(self.directory.name, 'inventory.json'))
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.addCleanup(self.directory.cleanup)
+
+
+	@patch('AliceCli.utils.inventory._macs', return_value={'192.168.1.20': 'b8:27:eb:12:34:56'})
+	def test_record_devices(self, _):
+		inventory.recordDevices({'192.168.1.20': 'projectalice.home', '192.168.1.21': 'printer'})
+		devices = inventory.loadInventory()
+		self.assertEqual(devices['192.168.1.20']['name'], 'projectalice.home')
+		self.assertEqual(devices['192.168.1.20']['fingerprint'], 'b8:27:eb:12:34:56')
+		self.assertEqual(devices['192.168.1.21']['fingerprint'], '')
+		self.assertEqual(inventory.staleDevices(devices), [])
+		self.assertEqual(sorted(inventory.staleDevices(devices, ttl=0)), ['192.168.1.20', '192.168.1.21'])
+
+		inventory.forgetDevices(['192.168.1.21'])
+		self.assertEqual(list(inventory.loadInventory()), ['192.168.1.20'])
+
+
+	@patch('AliceCli.utils.inventory._macs', return_value=dict())
+	def test_expired_devices_are_dropped(self, _):
+		with patch('AliceCli.utils.inventory.time.time', return_value=time.time() - inventory.INVENTORY_EXPIRY - 1):
+			inventory.recordDevices({'192.168.1.20': 'projectalice'})
+		self.assertEqual(inventory.loadInventory(), dict())
+
+
+	@patch('AliceCli.utils.inventory._macs', return_value={'192.168.1.20': 'b8:27:eb:12:34:56', 'fe80::ba27:ebff:fe12:3456%eth0': 'b8:27:eb:12:34:56'})
+	@patch('AliceCli.utils.discovery.localNetworks', return_value={'192.168.1.0/24': 'eth0', '192.168.2.0/24': 'wlan0'})
+	def test_addresses_of(self, *_):
+		inventory.recordDevices({'192.168.1.20': 'projectalice', 'fe80::ba27:ebff:fe12:3456%eth0': '', '192.168.1.30': 'printer'})
+		# Its docker bridge and VPN addresses are nowhere to be seen from here
+		inventory.rememberAddresses('192.168.1.20', ['192.168.1.20', '192.168.2.20', '2001:db8::20', '172.17.0.1', '10.8.0.3'])
+		self.assertEqual(inventory.addressesOf('192.168.1.20'), ['192.168.1.20', '192.168.2.20', 'fe80::ba27:ebff:fe12:3456%eth0'])
+		self.assertEqual(inventory.addressesOf('192.168.1.30'), ['192.168.1.30'])
+
+		inventory.recordConnectTime('fe80::ba27:ebff:fe12:3456%eth0', 0.2)
+		inventory.recordConnectTime('192.168.1.20', 0.5)
+		self.assertEqual(inventory.addressesOf('192.168.1.20')[:2], ['fe80::ba27:ebff:fe12:3456%eth0', '192.168.1.20'])
+
+		inventory.recordConnectTime('192.168.1.20', 0.0)
+		self.assertAlmostEqual(inventory.loadInventory()['192.168.1.20']['connectTime'], 0.35)
+
+
+	def test_host_key(self):
+		self.assertEqual(inventory.hostKeyOf('192.168.1.20'), '')
+		inventory.recordHostKey('192.168.1.20', 'ssh-ed25519 AAAAC3NzaC1lZDI1NTE5')
+		self.assertEqual(inventory.hostKeyOf('192.168.1.20'), 'ssh-ed25519 AAAAC3NzaC1lZDI1NTE5')
@@ -0,0 +1,446 @@
+#  Copyright (c) 2021
+#
+#  This file, test_ssh.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+import paramiko
+
+from AliceCli.utils import configs, ssh
+
+
+class _Server(paramiko.ServerInterface):
+
+	def __init__(self, authorizedKey: paramiko.PKey, root: str):
+		self.authorizedKey = authorizedKey
+		self.root = root
+
+
+	def get_allowed_auths(self, username: str) -> str:
+		return 'publickey,password'
+
+
+	def check_auth_publickey(self, username: str, key: paramiko.PKey) -> int:
+		return paramiko.AUTH_SUCCESSFUL if key == self.authorizedKey else paramiko.AUTH_FAILED
+
+
+	def check_channel_request(self, kind: str, chanid: int) -> int:
+		return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+	def check_channel_exec_request(self, channel: paramiko.Channel, command: bytes) -> bool:
+		threading.Thread(target=_execute, args=(channel, command.decode(), self.root), daemon=True).start()
+		return True
+
+
+class _SftpHandle(paramiko.SFTPHandle):
+
+	def stat(self):
+		return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+	def chattr(self, attr: paramiko.SFTPAttributes) -> int:
+		if attr.st_size is not None:
+			os.ftruncate(self.readfile.fileno(), attr.st_size)
+		return paramiko.SFTP_OK
+
+
+class _SftpServer(paramiko.SFTPServerInterface):
+	"""
+	Serves the files under the root of the test server, relative paths being relative to it like to a home directory
+	"""
+
+	def __init__(self, server: _Server, *args, **kwargs):
+		super().__init__(server, *args, **kwargs)
+		self.root = server.root
+
+
+	def _path(self, path: str) -> str:
+		return os.path.join(self.root, path)
+
+
+	def open(self, path: str, flags: int, attr: paramiko.SFTPAttributes):
+		try:
+			descriptor = os.open(self._path(path), flags, 0o644)
+		except OSError as e:
+			return paramiko.SFTPServer.convert_errno(e.errno)
+
+		if flags & os.O_WRONLY:
+			mode = 'wb'
+		elif flags & os.O_RDWR:
+			mode = 'r+b'
+		else:
+			mode = 'rb'
+
+		handle = _SftpHandle(flags)
+		handle.readfile = handle.writefile = os.fdopen(descriptor, mode)
+		return handle
+
+
+	def stat(self, path: str):
+		try:
+			return paramiko.SFTPAttributes.from_stat(os.stat(self._path(path)))
+		except OSError as e:
+			return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+	lstat = stat
+
+
+	def list_folder(self, path: str):
+		try:
+			return [paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(self._path(path), name)), filename=name) for name in os.listdir(self._path(path))]
+		except OSError as e:
+			return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+	def chattr(self, path: str, attr: paramiko.SFTPAttributes) -> int:
+		return self._call(os.truncate, path, attr.st_size) if attr.st_size is not None else paramiko.SFTP_OK
+
+
+	def remove(self, path: str) -> int:
+		return self._call(os.remove, path)
+
+
+	def rename(self, oldpath: str, newpath: str) -> int:
+		return self._call(os.rename, oldpath, self._path(newpath))
+
+
+	def posix_rename(self, oldpath: str, newpath: str) -> int:
+		return self._call(os.replace, oldpath, self._path(newpath))
+
+
+	def mkdir(self, path: str, attr: paramiko.SFTPAttributes) -> int:
+		return self._call(os.mkdir, path)
+
+
+	def rmdir(self, path: str) -> int:
+		return self._call(os.rmdir, path)
+
+
+	def _call(self, function, path: str, *args) -> int:
+		try:
+			function(self._path(path), *args)
+			return paramiko.SFTP_OK
+		except OSError as e:
+			return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+def _execute(channel: paramiko.Channel, command: str, root: str):
+	process = subprocess.Popen(command, shell=True, cwd=root, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+	def pipe(output, send):
+		try:
+			while data := output.read1(4096):
+				send(data)
+		except OSError:
+			process.kill()  # The client closed the channel, sshd would stop the command too
+
+	def feed():
+		try:
+			while data := channel.recv(32768):
+				process.stdin.write(data)
+				process.stdin.flush()
+			process.stdin.close()
+		except (OSError, ValueError):
+			pass  # The command finished without reading all of it
+
+	threading.Thread(target=feed, daemon=True).start()
+
+	errors = threading.Thread(target=pipe, args=(process.stderr, channel.sendall_stderr), daemon=True)
+	errors.start()
+	pipe(process.stdout, channel.sendall)
+	errors.join()
+	status = process.wait()
+	if not channel.closed:
+		channel.send_exit_status(status if status >= 0 else 128 - status)
+	channel.close()
+
+
+def _serve(authorizedKey: paramiko.PKey, root: Optional[str] = None) -> int:
+	listener = socket.socket()
+	listener.bind(('127.0.0.1', 0))
+	listener.listen()
+	hostKey = paramiko.Ed25519Key.from_private_key_file(_hostKeyFile())
+
+	def negotiate(connection: socket.socket):
+		transport = paramiko.Transport(connection)
+		transport.add_server_key(hostKey)
+		transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _SftpServer)
+		try:
+			transport.start_server(server=_Server(authorizedKey, root or os.getcwd()))
+		except (paramiko.SSHException, EOFError):
+			transport.close()  # Port probes connect and leave without a word
+
+	def accept():
+		with listener:
+			while True:
+				try:
+					connection, _ = listener.accept()
+				except OSError:
+					return
+				threading.Thread(target=negotiate, args=(connection,), daemon=True).start()
+
+	threading.Thread(target=accept, daemon=True).start()
+	return listener.getsockname()[1]
+
+
+def _hostKeyFile() -> str:
+	return str(Path(__file__).parent / 'data' / 'host_ed25519')
+
+
+class Test_Ssh(TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		for name, value in (('CONFIG_FILE', Path(self.directory.name, 'configs.json')), ('SSH_DIR', Path(self.directory.name))):
+			patcher = patch(f'AliceCli.utils.configs.{name}', value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		self.addCleanup(self.directory.cleanup)
+
+
+	def test_load_private_key(self):
+		keyFile = Path(self.directory.name, 'id_rsa_test')
+		paramiko.RSAKey.generate(1024).write_private_key_file(str(keyFile))
+		self.assertIsInstance(ssh.loadPrivateKey(keyFile), paramiko.RSAKey)
+		self.assertIsInstance(ssh.loadPrivateKey(Path(_hostKeyFile())), paramiko.Ed25519Key)
+
+
+	def test_check_authentication(self):
+		key = paramiko.RSAKey.generate(1024)
+		key.write_private_key_file(str(Path(self.directory.name, 'id_rsa_127.0.0.1')))
+		port = _serve(key)
+
+		self.assertEqual(ssh.checkAuthentication('127.0.0.1', port, timeout=5), ssh.AUTH_PASSWORD)
+
+		confs = configs.loadConfigs()
+		confs['servers']['127.0.0.1'] = {'keyFile': 'id_rsa_127.0.0.1', 'user': 'pi'}
+		configs.saveConfigs(confs)
+		self.assertEqual(ssh.authenticationStatuses(['127.0.0.1'], port, timeout=5), {'127.0.0.1': ssh.AUTH_READY})
+
+
+	def test_check_authentication_refused(self):
+		with socket.socket() as closed:
+			closed.bind(('127.0.0.1', 0))
+			port = closed.getsockname()[1]
+		self.assertEqual(ssh.checkAuthentication('127.0.0.1', port, timeout=1), ssh.AUTH_REFUSED)
+
+
+	def test_wait_for_port(self):
+		with socket.socket() as server:
+			server.bind(('127.0.0.1', 0))
+			port = server.getsockname()[1]
+			self.assertFalse(ssh.waitForPort('127.0.0.1', port, timeout=0.3, interval=0.1))
+
+			threading.Timer(0.3, server.listen).start()
+			self.assertTrue(ssh.waitForPort('127.0.0.1', port, timeout=5, interval=0.1))
+
+
+class Test_Channels(TestCase):
+
+	def setUp(self):
+		self.key = paramiko.RSAKey.generate(1024)
+		self.client = paramiko.SSHClient()
+		self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy)
+		self.client.connect('127.0.0.1', port=_serve(self.key), username='pi', pkey=self.key, look_for_keys=False, allow_agent=False)
+		self.addCleanup(self.client.close)
+
+
+	def test_execute(self):
+		with ssh.execute(self.client, 'echo out; echo err >&2; exit 3') as remote:
+			self.assertEqual(remote.stdout.read(), b'out\n')
+			self.assertEqual(remote.stderr.read(), b'err\n')
+			self.assertEqual(remote.wait(timeout=5), 3)
+			self.assertTrue(remote.done)
+
+
+	def test_profile_window(self):
+		ssh.applyProfile(self.client, {'window': 262144, 'packet': 16384})
+		with ssh.execute(self.client, 'true') as remote:
+			self.assertEqual(remote.channel.in_window_size, 262144)
+			self.assertEqual(remote.channel.in_max_packet_size, 16384)
+
+
+	def test_lines(self):
+		with ssh.execute(self.client, 'seq 1 100000; echo oops >&2; printf tail; exit 2') as remote:
+			lines = list(remote.lines(chunkSize=1000))
+			self.assertEqual(remote.wait(timeout=5), 2)
+
+		stdout = [line for stream, line in lines if stream == ssh.STDOUT]
+		self.assertEqual(len(stdout), 100001)
+		self.assertEqual(stdout[0], '1\n')
+		self.assertEqual(stdout[-2:], ['100000\n', 'tail'])
+		self.assertIn((ssh.STDERR, 'oops\n'), lines)
+
+
+	def test_timeouts(self):
+		started = time.monotonic()
+		with ssh.execute(self.client, 'echo started; sleep 5', idleTimeout=0.5) as remote:
+			with self.assertRaisesRegex(ssh.CommandTimeout, 'No output'):
+				for _ in remote.lines():
+					pass
+
+		with ssh.execute(self.client, 'for i in $(seq 50); do echo tick; sleep 0.1; done', timeout=0.5, idleTimeout=2) as remote:
+			with self.assertRaisesRegex(ssh.CommandTimeout, 'Deadline'):
+				for _ in remote.lines():
+					pass
+
+		with ssh.execute(self.client, 'sleep 5', timeout=0.3) as remote:
+			with self.assertRaises(ssh.CommandTimeout):
+				remote.wait()
+		self.assertLess(time.monotonic() - started, 4)
+
+		with ssh.execute(self.client, 'exit 0', timeout=5) as remote:
+			self.assertEqual(remote.wait(), 0)
+
+
+	def test_race_connect(self):
+		port = self.client.get_transport().getpeername()[1]
+		address, sock, elapsed = ssh.raceConnect(['127.0.0.2', '127.0.0.1'], port)
+		sock.close()
+		self.assertEqual(address, '127.0.0.1')
+		self.assertGreaterEqual(elapsed, 0)
+		self.assertRaises(OSError, ssh.raceConnect, ['127.0.0.2', '127.0.0.3'], port)
+
+
+	def test_connect_device(self):
+		port = self.client.get_transport().getpeername()[1]
+		stranger = f'ssh-rsa {paramiko.RSAKey.generate(1024).get_base64()}'
+
+		def race(addresses, port, timeout):
+			# The other address of the device answers first
+			return '127.0.0.2', socket.create_connection(('127.0.0.1', port)), 0.01
+
+		for hostKey, expected in ((ssh.serverKey(self.client), '127.0.0.2'), (stranger, '127.0.0.1'), ('', '127.0.0.1')):
+			client = paramiko.SSHClient()
+			client.set_missing_host_key_policy(paramiko.AutoAddPolicy)
+			with patch('AliceCli.utils.ssh.raceConnect', side_effect=race) as raced:
+				path, elapsed = ssh.connectDevice(client, '127.0.0.1', port, ['127.0.0.1', '127.0.0.2'], hostKey, username='pi', pkey=self.key, look_for_keys=False, allow_agent=False)
+			self.assertEqual(path, expected)
+			self.assertEqual(raced.called, bool(hostKey))
+			self.assertEqual(elapsed is None, path == '127.0.0.1')
+			self.assertTrue(ssh.isAlive(client))
+			client.close()
+
+
+	def test_run_script_timeout(self):
+		steps = [ssh.Step('echo one'), ssh.Step('sleep 5'), ssh.Step('echo three')]
+		results = ssh.runScript(self.client, steps, timeout=1)
+		self.assertEqual([result.exitStatus for result in results], [0, ssh.TIMEOUT_STATUS, None])
+		self.assertEqual(ssh.runConcurrently(self.client, ['exit 1', 'sleep 5'], idleTimeout=0.5), [1, ssh.TIMEOUT_STATUS])
+
+
+	def test_run_script(self):
+		steps = [
+			ssh.Step('cd /tmp && pwd', 'First'),
+			ssh.Step('pwd; printf partial; exit 4'),
+			ssh.Step('echo never', stopOnError=False),
+			ssh.Step('false', stopOnError=True),
+			ssh.Step('echo skipped')
+		]
+		lines, started = list(), list()
+		results = ssh.runScript(self.client, steps, onStart=lambda index, _: started.append(index), onLine=lambda *line: lines.append(line))
+
+		self.assertEqual(started, [0, 1, 2, 3])
+		self.assertEqual([result.exitStatus for result in results], [0, 4, 0, 1, None])
+		self.assertIn((0, ssh.STDOUT, '/tmp\n'), lines)
+		self.assertIn((1, ssh.STDOUT, 'partial'), lines)
+		self.assertNotIn((1, ssh.STDOUT, '/tmp\n'), lines)
+		self.assertIn((2, ssh.STDOUT, 'never\n'), lines)
+		self.assertNotIn('skipped\n', [line for *_, line in lines])
+
+
+	def test_run_script_output_looking_like_markers(self):
+		steps = [
+			ssh.Step(f'echo {ssh.STEP_MARKER} end 0 0; echo {ssh.STEP_MARKER} start x; exit 3'),
+			ssh.Step('(sleep 0.3; echo late >&2) &')
+		]
+		lines = list()
+		results = ssh.runScript(self.client, steps, onLine=lambda *line: lines.append(line))
+
+		self.assertEqual([result.exitStatus for result in results], [3, 0])
+		self.assertIn((0, ssh.STDOUT, f'{ssh.STEP_MARKER} end 0 0\n'), lines)
+		self.assertIn((0, ssh.STDOUT, f'{ssh.STEP_MARKER} start x\n'), lines)
+		# Written after the step ended, still its output
+		self.assertIn((1, ssh.STDERR, 'late\n'), lines)
+
+
+	def test_boot_id(self):
+		self.assertEqual(ssh.bootId(self.client), Path(ssh.BOOT_ID_FILE).read_text().strip())
+		with tempfile.TemporaryDirectory() as directory:
+			Path(directory, 'empty').touch()
+			for unreadable in ('empty', 'missing'):
+				with patch('AliceCli.utils.ssh.BOOT_ID_FILE', str(Path(directory, unreadable))):
+					self.assertIsNone(ssh.bootId(self.client))
+
+
+	def test_run_concurrently(self):
+		lines = list()
+		start = time.monotonic()
+		statuses = ssh.runConcurrently(self.client, ['sleep 0.5; echo first', 'sleep 0.5; echo second >&2; false'], lambda *line: lines.append(line))
+
+		self.assertLess(time.monotonic() - start, 1)
+		self.assertEqual(statuses, [0, 1])
+		self.assertEqual(sorted(lines), [(0, ssh.STDOUT, 'first\n'), (1, ssh.STDERR, 'second\n')])
+
+
+class Test_SessionPool(TestCase):
+
+	@staticmethod
+	def _client(alive: bool = True) -> MagicMock:
+		client = MagicMock()
+		client.get_transport.return_value.is_active.return_value = alive
+		return client
+
+
+	def test_session_pool(self):
+		pool = ssh.SessionPool(limit=2)
+		first, second, third = self._client(), self._client(), self._client()
+
+		pool.add('192.168.1.1', first)
+		pool.add('192.168.1.2', second, activate=False)
+		self.assertEqual(pool.current, '192.168.1.1')
+		self.assertIs(pool.session(), first)
+		self.assertIs(pool.session('192.168.1.2'), second)
+
+		# The current device is never evicted, even if it is the least recently used one
+		pool.add('192.168.1.3', third, activate=False)
+		second.close.assert_called_once()
+		self.assertEqual(sorted(pool.addresses()), ['192.168.1.1', '192.168.1.3'])
+
+		self.assertTrue(pool.activate('192.168.1.3'))
+		self.assertFalse(pool.activate('192.168.1.2'))
+		self.assertTrue(pool.close())
+		self.assertEqual(pool.current, '')
+		third.close.assert_called_once()
+
+
+	def test_dead_sessions_are_dropped(self):
+		pool = ssh.SessionPool()
+		pool.add('192.168.1.1', self._client(alive=False))
+		self.assertIsNone(pool.session())
+		self.assertNotIn('192.168.1.1', pool)
+		self.assertEqual(len(pool), 0)
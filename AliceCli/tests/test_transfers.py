@@ -0,0 +1,122 @@
+#  Copyright (c) 2021
+#
+#  This file, test_transfers.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+import paramiko
+from click.testing import CliRunner
+
+from AliceCli.tests.test_ssh import _serve
+from AliceCli.transfer import transfer
+from AliceCli.utils import commons, ssh, transfers
+
+
+@patch('AliceCli.utils.transfers.CHUNK_SIZE', 65536)
+class Test_Transfers(TestCase):
+
+	def setUp(self):
+		self.local = tempfile.TemporaryDirectory()
+		self.remote = tempfile.TemporaryDirectory()
+		self.addCleanup(self.local.cleanup)
+		self.addCleanup(self.remote.cleanup)
+
+		patcher = patch('AliceCli.utils.transfers.JOURNAL_DIR', Path(self.local.name, 'journal'))
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+		key = paramiko.RSAKey.generate(1024)
+		self.client = paramiko.SSHClient()
+		self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy)
+		self.client.connect('127.0.0.1', port=_serve(key, self.remote.name), username='pi', pkey=key, look_for_keys=False, allow_agent=False)
+		self.addCleanup(self.client.close)
+
+		self.data = os.urandom(300000)
+		self.source = Path(self.local.name, 'skill.tar.gz')
+		self.source.write_bytes(self.data)
+
+
+	def test_upload(self):
+		progress = list()
+		self.assertEqual(transfers.upload(self.client, self.source, '~/', workers=3, onProgress=progress.append), 'skill.tar.gz')
+
+		self.assertEqual(Path(self.remote.name, 'skill.tar.gz').read_bytes(), self.data)
+		self.assertFalse(Path(self.remote.name, 'skill.tar.gz.part').exists())
+		self.assertEqual(sum(progress), len(self.data))
+		self.assertEqual(list(transfers.JOURNAL_DIR.glob('*.json')), [])
+
+
+	def test_upload_resumes(self):
+		# Chunk 1 made it last time, chunk 2 did too but got corrupted since: only chunk 2 being skipped shows
+		part = Path(self.remote.name, 'skill.tar.gz.part')
+		part.write_bytes(self.data[:131072] + b'\0' * (len(self.data) - 131072))
+		journal = transfers._Journal('upload', transfers._peer(self.client), self.source.resolve(), self.source.stat().st_mtime_ns, len(self.data), 'skill.tar.gz')
+		journal.complete(1)
+		journal.complete(2)
+
+		with self.assertRaises(transfers.TransferError):
+			transfers.upload(self.client, self.source, 'skill.tar.gz')
+
+		journal.done.discard(2)
+		journal.complete(1)
+		progress = list()
+		transfers.upload(self.client, self.source, 'skill.tar.gz', onProgress=progress.append)
+		self.assertEqual(progress[0], 65536)
+		self.assertEqual(Path(self.remote.name, 'skill.tar.gz').read_bytes(), self.data)
+
+
+	def test_download(self):
+		Path(self.remote.name, 'backup.tar').write_bytes(self.data)
+		destination = transfers.download(self.client, '~/backup.tar', Path(self.local.name), workers=2)
+
+		self.assertEqual(destination, Path(self.local.name, 'backup.tar'))
+		self.assertEqual(destination.read_bytes(), self.data)
+		self.assertFalse(Path(self.local.name, 'backup.tar.part').exists())
+		self.assertEqual(transfers.remoteHash(self.client, 'backup.tar'), transfers.localHash(destination))
+
+
+	@patch('AliceCli.utils.commons.printError')
+	@patch('AliceCli.utils.commons.printSuccess')
+	def test_upload_to_more_devices_than_the_pool_holds(self, printSuccess, printError):
+		key = paramiko.RSAKey.generate(1024)
+		roots = dict()
+		clients = dict()
+		for index in range(ssh.SESSION_LIMIT + 2):
+			address = f'192.168.1.{20 + index}'
+			roots[address] = tempfile.TemporaryDirectory()
+			self.addCleanup(roots[address].cleanup)
+			clients[address] = paramiko.SSHClient()
+			clients[address].set_missing_host_key_policy(paramiko.AutoAddPolicy)
+			clients[address].connect('127.0.0.1', port=_serve(key, roots[address].name), username='pi', pkey=key, look_for_keys=False, allow_agent=False)
+
+		with patch('AliceCli.utils.ssh.openSession', side_effect=lambda address, **_: clients[address]), \
+				patch('AliceCli.utils.inventory.addressesOf', side_effect=lambda address: [address]):
+			arguments = ['-s', str(self.source), '-w', '2']
+			for address in clients:
+				arguments.extend(['-i', address])
+			result = CliRunner().invoke(transfer.upload, arguments)
+
+		self.assertEqual(result.exit_code, 0, result.output)
+		printError.assert_not_called()
+		self.assertEqual(printSuccess.call_count, len(clients))
+		for address, root in roots.items():
+			self.assertEqual(Path(root.name, 'skill.tar.gz').read_bytes(), self.data)
+			self.assertNotIn(address, commons.SESSIONS)
+			self.assertFalse(ssh.isAlive(clients[address]))
@@ -0,0 +1,74 @@
+#  Copyright (c) 2021
+#
+#  This file, test_tuning.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+import paramiko
+
+from AliceCli.tests.test_ssh import _serve
+from AliceCli.utils import configs, ssh, tuning
+
+
+class Test_Tuning(TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		for name, value in (('CONFIG_FILE', Path(self.directory.name, 'configs.json')), ('SSH_DIR', Path(self.directory.name))):
+			patcher = patch(f'AliceCli.utils.configs.{name}', value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		self.addCleanup(self.directory.cleanup)
+
+		key = paramiko.RSAKey.generate(1024)
+		key.write_private_key_file(str(Path(self.directory.name, 'id_rsa_127.0.0.1')))
+		self.port = _serve(key)
+		confs = configs.loadConfigs()
+		confs['servers']['127.0.0.1'] = {'keyFile': 'id_rsa_127.0.0.1', 'user': 'pi'}
+		configs.saveConfigs(confs)
+
+
+	def test_profile_options(self):
+		self.assertEqual(ssh.profileOptions(None), dict())
+		options = ssh.profileOptions({'cipher': 'aes256-ctr', 'compress': True})
+		self.assertTrue(options['compress'])
+		self.assertNotIn('aes256-ctr', options['disabled_algorithms']['ciphers'])
+		self.assertIn('aes128-ctr', options['disabled_algorithms']['ciphers'])
+
+
+	@patch('AliceCli.utils.tuning.CANDIDATE_WINDOWS', [256 * 1024])
+	@patch('AliceCli.utils.tuning.CANDIDATE_PACKETS', [])
+	def test_tune(self):
+		results = list()
+		best = tuning.tune('127.0.0.1', self.port, onBenchmark=results.append, command='head -c 65536 /dev/zero')
+
+		self.assertGreaterEqual(len(results), 3)
+		self.assertEqual(best.received, 65536)
+		self.assertEqual(best.score, min(result.score for result in results))
+
+		tuning.saveProfile('127.0.0.1', best)
+		profile = configs.serverConfig('127.0.0.1')['profile']
+		self.assertEqual(profile['cipher'], best.profile['cipher'])
+
+		client = ssh.openSession('127.0.0.1', self.port)
+		try:
+			self.assertEqual(client.get_transport().remote_cipher, profile['cipher'])
+			self.assertEqual(client.get_transport().default_window_size, profile['window'])
+		finally:
+			client.close()
@@ -18,7 +18,15 @@
 #  Last modified: 2021.03.07 at 13:17:35 CET
 #  Last modified by: Psycho
 
+import tempfile
 from unittest import TestCase
+from unittest.mock import ANY, MagicMock, patch
+
+import paramiko
+from click.testing import CliRunner
+
+from AliceCli.tests.test_ssh import _serve
+from AliceCli.utils import agent, commons, ssh, utils
 
 
 class Test_ChangePassword(TestCase):
@@ -45,3 +53,69 @@ class Test_ChangePassword(TestCase):
 
 	def test_sound_test(self):
 		pass  # Nothing to test
+
+
+class _DyingPool:
+
+	def __init__(self):
+		self.alive = True
+		self.client = MagicMock()
+
+
+	@property
+	def current(self) -> str:
+		return '192.168.1.20' if self.alive else ''
+
+
+	def session(self, *_):
+		return self.client if self.alive else None
+
+
+	def close(self, *_) -> bool:
+		return False
+
+
+class Test_DisplayLogs(TestCase):
+
+	@patch('AliceCli.utils.commons.returnToMainMenu')
+	@patch('AliceCli.utils.commons.printError')
+	@patch('AliceCli.utils.commons.printInfo')
+	def test_reconnects_to_the_device_it_lost(self, *_):
+		pool = _DyingPool()
+
+		def linkDies(*_):
+			pool.alive = False
+			raise OSError('Socket is closed')
+
+		with patch('AliceCli.utils.commons.SESSIONS', pool), \
+				patch('AliceCli.utils.commons.sshCmd', side_effect=linkDies), \
+				patch('AliceCli.utils.commons.tryReconnect', return_value=False) as tryReconnect:
+			result = CliRunner().invoke(utils.displayLogs, ['-f', '/var/log/syslog'])
+
+		self.assertEqual(result.exit_code, 0, result.output)
+		tryReconnect.assert_called_once_with(ANY, '192.168.1.20')
+
+
+class Test_DeviceStatus(TestCase):
+
+	@patch('AliceCli.utils.commons.returnToMainMenu')
+	@patch('AliceCli.utils.commons.printError')
+	def test_falls_back_to_the_shell(self, printError, _):
+		key = paramiko.RSAKey.generate(1024)
+		with tempfile.TemporaryDirectory() as home:
+			client = paramiko.SSHClient()
+			client.set_missing_host_key_policy(paramiko.AutoAddPolicy)
+			client.connect('127.0.0.1', port=_serve(key, home), username='pi', pkey=key, look_for_keys=False, allow_agent=False)
+			pool = ssh.SessionPool()
+			pool.add('192.168.1.20', client)
+
+			dying = MagicMock()
+			dying.batch.side_effect = agent.AgentError('The agent went away')
+			with patch('AliceCli.utils.commons.SESSIONS', pool), patch('AliceCli.utils.commons.remoteAgent', return_value=dying):
+				result = CliRunner().invoke(utils.deviceStatus)
+			pool.closeAll()
+
+		self.assertEqual(result.exit_code, 0, result.output)
+		printError.assert_called_once()
+		self.assertIn('Status of 192.168.1.20', result.output)
+		self.assertIn('Busiest processes:', result.output)
@@ -0,0 +1,139 @@
+#  Copyright (c) 2021
+#
+#  This file, transfer.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import click
+import paramiko
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from tqdm import tqdm
+from typing import Dict, Iterator, Sequence
+
+from AliceCli.utils import commons, delta, inventory, ssh, transfers
+
+
+@click.command(name='upload')
+@click.option('-s', '--source', required=True, type=click.Path(exists=True, dir_okay=False), help='Local file to upload')
+@click.option('-d', '--destination', required=False, type=str, default='~/', help='Path on the devices, their home directory by default')
+@click.option('-i', '--ip_address', required=False, type=str, multiple=True, help='Device to upload to, can be repeated. Defaults to the connected device')
+@click.option('-w', '--workers', required=False, type=click.IntRange(min=1), default=transfers.TRANSFER_WORKERS, help='Chunks transferred in parallel per device')
+@click.option('--no_verify', is_flag=True, help='Skip comparing the hash of the uploaded file')
+def upload(source: str, destination: str, ip_address: Sequence[str], workers: int, no_verify: bool):
+	source = Path(source)
+	size = source.stat().st_size
+
+	def send(position: int, address: str, client: paramiko.SSHClient):
+		with tqdm(total=size, desc=address, unit='B', unit_scale=True, unit_divisor=1024, position=position, leave=True) as progress:
+			return transfers.upload(client, source, destination, workers=workers, onProgress=progress.update, verify=not no_verify)
+
+	with _devices(ip_address) as devices:
+		if not devices:
+			return
+
+		with ThreadPoolExecutor(max_workers=len(devices)) as executor:
+			futures = {address: executor.submit(send, position, address, client) for position, (address, client) in enumerate(devices.items())}
+
+	for address, future in futures.items():
+		try:
+			commons.printSuccess(f'Uploaded {source.name} to {address}:{future.result()}')
+		except Exception as e:
+			commons.printError(f'Failed uploading {source.name} to {address}: {e}')
+
+
+@click.command(name='download')
+@click.option('-s', '--source', required=True, type=str, help='Path of the file on the device')
+@click.option('-d', '--destination', required=False, type=click.Path(), default='.', help='Local path, the current directory by default')
+@click.option('-i', '--ip_address', required=False, type=str, default='', help='Device to download from. Defaults to the connected device')
+@click.option('-w', '--workers', required=False, type=click.IntRange(min=1), default=transfers.TRANSFER_WORKERS, help='Chunks transferred in parallel')
+@click.option('--no_verify', is_flag=True, help='Skip comparing the hash of the downloaded file')
+def download(source: str, destination: str, ip_address: str, workers: int, no_verify: bool):
+	with _devices([ip_address] if ip_address else []) as devices:
+		if not devices:
+			return
+
+		address, client = next(iter(devices.items()))
+		try:
+			with tqdm(total=transfers.remoteSize(client, source), desc=address, unit='B', unit_scale=True, unit_divisor=1024) as progress:
+				local = transfers.download(client, source, Path(destination), workers=workers, onProgress=progress.update, verify=not no_verify)
+			commons.printSuccess(f'Downloaded {address}:{source} to {local}')
+		except Exception as e:
+			commons.printError(f'Failed downloading {source} from {address}: {e}')
+
+
+@click.command(name='sync')
+@click.option('-s', '--source', required=True, type=click.Path(exists=True, file_okay=False), help='Local directory to push')
+@click.option('-d', '--destination', required=True, type=str, help='Directory on the device, created if missing')
+@click.option('-i', '--ip_address', required=False, type=str, default='', help='Device to sync to. Defaults to the connected device')
+@click.option('--dry_run', is_flag=True, help='Only report what would be sent and the bytes saved')
+def sync(source: str, destination: str, ip_address: str, dry_run: bool):
+	with _devices([ip_address] if ip_address else []) as devices:
+		if not devices:
+			return
+
+		address, client = next(iter(devices.items()))
+		try:
+			plans = delta.sync(client, Path(source), destination, dryRun=dry_run)
+		except Exception as e:
+			commons.printError(f'Failed syncing {source} to {address}: {e}')
+			return
+
+	for plan in plans:
+		if plan.status != delta.UNCHANGED:
+			click.echo(f'{plan.status:>9} {plan.path} ({plan.sent}/{plan.size} bytes)')
+
+	total = sum(plan.size for plan in plans)
+	sent = sum(plan.sent for plan in plans)
+	saved = f'{total - sent} bytes saved ({(total - sent) / total:.0%})' if total else 'nothing to send'
+	changed = sum(plan.status != delta.UNCHANGED for plan in plans)
+	if dry_run:
+		commons.printInfo(f'Would update {changed} of {len(plans)} files on {address}:{destination}, sending {sent} bytes, {saved}')
+	else:
+		commons.printSuccess(f'Updated {changed} of {len(plans)} files on {address}:{destination}, sent {sent} bytes, {saved}')
+
+
+@contextmanager
+def _devices(addresses: Sequence[str]) -> Iterator[Dict[str, paramiko.SSHClient]]:
+	"""
+	Sessions to the given devices, or to the connected device if none is given. Open sessions of the pool are reused,
+	the missing ones are opened for the transfer only and closed after it: adding them to the pool would have it
+	evict, and close, the sessions of the first devices as soon as there are more than its limit.
+	"""
+	if not addresses:
+		if not commons.SESSIONS.session():
+			commons.printError('Please connect to a device first or name the devices with --ip_address')
+			yield dict()
+		else:
+			yield {commons.SESSIONS.current: commons.SESSIONS.session()}
+		return
+
+	devices = dict()
+	opened = list()
+	try:
+		for address in dict.fromkeys(addresses):
+			client = commons.SESSIONS.session(address)
+			if not client:
+				try:
+					client = ssh.openSession(address, addresses=inventory.addressesOf(address), hostKey=inventory.hostKeyOf(address))
+				except Exception as e:
+					commons.printError(f'Failed connecting to {address}: {e}')
+					continue
+				opened.append(client)
+			devices[address] = client
+		yield devices
+	finally:
+		for client in opened:
+			client.close()
@@ -0,0 +1,205 @@
+#  Copyright (c) 2021
+#
+#  This file, agent.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import itertools
+import json
+import paramiko
+import shlex
+import socket
+from threading import Lock
+from typing import Any, List, Sequence, Tuple
+
+from AliceCli.utils import ssh
+
+
+AGENT_VERSION = 1
+AGENT_TIMEOUT = 10.0
+PYTHON = 'python3'
+READ_LIMIT = 65536
+
+# Runs on the device, kept compatible with the oldest python3 a Raspberry Pi OS image may ship
+_AGENT_SCRIPT = '''
+import json, os, subprocess, sys
+
+PAGE = os.sysconf('SC_PAGE_SIZE')
+
+
+def stat(path):
+	path = os.path.expanduser(path)
+	try:
+		info = os.stat(path)
+	except OSError:
+		return {'exists': False}
+	return {'exists': True, 'isDir': os.path.isdir(path), 'size': info.st_size, 'mode': info.st_mode & 0o7777, 'mtime': info.st_mtime}
+
+
+def read(path, limit=%(limit)d):
+	with open(os.path.expanduser(path), 'rb') as f:
+		return f.read(limit).decode(errors='replace')
+
+
+def service(name):
+	def query(verb):
+		return subprocess.run(['systemctl', verb, name], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+	return {'active': query('is-active'), 'enabled': query('is-enabled')}
+
+
+def processes():
+	found = list()
+	for pid in os.listdir('/proc'):
+		if not pid.isdigit():
+			continue
+		try:
+			with open('/proc/%%s/cmdline' %% pid, 'rb') as f:
+				command = f.read().replace(b'\\0', b' ').decode(errors='replace').strip()
+			with open('/proc/%%s/stat' %% pid) as f:
+				fields = f.read().rsplit(')', 1)[1].split()
+		except (OSError, IndexError):
+			continue  # Gone meanwhile
+		found.append({'pid': int(pid), 'command': command, 'state': fields[0], 'rss': int(fields[21]) * PAGE})
+	return found
+
+
+def audio():
+	devices = list()
+	try:
+		with open('/proc/asound/pcm') as f:
+			lines = f.read().splitlines()
+	except OSError:
+		return devices
+	for line in lines:
+		ids, _, rest = line.partition(':')
+		card, _, device = ids.partition('-')
+		parts = [part.strip() for part in rest.split(' : ')]
+		devices.append({
+			'card'    : int(card),
+			'device'  : int(device),
+			'name'    : parts[0],
+			'playback': any(part.startswith('playback') for part in parts),
+			'capture' : any(part.startswith('capture') for part in parts)
+		})
+	return devices
+
+
+METHODS = {'stat': stat, 'read': read, 'service': service, 'processes': processes, 'audio': audio}
+
+
+def answer(call):
+	try:
+		return {'result': METHODS[call['method']](**call.get('params', dict()))}
+	except Exception as e:
+		return {'error': '%%s: %%s' %% (type(e).__name__, e)}
+
+
+sys.stdout.write(json.dumps({'agent': %(version)d}) + '\\n')
+sys.stdout.flush()
+for line in sys.stdin:
+	request = json.loads(line)
+	sys.stdout.write(json.dumps({'id': request['id'], 'results': [answer(call) for call in request['calls']]}) + '\\n')
+	sys.stdout.flush()
+''' % {'limit': READ_LIMIT, 'version': AGENT_VERSION}
+
+
+class AgentError(Exception):
+	pass
+
+
+class Agent:
+	"""
+	A small python program answering questions about the device over one long lived channel. The questions are
+	batched: any number of them costs one round trip, and none starts a shell. Available methods are stat(path),
+	read(path, limit), service(name), processes() and audio(). The agent goes away with its channel, nothing is left
+	on the device.
+	"""
+
+	def __init__(self, client: paramiko.SSHClient, timeout: float = AGENT_TIMEOUT):
+		self._lock = Lock()
+		self._ids = itertools.count(1)
+		self.command = ssh.execute(client, f'{PYTHON} -u -c {shlex.quote(_AGENT_SCRIPT)}', idleTimeout=timeout)
+
+		hello = self._receive()
+		if hello.get('agent') != AGENT_VERSION:
+			self.close()
+			raise AgentError(f'Unexpected agent greeting {hello}')
+
+
+	@property
+	def alive(self) -> bool:
+		return not self.command.channel.closed and not self.command.done
+
+
+	def batch(self, calls: Sequence[Tuple[str, dict]]) -> List[Any]:
+		"""
+		Sends the (method, params) calls in one request and returns their results in order. A call that failed on
+		the device does not fail the others, its result is the AgentError describing it.
+		"""
+		if not calls:
+			return list()
+
+		with self._lock:
+			identifier = next(self._ids)
+			request = {'id': identifier, 'calls': [{'method': method, 'params': params} for method, params in calls]}
+			try:
+				self.command.stdin.write(json.dumps(request).encode() + b'\n')
+				self.command.stdin.flush()
+			except (OSError, EOFError) as e:
+				raise AgentError(f'Agent unreachable: {e}')
+
+			reply = self._receive()
+			if reply.get('id') != identifier:
+				self.close()
+				raise AgentError(f'Out of sequence reply {reply.get("id")} to request {identifier}')
+
+		return [outcome['result'] if 'result' in outcome else AgentError(outcome.get('error', 'Unknown error')) for outcome in reply['results']]
+
+
+	def call(self, method: str, **params) -> Any:
+		result = self.batch([(method, params)])[0]
+		if isinstance(result, AgentError):
+			raise result
+		return result
+
+
+	def close(self):
+		self.command.close()
+
+
+	def _receive(self) -> dict:
+		try:
+			line = self.command.stdout.readline()
+		except socket.timeout:
+			self.close()
+			raise AgentError('The agent did not answer in time')
+
+		if not line:
+			errors = self.command.stderr.read().decode(errors='replace').strip() if self.command.done else ''
+			self.close()
+			raise AgentError(errors or 'The agent stopped')
+
+		try:
+			return json.loads(line)
+		except ValueError:
+			self.close()
+			raise AgentError(f'Garbled agent reply: {line[:100]}')
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *_):
+		self.close()
@@ -19,7 +19,7 @@
 #  Last modified by: Psycho
 import click
 import ctypes
-import json
+import ipaddress
 import os
 import paramiko
 import re
@@ -31,19 +31,24 @@ from InquirerPy import inquirer
 from InquirerPy.base.control import Choice
 from InquirerPy.separator import Separator
 from ProjectAlice.core.base.model.Version import Version
-from networkscan import networkscan
 from pathlib import Path
-from threading import Event, Thread
-from typing import Optional, Tuple
+from threading import Event, Lock, Thread
+from tqdm import tqdm
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from AliceCli.utils import agent, configs, discovery, facts, fingerprint, inventory, keys, ssh, tuning
 
 
 IP_REGEX = re.compile(r'^(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$')
-SSH: Optional[paramiko.SSHClient] = None
-CONNECTED_TO: str = ''
+SESSIONS = ssh.SessionPool()
+AGENTS: Dict[str, agent.Agent] = dict()
 ANIMATION_FLAG = Event()
 ANIMATION_THREAD: Optional[Thread] = None
 HIDDEN = '[hidden]'
 NO_EMPTY = 'Cannot be empty'
+RESCAN = '__rescan__'
+REBOOT_TIMEOUT = 300
+SCAN_MORE = '__scanMore__'
 COUNTRY_CODES = [
 	Choice('CH', name='Switzerland'),
 	Choice('DE', name='Germany'),
@@ -702,44 +707,68 @@ def isAdmin() -> bool:
 
 
 @click.command(name='discover')
-@click.option('-n', '--network', required=False, type=str, default='')
+@click.option('-n', '--network', required=False, type=str, multiple=True, callback=lambda ctx, param, value: validateNetworks(value), help='CIDR to scan, repeat or comma separate for several')
 @click.option('-a', '--all_devices', is_flag=True)
+@click.option('-m', '--method', required=False, type=click.Choice(discovery.SCAN_METHODS, case_sensitive=False), default='ping')
+@click.option('-p', '--port', 'ports', required=False, type=click.IntRange(1, 65535), multiple=True, default=[22])
+@click.option('-c', '--concurrency', required=False, type=click.IntRange(min=1), default=discovery.TCP_CONCURRENCY)
+@click.option('-t', '--timeout', required=False, type=click.FloatRange(min=0.1), default=discovery.SCAN_BUDGET)
+@click.option('-f', '--full_scan', is_flag=True, help='Ignore the known devices inventory and sweep the whole network')
+@click.option('-s', '--stream', is_flag=True, help='List devices as soon as they are found, CTRL-C stops the scan')
+@click.option('-r', '--rate', required=False, type=click.FloatRange(min=0), default=discovery.SCAN_RATE, help='Maximum probes per second over all subnets, 0 for unlimited')
+@click.option('-w', '--workers', required=False, type=click.IntRange(min=1), default=discovery.SHARD_WORKERS, help='Subnets scanned in parallel')
+@click.option('-k', '--check_auth', is_flag=True, help='Try the stored SSH keys on every device found and show which ones are ready to use')
 @click.pass_context
-def discover(ctx: click.Context, network: str, all_devices: bool, return_to_main_menu: bool = True):  # NOSONAR
+def discover(ctx: click.Context, network: Sequence[str], all_devices: bool, method: str = 'ping', ports: Tuple[int, ...] = (22,), concurrency: int = discovery.TCP_CONCURRENCY, timeout: float = discovery.SCAN_BUDGET, full_scan: bool = False, stream: bool = False, rate: float = discovery.SCAN_RATE, workers: int = discovery.SHARD_WORKERS, check_auth: bool = False, return_to_main_menu: bool = True):  # NOSONAR
 	click.clear()
-	click.secho('Discovering devices on your network, please wait', fg='yellow')
-
-	ip = IP_REGEX.search(socket.gethostbyname(socket.gethostname()))
-	if not ip and not network:
-		printError("Couldn't retrieve local ip address")
+	options = dict(network=network, method=method, ports=ports, concurrency=concurrency, timeout=timeout, stream=stream, rate=rate, workers=workers, check_auth=check_auth, return_to_main_menu=return_to_main_menu)
+
+	devices = list()
+	neighbors = list()
+	# Another scan method asks for a fresh probe with it, not for what earlier sweeps found
+	if not full_scan and method == 'ping':
+		known = inventory.loadInventory()
+		inventory.revalidateInBackground(inventory.staleDevices(known), ports=ports)
+		for address, device in known.items():
+			if network and not discovery.inNetworks(address, network):
+				continue
+			if all_devices or fingerprint.isCandidate(device.get('name', ''), device.get('signals', {'mac': device.get('fingerprint', '')})):
+				devices.append(Choice(address, name=f'{address}: {_deviceName(device.get("name", ""), device.get("signals"), device.get("interface", ""))} (seen {_elapsed(device.get("lastSeen", 0))} ago)'))
+
+	if devices:
+		click.secho('Known devices:', fg='yellow')
+		devices.append(Choice(RESCAN, name='Scan the network again'))
 	else:
-		if not network:
-			network = f"{'.'.join(ip[0].split('.')[0:3])}.0/24"
+		click.secho('Discovering devices on your network, please wait', fg='yellow')
 
-		click.secho(f'Scanning network: {network}', fg='yellow')
-		waitAnimation()
-		scan = networkscan.Networkscan(network)
-		scan.run()
+		interfaces = discovery.localNetworks()
+		if not network:
+			network = list(interfaces)
 
-		if all_devices:
-			click.secho('Discovered devices:', fg='yellow')
-		else:
-			click.secho('Discovered potential devices:', fg='yellow')
+		if not network:
+			ip = IP_REGEX.search(socket.gethostbyname(socket.gethostname()))
+			if not ip:
+				printError("Couldn't retrieve local ip address")
+				if return_to_main_menu:
+					returnToMainMenu(ctx)
+				return
+			network = [f"{'.'.join(ip[0].split('.')[0:3])}.0/24"]
 
-		devices = list()
-		for device in scan.list_of_hosts_found:
-			try:
-				name = socket.gethostbyaddr(device)
-				if not name:
-					continue
+		options['network'] = network
 
-				if all_devices or (not all_devices and ('projectalice' in name[0].lower() or 'raspberrypi' in name[0].lower())):
-					#click.secho(f'{device}: {name[0].replace(".home", "")}', fg='yellow')
-					devices.append(Choice(device, name=f'{device}: {name[0].replace(".home", "")}'))
-			except:
-				continue  # If no name, we don't need the device anyway
+		if not all_devices and method != 'ipv6' and not full_scan:
+			# Zero probe fast path, the Raspberry Pis the system already talked to
+			neighbors = discovery.neighborCandidates(network)
+			names = dict(discovery.resolveHosts(neighbors))
+			found = {address: discovery.interfaceFor(address, interfaces) for address in neighbors}
+			inventory.recordDevices({address: names.get(address, '') for address in neighbors}, interfaces=found)
+			devices = [Choice(address, name=f'{address}: {_deviceName(names.get(address, ""), {"kind": fingerprint.KIND_RASPBERRY}, found[address])}') for address in neighbors]
 
-		stopAnimation()
+		if devices:
+			click.secho('Raspberry Pi devices already seen by your system:', fg='yellow')
+			devices.append(Choice(SCAN_MORE, name='Scan the network for more devices'))
+		else:
+			devices = _sweep(all_devices, **options)
 
 		if not devices and not all_devices:
 			choice = inquirer.confirm(
@@ -748,55 +777,162 @@ def discover(ctx: click.Context, network: str, all_devices: bool, return_to_main
 			).execute()
 
 			if choice:
-				ctx.invoke(discover, network=network, all_devices=True, return_to_main_menu=return_to_main_menu)
+				ctx.invoke(discover, all_devices=True, full_scan=True, **options)
 				return
 			else:
 				returnToMainMenu(ctx)
 
+	device = _selectDevice(devices, check_auth)
+	if device == SCAN_MORE:
+		devices = [choice for choice in devices if isinstance(choice, Choice) and choice.value != SCAN_MORE]
+		devices.extend(_sweep(all_devices, exclude=neighbors, **options))
+		device = _selectDevice(devices, check_auth)
 
-		devices.append('Return to main menu')  # NOSONAR
-		device = inquirer.select(
-			message='Select the device you want to connect to',
-			choices=devices
-		).execute()
-
-		if device == 'Return to main menu':
-			returnToMainMenu(ctx)
-		else:
-			ctx.invoke(connect, ip_address=device, return_to_main_menu=return_to_main_menu)
+	if device == RESCAN:
+		ctx.invoke(discover, all_devices=all_devices, full_scan=True, **options)
+		return
+	elif device == 'Return to main menu':
+		returnToMainMenu(ctx)
+	else:
+		ctx.invoke(connect, ip_address=device, return_to_main_menu=return_to_main_menu)
 
 	if return_to_main_menu:
 		returnToMainMenu(ctx)
 
 
+def _sweep(allDevices: bool, network: Sequence[str], method: str, ports: Tuple[int, ...], concurrency: int, timeout: float, stream: bool, rate: float, workers: int, exclude: Sequence[str] = (), **_) -> list:
+	progress = None
+	if method == 'ipv6':
+		click.secho(f'Probing IPv6 link-local neighbors ({discovery.ALL_NODES})', fg='yellow')
+	else:
+		click.secho(f'Scanning network: {", ".join(discovery.parseNetworks(network))}', fg='yellow')
+		shards = len(discovery.shardNetworks(network))
+		if shards > 1:
+			progress = tqdm(total=shards, unit='subnet', desc='Scanning', ascii=True, leave=False)
+
+	hosts = discovery.streamNetworks(network, method=method.lower(), ports=ports, concurrency=concurrency, budget=timeout, rate=rate, workers=workers, onProgress=(lambda done, total: progress.update(1)) if progress else None, exclude=exclude)
+
+	if stream:
+		click.secho('Press CTRL-C to stop scanning and pick from the devices found so far', fg='yellow')
+	elif not progress:
+		waitAnimation()
+
+	if allDevices:
+		click.secho('Discovered devices:', fg='yellow')
+	else:
+		click.secho('Discovered potential devices:', fg='yellow')
+
+	interfaces = discovery.localNetworks()
+	devices = list()
+	found = dict()
+	try:
+		for device, signals in fingerprint.fingerprintStream(hosts):
+			found[device] = discovery.interfaceFor(device, interfaces)
+			if allDevices or fingerprint.isCandidate(signals['name'], signals):
+				label = _deviceName(signals['name'], signals, found[device])
+				devices.append(Choice(device, name=f'{device}: {label}'))
+				if stream:
+					tqdm.write(click.style(f'{len(devices):>3}. {device:<16} {label}', fg='cyan'))
+	except KeyboardInterrupt:
+		if not stream:
+			raise
+	finally:
+		if progress:
+			progress.close()
+
+	inventory.recordDevices({device: '' for device in found}, interfaces=found)
+	stopAnimation()
+	return devices
+
+
+def _selectDevice(devices: list, checkAuth: bool = False) -> str:
+	if checkAuth:
+		devices = _withAuthentication(devices)
+
+	if 'Return to main menu' not in devices:
+		devices.append('Return to main menu')  # NOSONAR
+
+	return inquirer.select(
+		message='Select the device you want to connect to',
+		choices=devices
+	).execute()
+
+
+def _withAuthentication(devices: list) -> list:
+	addresses = [choice.value for choice in devices if isinstance(choice, Choice) and choice.value not in {RESCAN, SCAN_MORE}]
+	if not addresses:
+		return devices
+
+	click.secho('Checking access to the devices, please wait', fg='yellow')
+	waitAnimation()
+	statuses = ssh.authenticationStatuses(addresses)
+	stopAnimation()
+
+	labels = {
+		ssh.AUTH_READY   : '✔ ready',
+		ssh.AUTH_PASSWORD: '🔑 password required',
+		ssh.AUTH_REFUSED : '✘ refused'
+	}
+	order = [ssh.AUTH_READY, ssh.AUTH_PASSWORD, ssh.AUTH_REFUSED]
+
+	checked = [Choice(choice.value, name=f'{choice.name} - {labels[statuses[choice.value]]}') for choice in devices if isinstance(choice, Choice) and choice.value in statuses]
+	checked.sort(key=lambda choice: order.index(statuses[choice.value]))
+	return checked + [choice for choice in devices if not isinstance(choice, Choice) or choice.value not in statuses]
+
+
+def _deviceName(name: str, signals: Optional[dict] = None, interface: str = '') -> str:
+	name = name.replace('.home', '') if name else 'Unnamed device'
+	if signals and signals.get('kind') in {fingerprint.KIND_ALICE, fingerprint.KIND_RASPBERRY, fingerprint.KIND_SSH}:
+		name = f'{name} [{signals["kind"]}]'
+	if interface:
+		name = f'{name} via {interface}'
+	return name
+
+
+def _elapsed(timestamp: float) -> str:
+	seconds = max(0, int(time.time() - timestamp))
+	if seconds < 60:
+		return f'{seconds}s'
+	elif seconds < 3600:
+		return f'{seconds // 60}m'
+	elif seconds < 86400:
+		return f'{seconds // 3600}h'
+	return f'{seconds // 86400}d'
+
+
 @click.command(name='connect')
 @click.option('-i', '--ip_address', required=False, type=str, default='')
 @click.option('-p', '--port', required=False, type=int, default=22)
 @click.option('-u', '--user', required=False, type=str)
 @click.option('-pw', '--password', required=False, type=str, default='')
 @click.option('-r', '--return_to_main_menu', required=False, type=bool, default=True)
+@click.option('-k', '--key_type', required=False, type=click.Choice(keys.KEY_TYPES), default=keys.KEY_ED25519, help='Type of the key generated for new devices')
+@click.option('-t', '--tune', is_flag=True, help='Benchmark transport settings against the device and use the fastest from now on')
+@click.option('-a', '--agent', 'startAgent', is_flag=True, help='Start the remote agent answering device queries in batches')
 @click.pass_context
-def connect(ctx: click.Context, ip_address: str, port: int, user: str, password: str, return_to_main_menu: bool, noExceptHandling: bool = False) -> Optional[paramiko.SSHClient]:  # NOSONAR
-	global SSH, IP_REGEX, CONNECTED_TO
-	remoteAuthorizedKeysFile = '~/.ssh/authorized_keys'
-	confFile = Path(Path.home(), '.pacli/configs.json')
-	sshDirPath = Path(Path.home(), '.ssh')
+def connect(ctx: click.Context, ip_address: str, port: int, user: str, password: str, return_to_main_menu: bool, key_type: str = keys.KEY_ED25519, tune: bool = False, startAgent: bool = False, noExceptHandling: bool = False) -> Optional[paramiko.SSHClient]:  # NOSONAR
+	sshDirPath = configs.SSH_DIR
 	sshDirPath.mkdir(exist_ok=True)
 
-	confFile.parent.mkdir(parents=True, exist_ok=True)
-	if not confFile.exists():
-		confs = dict()
-		confs['servers'] = dict()
-		confFile.write_text(json.dumps(confs))
-	else:
-		confs = json.loads(confFile.read_text())
+	confs = configs.loadConfigs()
 
 	if not ip_address:
 		ip_address = inquirer.text(
 			message='Please enter the device IP address',
-			validate=lambda ip: IP_REGEX.match(ip) is not None
+			validate=isIpAddress
 		).execute()
 
+	if not password and SESSIONS.activate(ip_address):
+		printSuccess('Successfully connected to device')
+		if tune:
+			tuneConnection(ip_address, port)
+		if startAgent:
+			_ensureAgent()
+		if not return_to_main_menu:
+			return SESSIONS.session()
+		returnToMainMenu(ctx)
+		return
+
 	data = confs['servers'].get(ip_address, dict()).get('keyFile')
 	if data:
 		user = confs['servers'][ip_address]['user']
@@ -809,6 +945,10 @@ def connect(ctx: click.Context, ip_address: str, port: int, user: str, password:
 	else:
 		keyFile = None
 
+	if not keyFile:
+		# Have a key ready by the time the password is typed in
+		keys.fillPoolInBackground(key_type)
+
 	if not keyFile and not user:
 		user = inquirer.text(
 			message='Please enter username',
@@ -823,61 +963,121 @@ def connect(ctx: click.Context, ip_address: str, port: int, user: str, password:
 		).execute()
 
 	try:
-		if SSH:
-			disconnect()
+		SESSIONS.close(ip_address)
 
-		ssh = paramiko.SSHClient()
-		ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy)
+		client = paramiko.SSHClient()
+		client.set_missing_host_key_policy(paramiko.AutoAddPolicy)
 
 		waitAnimation()
 
-		if password:
-			ssh.connect(hostname=ip_address, port=port, username=user, password=password)
-		else:
-			key = paramiko.RSAKey.from_private_key_file(str(keyFile))
-			ssh.connect(hostname=ip_address, port=port, username=user, pkey=key)
+		profile = confs['servers'].get(ip_address, dict()).get('profile')
+		credentials = dict(password=password) if password else dict(pkey=ssh.loadPrivateKey(keyFile))
+		path, elapsed = ssh.connectDevice(client, ip_address, port, inventory.addressesOf(ip_address), inventory.hostKeyOf(ip_address), username=user, **credentials, **ssh.profileOptions(profile))
+		ssh.applyProfile(client, profile)
+		if elapsed is not None:
+			inventory.recordConnectTime(path, elapsed)
+		if path != ip_address:
+			printInfo(f'Reaching the device through {path}')
 
 	except Exception as e:
 		if not noExceptHandling:
 			printError(f'Failed connecting to device: {e}')
 			if ip_address in confs['servers'] and not password:
 				confs['servers'].pop(ip_address, None)
-				confFile.write_text(json.dumps(confs))
+				configs.saveConfigs(confs)
 				ctx.invoke(connect, ip_address=ip_address, user=user, return_to_main_menu=return_to_main_menu)
 				return
 		else:
 			raise
 	else:
 		printSuccess('Successfully connected to device')
-		SSH = ssh
-		CONNECTED_TO = ip_address
-		if ip_address not in confs['servers']:
-			filename = f'id_rsa_{ip_address}'
-			keyFile = Path(sshDirPath, filename)
-			if keyFile.exists():
-				keyFile.unlink()
-				keyFile.with_suffix('.pub').unlink(missing_ok=True)
-
-			confs['servers'][ip_address] = {
-				'keyFile': filename,
-				'user'   : user
-			}
-			confFile.write_text(json.dumps(confs))
-
-			key = paramiko.RSAKey.generate(4096)
-			key.write_private_key_file(filename=str(keyFile))
-
-			pubKeyFile = keyFile.with_suffix('.pub')
-			pubKeyFile.write_text(key.get_base64())
-			sshCmd(f"echo \"ssh-rsa {pubKeyFile.read_text()} Project Alice RSA key\" | exec sh -c 'cd ; umask 077 ; mkdir -p .ssh && cat >> {remoteAuthorizedKeysFile} || exit 1 ; if type restorecon >/dev/null 2>&1 ; then restorecon -F .ssh ${remoteAuthorizedKeysFile} ; fi'")
+		SESSIONS.add(ip_address, client)
+		if ip_address not in confs['servers'] or keys.isLegacyKey(confs['servers'][ip_address]):
+			provisionKey(ip_address, user, confs, key_type)
+
+		if tune:
+			tuneConnection(ip_address, port)
+
+		try:
+			reported = deviceFacts().get('addresses', list())
+		except (ssh.CommandInterrupted, paramiko.SSHException, OSError):
+			reported = list()
+		inventory.rememberAddresses(ip_address, reported)
+		inventory.recordHostKey(ip_address, ssh.serverKey(client))
+
+		if startAgent:
+			_ensureAgent()
 
 		if not return_to_main_menu:
-			return ssh
+			return client
 
 	if return_to_main_menu:
 		returnToMainMenu(ctx)
 
 
+def provisionKey(address: str, user: str, confs: dict, keyType: str = keys.KEY_ED25519):
+	"""
+	Authorizes a new key of ours on the current device and records it for next connections. A legacy RSA key the
+	device was set up with is revoked on the device and deleted once the new one is in place.
+	"""
+	remoteAuthorizedKeysFile = '~/.ssh/authorized_keys'
+	legacyKey = configs.keyFilePath(confs['servers'].get(address, dict())) if address in confs['servers'] else None
+
+	filename = f'id_{keyType}_{address}'
+	keyFile = Path(configs.SSH_DIR, filename)
+	publicKey = keys.installKey(keyFile, keyType)
+
+	steps = [ssh.Step(f"echo \"{publicKey}\" | exec sh -c 'cd ; umask 077 ; mkdir -p .ssh && cat >> {remoteAuthorizedKeysFile} || exit 1 ; if type restorecon >/dev/null 2>&1 ; then restorecon -F .ssh {remoteAuthorizedKeysFile} ; fi'", stopOnError=True)]
+	if legacyKey:
+		steps.append(ssh.Step(f"cd ; umask 077 ; grep -vF '{ssh.loadPrivateKey(legacyKey).get_base64()}' {remoteAuthorizedKeysFile} > {remoteAuthorizedKeysFile}.tmp ; mv {remoteAuthorizedKeysFile}.tmp {remoteAuthorizedKeysFile}"))
+
+	results = ssh.runScript(SESSIONS.session(), steps)
+	if results[0].exitStatus != 0:
+		printError('Failed authorizing a key on the device, you will be asked for the password again next time')
+		keyFile.unlink(missing_ok=True)
+		keys.publicKeyFile(keyFile).unlink(missing_ok=True)
+		return
+
+	confs['servers'].setdefault(address, dict()).update({
+		'keyFile': filename,
+		'keyType': keyType,
+		'user'   : user
+	})
+	configs.saveConfigs(confs)
+
+	if legacyKey and legacyKey != keyFile:
+		legacyKey.unlink(missing_ok=True)
+		keys.publicKeyFile(legacyKey).unlink(missing_ok=True)
+		# Legacy public keys were written next to the private one with the address' last byte as suffix
+		legacyKey.with_suffix('.pub').unlink(missing_ok=True)
+
+	keys.fillPoolInBackground(keyType)
+
+
+def tuneConnection(address: str, port: int = 22):
+	if not configs.keyFilePath(configs.serverConfig(address)):
+		printError('Tuning needs the device key, which could not be set up')
+		return
+
+	click.secho('Benchmarking transport settings, please wait', fg='yellow')
+
+	def report(result: tuning.Benchmark):
+		click.echo(f'  {_describeProfile(result.profile)}: {result.latency * 1000:.0f}ms, {result.throughput / 1048576:.2f}MiB/s')
+
+	try:
+		best = tuning.tune(address, port, onBenchmark=report)
+	except (paramiko.SSHException, OSError) as e:
+		printError(f'Benchmark failed: {e}')
+		return
+
+	tuning.saveProfile(address, best)
+	printSuccess(f'Saved the fastest settings: {_describeProfile(best.profile)}')
+
+
+def _describeProfile(profile: dict) -> str:
+	return f'{profile["cipher"]}, compression {"on" if profile["compress"] else "off"}, window {profile["window"] // 1024}KiB, packet {profile["packet"] // 1024}KiB'
+
+
 def printError(text: str):
 	ANIMATION_FLAG.clear()
 	click.secho(message=f'✘ {text}', fg='red')
@@ -897,11 +1097,11 @@ def printInfo(text: str):
 
 
 def disconnect():
-	global SSH, CONNECTED_TO
-	if SSH:
-		SSH.close()
-		SSH = None
-		CONNECTED_TO = ''
+	running = AGENTS.pop(SESSIONS.current, None)
+	if running:
+		running.close()
+
+	if SESSIONS.close():
 		printSuccess('Disconnected')
 
 
@@ -977,6 +1177,21 @@ def returnToMainMenu(ctx: click.Context, pause: bool = False, message: str = '')
 	ctx.invoke(MainMenu.mainMenu)
 
 
+def isIpAddress(address: str) -> bool:
+	try:
+		ipaddress.ip_address(address.split('%')[0])  # Link local IPv6 addresses carry their interface after a %
+		return True
+	except ValueError:
+		return False
+
+
+def validateNetworks(networks: Sequence[str]) -> Tuple[str, ...]:
+	try:
+		return tuple(discovery.parseNetworks(networks))
+	except ValueError as e:
+		raise click.BadParameter(str(e))
+
+
 def validateHostname(hostname: str) -> str:
 	if not hostname:
 		raise click.BadParameter('Hostname cannot be empty')
@@ -991,17 +1206,114 @@ def validateHostname(hostname: str) -> str:
 		raise click.BadParameter('Hostname cannot contain special characters')
 
 
-def sshCmd(cmd: str, hide: bool = False):
-	stdin, stdout, stderr = SSH.exec_command(cmd)
+def sshCmd(cmd: str, hide: bool = False, timeout: Optional[float] = None, idleTimeout: Optional[float] = None) -> int:
+	"""
+	Runs cmd on the current device and returns its exit status. A command exceeding timeout seconds, or silent for
+	idleTimeout seconds, is stopped and gets ssh.TIMEOUT_STATUS. Ctrl-C stops it as well before propagating.
+	"""
+	with ssh.execute(SESSIONS.session(), cmd, timeout=timeout, idleTimeout=idleTimeout) as remote:
+		try:
+			for stream, line in remote.lines():
+				if not hide:
+					click.secho(line, nl=False, fg='cyan' if stream == ssh.STDOUT else 'red', italic=True)  # NOSONAR
+			return remote.wait()
+		except ssh.CommandTimeout as e:
+			click.secho(f'✘ {cmd}: {e}', fg='red')
+			return ssh.TIMEOUT_STATUS
+
+
+def sshCmdWithReturn(cmd: str, timeout: Optional[float] = None, idleTimeout: Optional[float] = None) -> Tuple:
+	remote = ssh.execute(SESSIONS.session(), cmd, timeout=timeout, idleTimeout=idleTimeout)
+	return remote.stdout, remote.stderr
+
+
+def sshScript(steps: Sequence[ssh.Step], timeout: Optional[float] = None, idleTimeout: Optional[float] = None) -> bool:
+	"""
+	Runs the steps on the current device as one script, announcing each step with its description and reporting the
+	ones that failed. Returns whether all of them succeeded, which they did not if the script got stopped by timeout
+	or idleTimeout.
+	"""
+	def start(_: int, step: ssh.Step):
+		if step.description:
+			click.secho(f'▷ {step.description}', fg='yellow')
+
+	def echo(index: int, stream: str, line: str):
+		if not steps[index].hide:
+			click.secho(line, nl=False, fg='cyan' if stream == ssh.STDOUT else 'red', italic=True)  # NOSONAR
+
+	def end(result: ssh.StepResult):
+		if result.exitStatus:
+			click.secho(f'✘ {result.step.description or result.step.command} failed with exit status {result.exitStatus} after {result.duration:.1f}s', fg='red')
+
+	results = ssh.runScript(SESSIONS.session(), steps, onStart=start, onLine=echo, onEnd=end, timeout=timeout, idleTimeout=idleTimeout)
+	return all(result.exitStatus == 0 for result in results)
+
+
+def sshCmds(cmds: Sequence[str], hide: bool = False, timeout: Optional[float] = None, idleTimeout: Optional[float] = None) -> List[int]:
+	"""
+	Runs the commands at the same time on the current device, for example a log tail next to an update, and
+	returns their exit statuses. Lines are prefixed with the number of the command they come from.
+	"""
+	lock = Lock()
+
+	def echo(index: int, stream: str, line: str):
+		if hide:
+			return
+		with lock:
+			click.secho(f'[{index + 1}] {line}', nl=False, fg='cyan' if stream == ssh.STDOUT else 'red', italic=True)  # NOSONAR
+
+	return ssh.runConcurrently(SESSIONS.session(), cmds, echo, timeout=timeout, idleTimeout=idleTimeout)
+
+
+def deviceFacts(refresh: bool = False) -> dict:
+	"""
+	What we know about the current device, probed in one round trip and cached, see facts.deviceFacts
+	"""
+	return facts.deviceFacts(SESSIONS.current, SESSIONS.session(), refresh=refresh)
+
+
+def deviceFact(key: str):
+	"""
+	One fact about the current device. Should the batched probe fail, a timeout on a busy device for example, only
+	that fact is asked for, the errors of that second attempt are left to the caller
+	"""
+	try:
+		return deviceFacts().get(key)
+	except (ssh.CommandInterrupted, paramiko.SSHException, OSError):
+		return facts.probe(SESSIONS.session(), key)
 
-	while line := stdout.readline():
-		if not hide:
-			click.secho(line, nl=False, fg='cyan', italic=True)  # NOSONAR
 
+def remoteAgent() -> Optional[agent.Agent]:
+	"""
+	The agent of the current device, started on first use or when its session got replaced. None if it cannot run
+	on the device, without python3 for example.
+	"""
+	address = SESSIONS.current
+	running = AGENTS.get(address)
+	if running and running.alive:
+		return running
 
-def sshCmdWithReturn(cmd: str) -> Tuple:
-	stdin, stdout, stderr = SSH.exec_command(cmd)
-	return stdout, stderr
+	if not SESSIONS.session():
+		return None
+
+	try:
+		AGENTS[address] = agent.Agent(SESSIONS.session())
+		return AGENTS[address]
+	except (agent.AgentError, OSError, paramiko.SSHException):
+		AGENTS.pop(address, None)
+		return None
+
+
+def _ensureAgent():
+	if not remoteAgent():
+		printInfo('The remote agent could not start, is python3 installed on the device?')
+
+
+def forgetFacts():
+	"""
+	To be called by the commands changing the current device, its facts get probed again next time they are needed
+	"""
+	facts.invalidate(SESSIONS.current)
 
 
 # noinspection DuplicatedCode
@@ -1033,17 +1345,42 @@ def getUpdateSource(name: str, definedSource: str) -> str:
 	return str(updateSource)
 
 
-def tryReconnect(ctx: click.Context, address: str) -> bool:
-	rebooted = False
-	for i in range(1, 5):
+def tryReconnect(ctx: click.Context, address: str, previousBootId: Optional[str] = '', timeout: float = REBOOT_TIMEOUT, afterReboot: bool = False) -> bool:
+	"""
+	Waits for the device to accept connections again, then reconnects. afterReboot, the device only counts as back
+	once it runs a new boot: one with a readable boot id different from previousBootId. When there is nothing to
+	compare, previousBootId unknown or no key to check the boot before authenticating, the device has to be seen
+	going down first.
+	"""
+	deadline = time.monotonic() + timeout
+	printInfo('Waiting for the device to come back...')
+
+	hasKey = configs.keyFilePath(configs.serverConfig(address)) is not None
+	checkBoot = afterReboot and bool(previousBootId) and hasKey
+	if afterReboot and not checkBoot and not ssh.waitForPortClosed(address, timeout=deadline - time.monotonic()):
+		return False
+
+	while ssh.waitForPort(address, timeout=deadline - time.monotonic()):
+		if not configs.keyFilePath(configs.serverConfig(address)):
+			# Nothing to check the boot with before authenticating, let the user in the usual way
+			try:
+				ctx.invoke(connect, ip_address=address, return_to_main_menu=False, noExceptHandling=True)
+				return SESSIONS.session(address) is not None
+			except Exception:
+				time.sleep(ssh.PORT_POLL_INTERVAL)
+				continue
+
 		try:
-			printInfo(f'Trying to contact device, attempt {i} of 5...')
-			ctx.invoke(connect, ip_address=address, return_to_main_menu=False, noExceptHandling=True)
-			if SSH:
-				rebooted = True
-				break
-			time.sleep(5)
-		except:
-			pass  # Let's try again...
-
-	return rebooted
+			client = ssh.openSession(address, addresses=inventory.addressesOf(address), hostKey=inventory.hostKeyOf(address))
+			if checkBoot and ssh.bootId(client) in {None, previousBootId}:
+				client.close()
+			else:
+				SESSIONS.add(address, client)
+				printSuccess('Successfully connected to device')
+				return True
+		except (paramiko.SSHException, OSError, EOFError):
+			pass  # Sshd accepts connections before it is ready to authenticate, or the device is going down
+
+		time.sleep(max(0.0, min(ssh.PORT_POLL_INTERVAL, deadline - time.monotonic())))
+
+	return False
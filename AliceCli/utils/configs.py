@@ -0,0 +1,55 @@
+#  Copyright (c) 2021
+#
+#  This file, configs.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import json
+from pathlib import Path
+from typing import Optional
+
+
+CONFIG_FILE = Path(Path.home(), '.pacli/configs.json')
+SSH_DIR = Path(Path.home(), '.ssh')
+
+
+def loadConfigs() -> dict:
+	CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
+	if not CONFIG_FILE.exists():
+		confs = dict()
+		confs['servers'] = dict()
+		saveConfigs(confs)
+		return confs
+
+	confs = json.loads(CONFIG_FILE.read_text())
+	confs.setdefault('servers', dict())
+	return confs
+
+
+def saveConfigs(confs: dict):
+	CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
+	CONFIG_FILE.write_text(json.dumps(confs))
+
+
+def serverConfig(address: str, confs: Optional[dict] = None) -> dict:
+	confs = confs if confs is not None else loadConfigs()
+	return confs['servers'].get(address, dict())
+
+
+def keyFilePath(server: dict) -> Optional[Path]:
+	if not server.get('keyFile'):
+		return None
+
+	keyFile = Path(SSH_DIR, server['keyFile'])
+	return keyFile if keyFile.exists() else None
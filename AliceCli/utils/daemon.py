@@ -0,0 +1,234 @@
+#  Copyright (c) 2021
+#
+#  This file, daemon.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import time
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Callable, Iterator, Optional
+
+
+DAEMON_SOCKET = Path(Path.home(), '.pacli/control.sock')
+DAEMON_IDLE = 900
+CONNECT_TIMEOUT = 0.5
+START_TIMEOUT = 5.0
+
+
+class DaemonError(Exception):
+	pass
+
+
+def isSupported() -> bool:
+	return hasattr(socket, 'AF_UNIX')
+
+
+def request(message: dict, timeout: Optional[float] = None) -> Iterator[dict]:
+	"""
+	Sends one request to the daemon and yields its replies. Raises OSError if no daemon listens on the socket
+	"""
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+		sock.settimeout(CONNECT_TIMEOUT)
+		sock.connect(str(DAEMON_SOCKET))
+		sock.settimeout(timeout)
+		sock.sendall(json.dumps(message).encode() + b'\n')
+		with sock.makefile('r', encoding='utf-8') as replies:
+			for reply in replies:
+				yield json.loads(reply)
+
+
+def status() -> Optional[dict]:
+	if not isSupported():
+		return None
+
+	try:
+		return next(request({'action': 'status'}, timeout=CONNECT_TIMEOUT), None)
+	except (OSError, ValueError):
+		return None
+
+
+def isRunning() -> bool:
+	return status() is not None
+
+
+def run(address: str, command: str, onLine: Optional[Callable[[str, str], None]] = None, port: int = 22, timeout: Optional[float] = None, idleTimeout: Optional[float] = None) -> Optional[int]:
+	"""
+	Runs command on address over a session held by the daemon and returns its exit status, or None if no daemon is
+	running so that the caller can fall back to connecting by itself. onLine(stream, line) gets the output. The
+	daemon enforces timeout and idleTimeout, see ssh.RemoteCommand, and reports their expiry as TIMEOUT_STATUS.
+	"""
+	if not isSupported():
+		return None
+
+	replies = request({'action': 'run', 'address': address, 'port': port, 'command': command, 'timeout': timeout, 'idleTimeout': idleTimeout})
+	try:
+		reply = next(replies)
+	except (OSError, StopIteration):
+		return None
+
+	while True:
+		if 'error' in reply:
+			raise DaemonError(reply['error'])
+		elif 'exit' in reply:
+			return reply['exit']
+		elif onLine:
+			onLine(reply['stream'], reply['line'])
+
+		reply = next(replies, None)
+		if reply is None:
+			raise DaemonError('The daemon closed the connection before the command ended')
+
+
+def start() -> bool:
+	if not isSupported():
+		return False
+
+	if isRunning():
+		return True
+
+	subprocess.Popen(
+		[sys.executable, '-m', 'AliceCli.utils.daemon'],
+		stdin=subprocess.DEVNULL,
+		stdout=subprocess.DEVNULL,
+		stderr=subprocess.DEVNULL,
+		start_new_session=True
+	)
+
+	deadline = time.monotonic() + START_TIMEOUT
+	while time.monotonic() < deadline:
+		if isRunning():
+			return True
+		time.sleep(0.05)
+	return False
+
+
+def stop() -> bool:
+	try:
+		return any(reply.get('stopping') for reply in request({'action': 'stop'}, timeout=CONNECT_TIMEOUT))
+	except (OSError, ValueError):
+		return False
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+
+	def __init__(self, path: Path, pool):
+		self.pool = pool
+		self.connecting = Lock()
+		self.lastActivity = time.monotonic()
+		self.active = 0
+		self.activity = Lock()
+		super().__init__(str(path), _Handler)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+	def handle(self):
+		with self.server.activity:
+			self.server.active += 1
+		try:
+			message = json.loads(self.rfile.readline())
+			action = message.get('action')
+			if action == 'status':
+				self.reply(pid=os.getpid(), sessions=self.server.pool.addresses())
+			elif action == 'stop':
+				self.reply(stopping=True)
+				Thread(target=self.server.shutdown, daemon=True).start()
+			elif action == 'run':
+				self.run(message['address'], int(message.get('port', 22)), message['command'], message.get('timeout'), message.get('idleTimeout'))
+			else:
+				self.reply(error=f'Unknown action {action}')
+		except (BrokenPipeError, ConnectionResetError):
+			pass  # The client went away, closing the channel stops the command
+		except Exception as e:
+			self.reply(error=str(e))
+		finally:
+			with self.server.activity:
+				self.server.active -= 1
+				self.server.lastActivity = time.monotonic()
+
+
+	def run(self, address: str, port: int, command: str, timeout: Optional[float] = None, idleTimeout: Optional[float] = None):
+		from AliceCli.utils import ssh
+
+		with self.server.connecting:
+			client = self.server.pool.session(address)
+			if not client:
+				client = ssh.openSession(address, port)
+				self.server.pool.add(address, client, activate=False)
+
+		with ssh.execute(client, command, timeout=timeout, idleTimeout=idleTimeout) as remote:
+			try:
+				for stream, line in remote.lines():
+					self.reply(stream=stream, line=line)
+				self.reply(exit=remote.wait())
+			except ssh.CommandTimeout as e:
+				self.reply(stream=ssh.STDERR, line=f'{e}\n')
+				self.reply(exit=ssh.TIMEOUT_STATUS)
+
+
+	def reply(self, **kwargs):
+		self.wfile.write(json.dumps(kwargs).encode() + b'\n')
+
+
+def serve(idle: float = DAEMON_IDLE):
+	"""
+	Holds authenticated sessions and runs the commands sent over the control socket on them, until asked to stop or
+	idle for idle seconds. Like OpenSSH's ControlMaster, only the user owning the socket can talk to it.
+	"""
+	# paramiko is only needed here, keep it out of the clients' startup time
+	from AliceCli.utils import ssh
+
+	DAEMON_SOCKET.parent.mkdir(parents=True, exist_ok=True)
+	if DAEMON_SOCKET.exists():
+		if isRunning():
+			return
+		DAEMON_SOCKET.unlink()
+
+	umask = os.umask(0o177)
+	try:
+		server = _Server(DAEMON_SOCKET, ssh.SessionPool())
+	finally:
+		os.umask(umask)
+
+	stopped = Event()
+
+	def watch():
+		while not stopped.wait(1):
+			with server.activity:
+				if not server.active and time.monotonic() - server.lastActivity > idle:
+					break
+		server.shutdown()
+
+	watchdog = Thread(target=watch, daemon=True)
+	watchdog.start()
+	try:
+		server.serve_forever()
+	finally:
+		stopped.set()
+		server.pool.closeAll()
+		server.server_close()
+		DAEMON_SOCKET.unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+	serve()
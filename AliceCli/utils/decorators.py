@@ -23,11 +23,11 @@ import AliceCli.utils.commons as commons
 
 def checkConnection(func):
 	def wrapper(*args, **kwargs):
-		if not commons.SSH:
+		if not commons.SESSIONS.session():
 			commons.printError('Please connect to a device first')
 			args[0].invoke(commons.discover, return_to_main_menu=False)
 
-		if not commons.CONNECTED_TO:
+		if not commons.SESSIONS.current:
 			commons.returnToMainMenu(args[0])
 		else:
 			func(args[0], **kwargs)
@@ -0,0 +1,249 @@
+#  Copyright (c) 2021
+#
+#  This file, delta.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import hashlib
+import inspect
+import json
+import operator
+import paramiko
+import shlex
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from AliceCli.utils import ssh
+
+
+MIN_BLOCK_SIZE = 1024
+MAX_BLOCK_SIZE = 65536
+MODULUS = 1 << 16
+COPY = 0
+DATA = 1
+NEW = 'new'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+PYTHON = 'python3'
+
+
+def blockSize(size: int) -> int:
+	root = int(size ** 0.5) // 1024 * 1024
+	return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, root))
+
+
+def weakChecksum(block: bytes) -> Tuple[int, int]:
+	a = sum(block) % MODULUS
+	b = sum(map(operator.mul, range(len(block), 0, -1), block)) % MODULUS
+	return a, b
+
+
+# Runs on the device with the very same checksum functions, both sides must agree on blocks
+_SIGNATURE_SCRIPT = '''
+import hashlib, json, operator, os, sys
+from typing import Tuple
+MIN_BLOCK_SIZE, MAX_BLOCK_SIZE, MODULUS = {constants}
+{functions}
+root = os.path.expanduser(sys.argv[1])
+signatures = dict()
+for path, digest in json.loads(sys.stdin.readline()).items():
+	try:
+		with open(os.path.join(root, path), 'rb') as f:
+			data = f.read()
+	except OSError:
+		continue
+	if hashlib.md5(data).hexdigest() == digest:
+		signatures[path] = {{'same': True}}
+		continue
+	size = blockSize(len(data))
+	blocks = list()
+	for offset in range(0, len(data), size):
+		a, b = weakChecksum(data[offset:offset + size])
+		blocks.append([a | b << 16, hashlib.md5(data[offset:offset + size]).hexdigest()])
+	signatures[path] = {{'blockSize': size, 'blocks': blocks}}
+print(json.dumps(signatures))
+'''.format(
+	constants=f'{MIN_BLOCK_SIZE}, {MAX_BLOCK_SIZE}, {MODULUS}',
+	functions='\n\n'.join(inspect.getsource(function) for function in (blockSize, weakChecksum))
+)
+
+_PATCH_SCRIPT = '''
+import hashlib, json, os, sys
+root = os.path.expanduser(sys.argv[1])
+source = sys.stdin.buffer
+for entry in json.loads(source.readline()):
+	path = os.path.join(root, entry['path'])
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	temp = path + '.pacli-sync'
+	old = open(path, 'rb') if any(op[0] == 0 for op in entry['ops']) else None
+	digest = hashlib.md5()
+	with open(temp, 'wb') as target:
+		for op in entry['ops']:
+			if op[0] == 0:
+				old.seek(op[1] * entry['blockSize'])
+				data = old.read(op[2] * entry['blockSize'])
+			else:
+				data = source.read(op[1])
+				while len(data) < op[1]:
+					more = source.read(op[1] - len(data))
+					if not more:
+						sys.exit('Truncated delta for ' + entry['path'])
+					data += more
+			digest.update(data)
+			target.write(data)
+	if old:
+		old.close()
+	if digest.hexdigest() != entry['md5']:
+		os.remove(temp)
+		sys.exit('Checksum mismatch for ' + entry['path'])
+	os.chmod(temp, entry['mode'])
+	os.replace(temp, path)
+	print(entry['path'], flush=True)
+'''
+
+
+class SyncError(Exception):
+	pass
+
+
+class FilePlan(NamedTuple):
+	path: str  # Relative to the synced directories, with forward slashes
+	status: str
+	size: int
+	mode: int
+	md5: str
+	blockSize: int
+	ops: List[Union[Tuple[int, int, int], Tuple[int, bytes]]]
+
+	@property
+	def sent(self) -> int:
+		return sum(len(op[1]) for op in self.ops if op[0] == DATA)
+
+
+def localFiles(root: Path) -> Dict[str, Path]:
+	return {path.relative_to(root).as_posix(): path for path in sorted(Path(root).rglob('*')) if path.is_file()}
+
+
+def delta(data: bytes, blockSize: int, blocks: Sequence[Tuple[int, str]]) -> List[Union[Tuple[int, int, int], Tuple[int, bytes]]]:
+	"""
+	Rsync's algorithm: slides a blockSize window over data, one byte at a time thanks to the rolling weak checksum,
+	and turns every window matching a block of the remote file into a copy of that block. What matches nothing is
+	sent as literal data. Consecutive copies are merged into (COPY, first block, count), literals are (DATA, bytes).
+	"""
+	table: Dict[int, List[Tuple[int, str]]] = dict()
+	for index, (weak, strong) in enumerate(blocks):
+		table.setdefault(weak, list()).append((index, strong))
+
+	ops = list()
+	literalStart = position = 0
+	a, b = weakChecksum(data[:blockSize])
+
+	def emitCopy(index: int):
+		if literalStart < position:
+			ops.append((DATA, data[literalStart:position]))
+		if ops and ops[-1][0] == COPY and ops[-1][1] + ops[-1][2] == index:
+			ops[-1] = (COPY, ops[-1][1], ops[-1][2] + 1)
+		else:
+			ops.append((COPY, index, 1))
+
+	while position + blockSize <= len(data):
+		match = None
+		for index, strong in table.get(a | b << 16, ()):
+			if hashlib.md5(data[position:position + blockSize]).hexdigest() == strong:
+				match = index
+				break
+
+		if match is not None:
+			emitCopy(match)
+			position += blockSize
+			literalStart = position
+			a, b = weakChecksum(data[position:position + blockSize])
+			continue
+
+		if position + blockSize < len(data):
+			outgoing, incoming = data[position], data[position + blockSize]
+			a = (a - outgoing + incoming) % MODULUS
+			b = (b - blockSize * outgoing + a) % MODULUS
+		position += 1
+
+	if literalStart < len(data):
+		ops.append((DATA, data[literalStart:]))
+	return ops
+
+
+def plan(client: paramiko.SSHClient, local: Path, remote: str) -> List[FilePlan]:
+	"""
+	Compares the local directory with its remote counterpart, whose block signatures are computed on the device in
+	one go, and returns what each file needs. Files whose content did not change cost a hash on each side.
+	"""
+	files = localFiles(local)
+	contents = {path: file.read_bytes() for path, file in files.items()}
+	digests = {path: hashlib.md5(data).hexdigest() for path, data in contents.items()}
+	signatures = _runRemote(client, _SIGNATURE_SCRIPT, remote, json.dumps(digests).encode() + b'\n')
+	signatures = json.loads(signatures) if signatures else dict()
+
+	plans = list()
+	for path, data in contents.items():
+		signature = signatures.get(path)
+		mode = files[path].stat().st_mode & 0o777
+		if signature and signature.get('same'):
+			plans.append(FilePlan(path, UNCHANGED, len(data), mode, digests[path], MIN_BLOCK_SIZE, list()))
+		elif signature:
+			ops = delta(data, signature['blockSize'], signature['blocks'])
+			plans.append(FilePlan(path, CHANGED, len(data), mode, digests[path], signature['blockSize'], ops))
+		else:
+			plans.append(FilePlan(path, NEW, len(data), mode, digests[path], MIN_BLOCK_SIZE, [(DATA, data)] if data else list()))
+	return plans
+
+
+def apply(client: paramiko.SSHClient, remote: str, plans: Sequence[FilePlan]) -> List[str]:
+	"""
+	Rebuilds the new and changed files on the device from their deltas, each one verified before replacing the old
+	"""
+	pending = [filePlan for filePlan in plans if filePlan.status != UNCHANGED]
+	if not pending:
+		return list()
+
+	header = [{
+		'path'     : filePlan.path,
+		'mode'     : filePlan.mode,
+		'md5'      : filePlan.md5,
+		'blockSize': filePlan.blockSize,
+		'ops'      : [list(op) if op[0] == COPY else [DATA, len(op[1])] for op in filePlan.ops]
+	} for filePlan in pending]
+
+	literals = (op[1] for filePlan in pending for op in filePlan.ops if op[0] == DATA)
+	return _runRemote(client, _PATCH_SCRIPT, remote, json.dumps(header).encode() + b'\n', literals).decode().split()
+
+
+def sync(client: paramiko.SSHClient, local: Path, remote: str, dryRun: bool = False) -> List[FilePlan]:
+	plans = plan(client, local, remote)
+	if not dryRun:
+		apply(client, remote, plans)
+	return plans
+
+
+def _runRemote(client: paramiko.SSHClient, script: str, remote: str, header: bytes, chunks: Optional[Sequence[bytes]] = None) -> bytes:
+	with ssh.execute(client, f'{PYTHON} -c {shlex.quote(script)} {shlex.quote(remote)}') as command:
+		command.stdin.write(header)
+		for chunk in chunks or ():
+			command.stdin.write(chunk)
+		command.stdin.flush()
+		command.channel.shutdown_write()
+
+		output = command.stdout.read()
+		errors = command.stderr.read().decode(errors='replace').strip()
+		if command.wait() != 0:
+			raise SyncError(errors or f'{PYTHON} failed on the device')
+	return output
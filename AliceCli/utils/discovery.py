@@ -0,0 +1,757 @@
+#  Copyright (c) 2021
+#
+#  This file, discovery.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import asyncio
+import errno
+import ipaddress
+import os
+import platform
+import psutil
+import re
+import select
+import socket
+import struct
+import subprocess
+import time
+import queue
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from networkscan import networkscan
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Generator, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+
+RESOLVE_WORKERS = 32
+RESOLVE_TIMEOUT = 2.0
+TCP_CONCURRENCY = 256
+TCP_CONNECT_TIMEOUT = 0.5
+SCAN_BUDGET = 3.0
+SCAN_RATE = 2000
+SHARD_PREFIX = 24
+SHARD_WORKERS = 4
+PING_BATCH = 32  # Hosts pinged at once by a worker, each batch waits for its slots from the rate limiter
+AUTO_MIN_PREFIX = 22
+VIRTUAL_INTERFACES = ('lo', 'docker', 'br-', 'veth', 'virbr', 'vboxnet', 'vmnet', 'vethernet', 'utun', 'tun', 'tap')
+ICMP_REPLY_TIMEOUT = 1.0
+ICMP_SEND_WAIT = 0.05
+ICMP_SEND_BACKOFF = 0.01  # When the kernel is out of buffers for our requests
+SCAN_METHODS = ['ping', 'tcp', 'icmp', 'ipv6']
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+ICMP_PAYLOAD = b'ProjectAliceCLI'
+ALL_NODES = 'ff02::1'
+ALICE_NAMES = ('projectalice', 'raspberrypi')
+RASPBERRY_OUIS = ('b8:27:eb', 'dc:a6:32', 'e4:5f:01', '28:cd:c1', 'd8:3a:dd', '2c:cf:67', '88:a2:9e')
+ARP_LINE_REGEX = re.compile(r'\(?(?P<address>\d+(?:\.\d+){3})\)?\s+(?:at\s+)?(?P<mac>(?:[0-9a-f]{1,2}[:-]){5}[0-9a-f]{1,2})(?:.*\son\s(?P<interface>\S+))?', re.IGNORECASE)
+NEIGHBOR6_LINE_REGEX = re.compile(r'^(?P<address>[0-9a-f:]+)(?:%\S+)?\s+(?:dev\s+)?(?:lladdr\s+)?(?P<mac>(?:[0-9a-f]{1,2}:){5}[0-9a-f]{1,2})\s+(?P<interface>\S+)', re.IGNORECASE)
+IP_NEIGH_LINE_REGEX = re.compile(r'^(?P<address>[0-9a-f:]+)\s+dev\s+(?P<interface>\S+)\s+lladdr\s+(?P<mac>(?:[0-9a-f]{1,2}:){5}[0-9a-f]{1,2})', re.IGNORECASE)
+
+
+class Neighbor(NamedTuple):
+	address: str
+	mac: str
+	interface: str
+
+
+class RateLimiter:
+	"""
+	Thread safe pacing shared by every shard of a scan, so that the sum of all probes stays under rate per second
+	"""
+
+	def __init__(self, rate: float, burst: int = 32, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+		self.rate = rate
+		self._interval = 1.0 / rate
+		self._burst = burst * self._interval
+		self._clock = clock
+		self._sleep = sleep
+		self._next = clock()
+		self._lock = Lock()
+
+
+	def reserve(self, count: int = 1) -> float:
+		"""
+		Books the next count free slots and returns how long to wait before using them
+		"""
+		with self._lock:
+			now = self._clock()
+			slot = max(self._next, now - self._burst)
+			self._next = slot + self._interval * count
+			return max(0.0, slot - now)
+
+
+	def acquire(self, count: int = 1):
+		delay = self.reserve(count)
+		if delay:
+			self._sleep(delay)
+
+
+def isAliceName(name: str) -> bool:
+	name = name.lower()
+	return any(aliceName in name for aliceName in ALICE_NAMES)
+
+
+def isRaspberryMac(mac: str) -> bool:
+	return bool(mac) and normalizeMac(mac).startswith(RASPBERRY_OUIS)
+
+
+def isAliceDevice(name: str, mac: str = '') -> bool:
+	return isAliceName(name) or isRaspberryMac(mac)
+
+
+def neighborCandidates(networks: Union[str, Sequence[str]] = ()) -> List[str]:
+	"""
+	Raspberry Pis the system already talked to recently, straight from the IPv4 neighbor table, no probe involved.
+	When networks are given, only the neighbors inside them are returned.
+	"""
+	scopes = [ipaddress.ip_network(network) for network in parseNetworks(networks)] if networks else list()
+	candidates = list()
+	for neighbor in neighborTable(ipv6=False):
+		if not isRaspberryMac(neighbor.mac):
+			continue
+
+		if scopes and not any(ipaddress.ip_address(neighbor.address) in scope for scope in scopes if scope.version == 4):
+			continue
+
+		candidates.append(neighbor.address)
+
+	return list(dict.fromkeys(candidates))
+
+
+def resolveHosts(hosts: Iterable[str], workers: int = RESOLVE_WORKERS, timeout: float = RESOLVE_TIMEOUT) -> Generator[Tuple[str, str], None, None]:
+	"""
+	Reverse resolves hosts on a bounded thread pool and yields (host, name) as soon as an answer arrives. Hosts are
+	consumed while they are being produced, so a scan generator can be plugged in directly. Hosts without PTR record
+	are skipped, as are lookups taking longer than timeout. gethostbyaddr cannot be interrupted, so a timed out
+	lookup is simply abandoned and its thread ends whenever the resolver gives up.
+	"""
+	results = queue.Queue()
+	started: Dict[str, float] = dict()
+	submitted: List[str] = list()
+	futures: List[Future] = list()
+	errors: List[Exception] = list()
+	feederDone = Event()
+	executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='resolver')
+
+	def lookup(host: str):
+		started[host] = time.monotonic()
+		try:
+			name = socket.gethostbyaddr(host)[0]
+		except (OSError, UnicodeError):
+			name = ''  # If no name, we don't need the device anyway
+		results.put((host, name))
+
+	def feed():
+		seen = set()
+		try:
+			for host in hosts:
+				if host in seen:
+					continue
+				seen.add(host)
+				submitted.append(host)
+				futures.append(executor.submit(lookup, host))
+		except RuntimeError:
+			pass  # Consumer went away and shut the pool down
+		except Exception as e:
+			errors.append(e)
+		finally:
+			feederDone.set()
+
+	Thread(target=feed, daemon=True).start()
+	answered = set()
+	try:
+		while not feederDone.is_set() or len(answered) < len(submitted):
+			try:
+				host, name = results.get(timeout=0.1)
+			except queue.Empty:
+				host, name = '', ''
+
+			if host and host not in answered:
+				answered.add(host)
+				if name:
+					yield host, name
+
+			now = time.monotonic()
+			for pendingHost, start in list(started.items()):
+				if pendingHost not in answered and now - start > timeout:
+					answered.add(pendingHost)
+
+		if errors:
+			raise errors[0]
+	finally:
+		# Queued lookups would still run once the consumer is gone, shutdown only cancels them from python 3.9 on
+		executor.shutdown(wait=False)
+		for future in list(futures):
+			future.cancel()
+
+
+def networkHosts(network: str) -> List[str]:
+	return [str(host) for host in ipaddress.ip_network(network, strict=False).hosts()]
+
+
+def localNetworks() -> Dict[str, str]:
+	"""
+	Maps the IPv4 networks attached to every up, physical looking interface to the interface name. Networks wider
+	than AUTO_MIN_PREFIX are narrowed to the part around our own address, pass them explicitly to scan them whole.
+	"""
+	stats = psutil.net_if_stats()
+	networks = dict()
+	for name, addresses in psutil.net_if_addrs().items():
+		if name not in stats or not stats[name].isup or name.lower().startswith(VIRTUAL_INTERFACES):
+			continue
+
+		for address in addresses:
+			if address.family != socket.AF_INET or not address.netmask:
+				continue
+
+			interface = ipaddress.ip_interface(f'{address.address}/{address.netmask}')
+			if interface.ip.is_loopback or interface.ip.is_link_local:
+				continue
+
+			if interface.network.prefixlen < AUTO_MIN_PREFIX:
+				interface = ipaddress.ip_interface(f'{address.address}/{AUTO_MIN_PREFIX}')
+
+			networks.setdefault(str(interface.network), name)
+
+	return networks
+
+
+def interfaceFor(host: str, networks: Dict[str, str]) -> str:
+	if '%' in host:
+		return host.split('%', 1)[1]
+
+	try:
+		address = ipaddress.ip_address(host)
+	except ValueError:
+		return ''
+
+	for network, interface in networks.items():
+		network = ipaddress.ip_network(network)
+		if network.version == address.version and address in network:
+			return interface
+	return ''
+
+
+def parseNetworks(networks: Union[str, Sequence[str]]) -> List[str]:
+	"""
+	Accepts one or more CIDRs, comma separated or not, and returns them normalized with overlaps merged
+	"""
+	if isinstance(networks, str):
+		networks = [networks]
+
+	parsed = [ipaddress.ip_network(network.strip(), strict=False) for value in networks for network in value.split(',') if network.strip()]
+	merged = list()
+	for version in (4, 6):
+		merged.extend(str(network) for network in ipaddress.collapse_addresses(network for network in parsed if network.version == version))
+	return merged
+
+
+def inNetworks(address: str, networks: Union[str, Sequence[str]]) -> bool:
+	"""
+	Whether the address, link-local scope id aside, belongs to one of the networks
+	"""
+	try:
+		ip = ipaddress.ip_address(address.split('%')[0])
+	except ValueError:
+		return False
+	scopes = [ipaddress.ip_network(network) for network in parseNetworks(networks)]
+	return any(ip in scope for scope in scopes if scope.version == ip.version)
+
+
+def shardNetworks(networks: Union[str, Sequence[str]], prefix: int = SHARD_PREFIX) -> List[str]:
+	shards = list()
+	for network in parseNetworks(networks):
+		network = ipaddress.ip_network(network)
+		if network.version == 4 and network.prefixlen < prefix:
+			shards.extend(str(subnet) for subnet in network.subnets(new_prefix=prefix))
+		else:
+			shards.append(str(network))
+	return shards
+
+
+def scanNetwork(network: str, method: str = 'ping', ports: Sequence[int] = (22,), concurrency: int = TCP_CONCURRENCY, budget: float = SCAN_BUDGET) -> List[str]:
+	return list(streamNetwork(network, method=method, ports=ports, concurrency=concurrency, budget=budget))
+
+
+def streamNetworks(networks: Union[str, Sequence[str]], method: str = 'ping', ports: Sequence[int] = (22,), concurrency: int = TCP_CONCURRENCY, budget: float = SCAN_BUDGET, rate: float = SCAN_RATE, workers: int = SHARD_WORKERS, onProgress: Optional[Callable[[int, int], None]] = None, exclude: Iterable[str] = ()) -> Iterator[str]:
+	"""
+	Splits the networks in shards scanned on a pool of workers, all paced by one global rate limiter, and merges
+	their results in a single iterator. onProgress is called with (done, total) each time a shard completes.
+	Excluded hosts are neither probed, when the method allows it, nor returned.
+	"""
+	exclude = frozenset(exclude)
+	if method == 'ipv6':
+		return streamNetwork('', method=method, budget=budget, exclude=exclude)
+
+	shards = shardNetworks(networks)
+	if not shards:
+		return iter(list())
+
+	workers = max(1, min(workers, len(shards)))
+	limiter = RateLimiter(rate) if rate else None
+	results = queue.Queue()
+	done = object()
+
+	# networkscan keeps its state in module globals, ping shards only run in parallel in processes of their own
+	pool = ProcessPoolExecutor(max_workers=workers) if method == 'ping' else None
+
+	def scanShard(shard: str):
+		for host in streamNetwork(shard, method=method, ports=ports, concurrency=max(1, concurrency // workers), budget=budget, limiter=limiter, exclude=exclude, pool=pool):
+			results.put(host)
+
+	def run():
+		try:
+			with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shard') as executor:
+				for completed, future in enumerate(as_completed([executor.submit(scanShard, shard) for shard in shards]), start=1):
+					if future.exception():
+						results.put(future.exception())
+					if onProgress:
+						onProgress(completed, len(shards))
+		finally:
+			if pool:
+				pool.shutdown()
+			results.put(done)
+
+	Thread(target=run, daemon=True).start()
+	return _drain(results, done)
+
+
+def _drain(results: queue.Queue, done: object) -> Generator[str, None, None]:
+	while (item := results.get()) is not done:
+		if isinstance(item, Exception):
+			raise item
+		yield item
+
+
+def streamNetwork(network: str, method: str = 'ping', ports: Sequence[int] = (22,), concurrency: int = TCP_CONCURRENCY, budget: float = SCAN_BUDGET, limiter: Optional[RateLimiter] = None, exclude: Iterable[str] = (), pool: Optional[Executor] = None) -> Iterator[str]:
+	"""
+	Returns an iterator over the live hosts of the network, yielding each one as soon as the chosen method confirms it
+	"""
+	exclude = frozenset(exclude)
+	if method == 'tcp':
+		return tcpStream([host for host in networkHosts(network) if host not in exclude], ports=ports, concurrency=concurrency, budget=budget, limiter=limiter)
+
+	if method == 'icmp':
+		try:
+			return icmpStream([host for host in networkHosts(network) if host not in exclude], budget=budget, limiter=limiter)
+		except OSError:
+			pass  # No ICMP socket available to us, let networkscan ping
+
+	if method == 'ipv6':
+		return iter([host for host in multicastScan(budget=budget) if host not in exclude])
+
+	return iter(pingScan(network, limiter=limiter, pool=pool, exclude=exclude))
+
+
+def pingScan(network: str, limiter: Optional[RateLimiter] = None, pool: Optional[Executor] = None, exclude: Iterable[str] = ()) -> List[str]:
+	"""
+	Pings the hosts of the network with networkscan on pool, a process pool: networkscan keeps its state in module
+	globals, each process pinging one batch at a time keeps scans apart. Batches of PING_BATCH hosts are paced by
+	the limiter, networkscan would otherwise ping the whole network at once. Without pool, the scan gets a process
+	of its own.
+	"""
+	exclude = frozenset(exclude)
+	hosts = [host for host in networkHosts(network) if host not in exclude]
+	batches = [hosts[index:index + PING_BATCH] for index in range(0, len(hosts), PING_BATCH)]
+
+	def run(executor: Executor) -> List[str]:
+		futures = list()
+		for batch in batches:
+			if limiter:
+				limiter.acquire(len(batch))
+			futures.append(executor.submit(_pingHosts, batch))
+		return [host for future in futures for host in future.result()]
+
+	if pool:
+		return run(pool)
+
+	with ProcessPoolExecutor(max_workers=1) as own:
+		return run(own)
+
+
+class _Hosts:
+	"""
+	What networkscan uses of the network it scans, for a batch of hosts instead
+	"""
+
+	def __init__(self, hosts: List[str]):
+		self._hosts = hosts
+		self.num_addresses = len(hosts)
+		self.network_address = hosts[0]
+
+
+	def hosts(self) -> Iterator[str]:
+		return iter(self._hosts)
+
+
+def _pingHosts(hosts: List[str]) -> List[str]:
+	scan = networkscan.Networkscan(f'{hosts[0]}/32')
+	scan.network = _Hosts(hosts)
+	scan.run()
+	return list(scan.list_of_hosts_found)
+
+
+def tcpScan(hosts: Iterable[str], ports: Sequence[int] = (22,), concurrency: int = TCP_CONCURRENCY, budget: float = SCAN_BUDGET, limiter: Optional[RateLimiter] = None) -> List[str]:
+	"""
+	Opens non-blocking TCP connections to every host and port, at most concurrency at once, and returns the hosts
+	that accepted at least one of them before the total time budget ran out.
+	"""
+	found = list()
+	asyncio.run(_tcpScan(list(hosts), ports, concurrency, budget, found.append, limiter))
+	return found
+
+
+def tcpStream(hosts: Iterable[str], ports: Sequence[int] = (22,), concurrency: int = TCP_CONCURRENCY, budget: float = SCAN_BUDGET, limiter: Optional[RateLimiter] = None) -> Iterator[str]:
+	results = queue.Queue()
+	done = object()
+
+	def run():
+		try:
+			asyncio.run(_tcpScan(list(hosts), ports, concurrency, budget, results.put, limiter))
+		finally:
+			results.put(done)
+
+	Thread(target=run, daemon=True).start()
+	return iter(results.get, done)
+
+
+async def _tcpScan(hosts: List[str], ports: Sequence[int], concurrency: int, budget: float, onFound: Callable[[str], None], limiter: Optional[RateLimiter] = None):
+	semaphore = asyncio.Semaphore(max(1, concurrency))
+	timeout = min(TCP_CONNECT_TIMEOUT, budget)
+	# Paced probes push the deadline so that the last ones still get their connect timeout
+	deadline = [time.monotonic() + budget]
+	tasks = {asyncio.ensure_future(_tcpProbe(host, port, semaphore, timeout, limiter, deadline)): host for host in hosts for port in ports}
+	if not tasks:
+		return
+
+	found = set()
+	pending = set(tasks)
+	while pending:
+		remaining = deadline[0] - time.monotonic()
+		if remaining <= 0:
+			break
+
+		done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+		for task in done:
+			host = tasks[task]
+			if task.result() and host not in found:
+				found.add(host)
+				onFound(host)
+
+	for task in pending:
+		task.cancel()
+	await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _tcpProbe(host: str, port: int, semaphore: asyncio.Semaphore, timeout: float, limiter: Optional[RateLimiter], deadline: List[float]) -> bool:
+	async with semaphore:
+		if limiter:
+			delay = limiter.reserve()
+			if delay:
+				await asyncio.sleep(delay)
+			deadline[0] = max(deadline[0], time.monotonic() + timeout)
+
+		try:
+			_, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+		except (OSError, asyncio.TimeoutError):
+			return False
+
+		writer.close()
+		return True
+
+
+def icmpChecksum(data: bytes) -> int:
+	if len(data) % 2:
+		data += b'\x00'
+
+	total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+	total = (total >> 16) + (total & 0xFFFF)
+	total += total >> 16
+	return ~total & 0xFFFF
+
+
+def icmpEchoRequest(identifier: int, sequence: int, icmpType: int = ICMP_ECHO_REQUEST) -> bytes:
+	# For ICMPv6 the kernel overwrites the checksum, as it covers the IPv6 pseudo header
+	header = struct.pack('!BBHHH', icmpType, 0, 0, identifier, sequence)
+	checksum = icmpChecksum(header + ICMP_PAYLOAD)
+	return struct.pack('!BBHHH', icmpType, 0, checksum, identifier, sequence) + ICMP_PAYLOAD
+
+
+def parseEchoReply(data: bytes, replyType: int = ICMP_ECHO_REPLY) -> Optional[Tuple[int, int]]:
+	# Raw sockets, and datagram ones on some systems, hand over the IP header as well
+	if data and data[0] >> 4 == 4:
+		data = data[(data[0] & 0x0F) * 4:]
+
+	if len(data) < 8:
+		return None
+
+	icmpType, _, _, identifier, sequence = struct.unpack('!BBHHH', data[:8])
+	if icmpType != replyType:
+		return None
+
+	return identifier, sequence
+
+
+def openIcmpSocket(family: int = socket.AF_INET) -> socket.socket:
+	protocol = socket.IPPROTO_ICMPV6 if family == socket.AF_INET6 else socket.IPPROTO_ICMP
+	try:
+		# Unprivileged ICMP, Linux (ping_group_range permitting) and macOS
+		return socket.socket(family, socket.SOCK_DGRAM, protocol)
+	except OSError:
+		return socket.socket(family, socket.SOCK_RAW, protocol)
+
+
+def icmpSweep(hosts: Iterable[str], budget: float = SCAN_BUDGET, limiter: Optional[RateLimiter] = None) -> List[str]:
+	return list(icmpStream(hosts, budget=budget, limiter=limiter))
+
+
+def icmpStream(hosts: Iterable[str], budget: float = SCAN_BUDGET, limiter: Optional[RateLimiter] = None) -> Iterator[str]:
+	"""
+	Sends an echo request to every host in one burst and collects the replies in a single receive loop, matching them
+	by identifier and sequence. Raises OSError right away if neither a datagram nor a raw ICMP socket can be opened.
+	"""
+	hosts = list(dict.fromkeys(hosts))
+	if not hosts:
+		return iter(list())
+
+	sock = openIcmpSocket()
+	return _icmpReplies(sock, hosts, budget, limiter)
+
+
+def _icmpReplies(sock: socket.socket, hosts: List[str], budget: float, limiter: Optional[RateLimiter] = None) -> Generator[str, None, None]:
+	with sock:
+		sock.setblocking(False)
+		identifier = os.getpid() & 0xFFFF
+		identifiers = {identifier}
+		if sock.type == socket.SOCK_DGRAM:
+			# Linux replaces the identifier of datagram ICMP sockets with the local port
+			sock.bind(('', 0))
+			identifiers.add(sock.getsockname()[1] & 0xFFFF)
+
+		pending = {index & 0xFFFF: host for index, host in enumerate(hosts)}
+		toSend = 0
+		sendAt = 0.0
+		deadline = time.monotonic() + budget
+
+		while pending:
+			now = time.monotonic()
+			remaining = deadline - now
+			if remaining <= 0:
+				break
+
+			sending = toSend < len(hosts) and now >= sendAt
+			if toSend >= len(hosts):
+				waitFor = remaining
+			elif sending:
+				waitFor = min(remaining, ICMP_SEND_WAIT)  # Returns as soon as the socket is writable
+			else:
+				waitFor = min(remaining, sendAt - now)
+			readable, writable, _ = select.select([sock], [sock] if sending else [], [], waitFor)
+
+			if writable:
+				while toSend < len(hosts) and time.monotonic() >= sendAt:
+					try:
+						sock.sendto(icmpEchoRequest(identifier, toSend & 0xFFFF), (hosts[toSend], 0))
+					except OSError as e:
+						if isinstance(e, BlockingIOError) or e.errno == errno.ENOBUFS:
+							# Writable or not, there is no room for the request, retrying right away would spin
+							sendAt = time.monotonic() + ICMP_SEND_BACKOFF
+							break
+						pending.pop(toSend & 0xFFFF, None)  # Unroutable, no need to wait for it
+
+					toSend += 1
+					if limiter:
+						# A paced sweep must still leave the last requests time to be answered
+						deadline = max(deadline, time.monotonic() + ICMP_REPLY_TIMEOUT)
+						delay = limiter.reserve()
+						if delay:
+							sendAt = time.monotonic() + delay
+
+			if readable:
+				while True:
+					try:
+						data, (address, *_) = sock.recvfrom(1024)
+					except (BlockingIOError, InterruptedError):
+						break
+
+					reply = parseEchoReply(data)
+					if not reply or reply[0] not in identifiers:
+						continue
+
+					host = pending.get(reply[1])
+					if host == address:
+						pending.pop(reply[1])
+						yield host
+
+
+def ipv6Interfaces() -> Dict[int, str]:
+	stats = psutil.net_if_stats()
+	interfaces = dict()
+	for name, addresses in psutil.net_if_addrs().items():
+		if name not in stats or not stats[name].isup:
+			continue
+
+		if not any(address.family == socket.AF_INET6 and address.address.lower().startswith('fe80:') for address in addresses):
+			continue
+
+		try:
+			interfaces[socket.if_nametoindex(name)] = name
+		except OSError:
+			continue
+
+	return interfaces
+
+
+def localAddresses() -> set:
+	return {address.address.split('%')[0].lower() for addresses in psutil.net_if_addrs().values() for address in addresses}
+
+
+def multicastScan(budget: float = SCAN_BUDGET) -> List[str]:
+	"""
+	Sends one ICMPv6 echo request to the all nodes multicast address of every link-local capable interface and
+	collects whoever answers. Responders are mapped to an IPv4 address through the neighbor tables when possible,
+	otherwise their scoped link-local address is returned.
+	"""
+	interfaces = ipv6Interfaces()
+	if not interfaces:
+		return list()
+
+	ownAddresses = localAddresses()
+	responders: Dict[str, str] = dict()
+
+	sock = openIcmpSocket(socket.AF_INET6)
+	with sock:
+		sock.setblocking(False)
+		identifier = os.getpid() & 0xFFFF
+		identifiers = {identifier}
+		if sock.type == socket.SOCK_DGRAM:
+			sock.bind(('', 0))
+			identifiers.add(sock.getsockname()[1] & 0xFFFF)
+
+		for index in interfaces:
+			try:
+				sock.sendto(icmpEchoRequest(identifier, index & 0xFFFF, ICMPV6_ECHO_REQUEST), (ALL_NODES, 0, 0, index))
+			except OSError:
+				continue
+
+		deadline = time.monotonic() + budget
+		while True:
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				break
+
+			readable, _, _ = select.select([sock], [], [], remaining)
+			if not readable:
+				break
+
+			try:
+				data, address = sock.recvfrom(1024)
+			except (BlockingIOError, InterruptedError):
+				continue
+
+			reply = parseEchoReply(data, ICMPV6_ECHO_REPLY)
+			if not reply or reply[0] not in identifiers:
+				continue
+
+			host = address[0].split('%')[0].lower()
+			interface = interfaces.get(address[3]) or interfaces.get(reply[1])
+			if host not in ownAddresses and interface:
+				responders.setdefault(host, interface)
+
+	return mapToUsableAddresses(responders)
+
+
+def mapToUsableAddresses(linkLocals: Dict[str, str]) -> List[str]:
+	if not linkLocals:
+		return list()
+
+	neighbors = neighborTable()
+	macs = {neighbor.address.lower(): neighbor.mac for neighbor in neighbors if ':' in neighbor.address}
+	ipv4s = {neighbor.mac: neighbor.address for neighbor in neighbors if '.' in neighbor.address}
+
+	addresses = list()
+	for linkLocal, interface in linkLocals.items():
+		mac = macs.get(linkLocal) or eui64ToMac(linkLocal)
+		address = ipv4s.get(mac) if mac else None
+		addresses.append(address or f'{linkLocal}%{interface}')
+
+	return list(dict.fromkeys(addresses))
+
+
+def normalizeMac(mac: str) -> str:
+	return ':'.join(part.zfill(2) for part in re.split('[:-]', mac.lower()))
+
+
+def eui64ToMac(address: str) -> Optional[str]:
+	try:
+		interfaceId = ipaddress.IPv6Address(address.split('%')[0]).packed[8:]
+	except ValueError:
+		return None
+
+	if interfaceId[3:5] != b'\xff\xfe':
+		return None
+
+	mac = bytes([interfaceId[0] ^ 0x02]) + interfaceId[1:3] + interfaceId[5:]
+	return ':'.join(f'{byte:02x}' for byte in mac)
+
+
+def neighborTable(ipv6: bool = True) -> List[Neighbor]:
+	return _neighbors4() + (_neighbors6() if ipv6 else list())
+
+
+def _neighbors4() -> List[Neighbor]:
+	neighbors = list()
+	arp = Path('/proc/net/arp')
+	if arp.exists():
+		for line in arp.read_text().splitlines()[1:]:
+			parts = line.split()
+			if len(parts) < 6 or parts[2] == '0x0':
+				continue
+			neighbors.append(Neighbor(parts[0], normalizeMac(parts[3]), parts[5]))
+		return neighbors
+
+	for line in _runQuietly(['arp', '-an'] if platform.system().lower() != 'windows' else ['arp', '-a']):
+		match = ARP_LINE_REGEX.search(line)
+		if match:
+			neighbors.append(Neighbor(match.group('address'), normalizeMac(match.group('mac')), match.group('interface') or ''))
+
+	return neighbors
+
+
+def _neighbors6() -> List[Neighbor]:
+	neighbors = list()
+	system = platform.system().lower()
+	if system == 'linux':
+		for line in _runQuietly(['ip', '-6', 'neigh', 'show']):
+			match = IP_NEIGH_LINE_REGEX.search(line)
+			if match:
+				neighbors.append(Neighbor(match.group('address').lower(), normalizeMac(match.group('mac')), match.group('interface')))
+	elif system == 'darwin':
+		for line in _runQuietly(['ndp', '-an']):
+			match = NEIGHBOR6_LINE_REGEX.search(line)
+			if match:
+				neighbors.append(Neighbor(match.group('address').lower(), normalizeMac(match.group('mac')), match.group('interface')))
+
+	return neighbors
+
+
+def _runQuietly(command: List[str]) -> List[str]:
+	try:
+		return subprocess.run(command, capture_output=True, text=True, timeout=2).stdout.splitlines()
+	except (OSError, subprocess.SubprocessError):
+		return list()
@@ -0,0 +1,135 @@
+#  Copyright (c) 2021
+#
+#  This file, facts.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import json
+import paramiko
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional
+
+from AliceCli.utils import ssh
+
+
+FACTS_FILE = Path(Path.home(), '.pacli/facts.json')
+FACTS_TTL = 24 * 3600
+PROBE_TIMEOUT = 30
+DRIVER_SEEED = 'seeed-voicecard'
+_INTEGERS = {'captureDevices', 'diskFree', 'diskTotal'}
+_KIBIBYTES = {'diskFree', 'diskTotal'}
+_LOCK = Lock()
+
+# What each fact is made of, every probe may come out empty
+PROBES = {
+	'os'            : '$(. /etc/os-release 2>/dev/null && echo $PRETTY_NAME)',
+	'kernel'        : '$(uname -r)',
+	'hostname'      : '$(hostname)',
+	'addresses'     : '$(hostname -I)',
+	'aliceInstalled': '$(test -d ~/ProjectAlice/ && echo 1)',
+	'aliceVersion'  : '$(git -C ~/ProjectAlice/ describe --tags --always 2>/dev/null)',
+	'aliceHead'     : '$(git -C ~/ProjectAlice/ rev-parse HEAD 2>/dev/null)',
+	'soundDriver'   : f'$(test -d ~/{DRIVER_SEEED}/ && echo {DRIVER_SEEED})',
+	'captureDevices': '$(arecord -l 2>/dev/null | grep -c ^card)',
+	'diskFree'      : '$(df -Pk ~ | awk \'NR == 2 {print $4}\')',
+	'diskTotal'     : '$(df -Pk ~ | awk \'NR == 2 {print $2}\')'
+}
+
+# One round trip for everything, each probe prints a key=value line
+PROBE = '; '.join(f'echo "{key}={command}"' for key, command in PROBES.items())
+
+
+def gather(client: paramiko.SSHClient) -> dict:
+	return _run(client, PROBE)
+
+
+def probe(client: paramiko.SSHClient, key: str):
+	"""
+	A single fact, asked on its own. For when the device is too slow to answer the whole probe in time
+	"""
+	return _run(client, f'echo "{key}={PROBES[key]}"').get(key)
+
+
+def deviceFacts(address: str, client: Optional[paramiko.SSHClient] = None, refresh: bool = False, ttl: float = FACTS_TTL) -> dict:
+	"""
+	The facts about the device at address, from the cache when gathered less than ttl ago, otherwise probed through
+	client and cached. Commands changing the device invalidate its entry, so ttl only bounds changes made behind
+	our back. Without client, whatever is cached is returned, possibly nothing.
+	"""
+	with _LOCK:
+		cached = _read().get(address, dict())
+
+	if client is None or (not refresh and cached and time.time() - cached.get('gathered', 0) < ttl):
+		return cached.get('facts', dict())
+
+	facts = gather(client)
+	with _LOCK:
+		devices = _read()
+		devices[address] = {'gathered': time.time(), 'facts': facts}
+		_write(devices)
+	return facts
+
+
+def gatheredAt(address: str) -> float:
+	with _LOCK:
+		return _read().get(address, dict()).get('gathered', 0)
+
+
+def invalidate(address: str):
+	if not address:
+		return
+
+	with _LOCK:
+		devices = _read()
+		if devices.pop(address, None) is not None:
+			_write(devices)
+
+
+def _run(client: paramiko.SSHClient, command: str) -> dict:
+	with ssh.execute(client, command, timeout=PROBE_TIMEOUT) as remote:
+		output = remote.stdout.read().decode(errors='replace')
+		remote.wait()
+
+	facts = dict()
+	for line in output.splitlines():
+		key, _, value = line.partition('=')
+		value = value.strip()
+		if key in _INTEGERS:
+			facts[key] = (int(value) if value.isdigit() else 0) * (1024 if key in _KIBIBYTES else 1)
+		elif key == 'addresses':
+			facts[key] = value.split()
+		elif key == 'aliceInstalled':
+			facts[key] = value == '1'
+		elif key:
+			facts[key] = value
+	return facts
+
+
+def _read() -> Dict[str, dict]:
+	if not FACTS_FILE.exists():
+		return dict()
+
+	try:
+		return json.loads(FACTS_FILE.read_text()).get('devices', dict())
+	except (ValueError, AttributeError):
+		return dict()
+
+
+def _write(devices: Dict[str, dict]):
+	FACTS_FILE.parent.mkdir(parents=True, exist_ok=True)
+	temp = FACTS_FILE.with_suffix('.tmp')
+	temp.write_text(json.dumps({'devices': devices}, indent=4))
+	temp.replace(FACTS_FILE)
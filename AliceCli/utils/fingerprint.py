@@ -0,0 +1,194 @@
+#  Copyright (c) 2021
+#
+#  This file, fingerprint.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import asyncio
+import queue
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from AliceCli.utils import discovery, inventory
+
+
+SSH_PORT = 22
+WEB_INTERFACE_PORT = 5000
+WEB_INTERFACE_MARKER = 'project alice'  # In the title of the web interface pages
+WEB_PAGE_LIMIT = 8192
+PROBE_TIMEOUT = 1.0
+PROBE_CONCURRENCY = 64
+NEIGHBORS_REFRESH = 0.5
+FINGERPRINT_TTL = 3600
+KIND_ALICE = 'alice'
+KIND_RASPBERRY = 'raspberry'
+KIND_SSH = 'ssh'
+KIND_UNKNOWN = 'unknown'
+
+
+def classify(signals: dict) -> str:
+	banner = signals.get('banner', '').lower()
+	raspberry = discovery.isRaspberryMac(signals.get('mac', '')) or 'raspbian' in banner
+
+	if signals.get('aliceInterface') and (raspberry or banner):
+		return KIND_ALICE
+	elif raspberry:
+		return KIND_RASPBERRY
+	elif banner:
+		return KIND_SSH
+	return KIND_UNKNOWN
+
+
+def isCandidate(name: str, signals: Optional[dict] = None) -> bool:
+	signals = signals or dict()
+	return signals.get('kind') in {KIND_ALICE, KIND_RASPBERRY} or discovery.isAliceDevice(name, signals.get('mac', ''))
+
+
+def cachedSignals(device: dict, mac: str = '') -> Optional[dict]:
+	signals = device.get('signals')
+	if not signals or time.time() - signals.get('probed', 0) > FINGERPRINT_TTL:
+		return None
+
+	# Another device got that address, the cached signals are not his
+	if mac and signals.get('mac') and mac != signals['mac']:
+		return None
+
+	return signals
+
+
+def fingerprintHosts(hosts: Iterable[str], timeout: float = PROBE_TIMEOUT) -> Dict[str, dict]:
+	return dict(fingerprintStream(hosts, timeout=timeout))
+
+
+def fingerprintStream(hosts: Iterable[str], timeout: float = PROBE_TIMEOUT, concurrency: int = PROBE_CONCURRENCY) -> Iterator[Tuple[str, dict]]:
+	"""
+	Fingerprints hosts while they are being produced and yields (host, signals) as soon as a host is classified.
+	Banner read, web interface check and name lookup run concurrently, each bounded by timeout. Hosts probed less
+	than FINGERPRINT_TTL ago are answered from the inventory, and fresh results are written back to it.
+	"""
+	results = queue.Queue()
+	done = object()
+
+	def run():
+		try:
+			asyncio.run(_fingerprintAll(hosts, timeout, concurrency, results.put))
+		finally:
+			results.put(done)
+
+	Thread(target=run, daemon=True).start()
+	return iter(results.get, done)
+
+
+async def _fingerprintAll(hosts: Iterable[str], timeout: float, concurrency: int, onResult: Callable[[Tuple[str, dict]], None]):
+	loop = asyncio.get_running_loop()
+	semaphore = asyncio.Semaphore(max(1, concurrency))
+	resolver = ThreadPoolExecutor(max_workers=discovery.RESOLVE_WORKERS, thread_name_prefix='resolver')
+	known = inventory.loadInventory()
+	macs = dict()
+	macsRead = 0.0
+	fresh = dict()
+	tasks = set()
+
+	iterator = iter(hosts)
+	try:
+		while (host := await loop.run_in_executor(None, next, iterator, None)) is not None:
+			if host not in macs and time.monotonic() - macsRead > NEIGHBORS_REFRESH:
+				# The scan just talked to it, so the kernel most likely knows its MAC by now
+				macs.update({neighbor.address: neighbor.mac for neighbor in discovery.neighborTable()})
+				macsRead = time.monotonic()
+
+			signals = cachedSignals(known.get(host, dict()), macs.get(host, ''))
+			if signals:
+				onResult((host, signals))
+				continue
+
+			tasks.add(asyncio.ensure_future(_fingerprint(host, macs.get(host, ''), semaphore, resolver, timeout, fresh, onResult)))
+
+		await asyncio.gather(*tasks)
+	finally:
+		resolver.shutdown(wait=False)
+		if fresh:
+			inventory.recordDevices({host: signals['name'] for host, signals in fresh.items()}, signals=fresh)
+
+
+async def _fingerprint(host: str, mac: str, semaphore: asyncio.Semaphore, resolver: ThreadPoolExecutor, timeout: float, fresh: Dict[str, dict], onResult: Callable[[Tuple[str, dict]], None]):
+	async with semaphore:
+		banner, aliceInterface, name = await asyncio.gather(
+			readBanner(host, SSH_PORT, timeout),
+			isAliceInterface(host, WEB_INTERFACE_PORT, timeout),
+			_lookupName(host, resolver, timeout)
+		)
+
+	signals = {
+		'name'          : name,
+		'banner'        : banner,
+		'mac'           : mac,
+		'aliceInterface': aliceInterface,
+		'probed'        : time.time()
+	}
+	signals['kind'] = classify(signals)
+	fresh[host] = signals
+	onResult((host, signals))
+
+
+async def readBanner(host: str, port: int = SSH_PORT, timeout: float = PROBE_TIMEOUT) -> str:
+	try:
+		reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+	except (OSError, asyncio.TimeoutError):
+		return ''
+
+	try:
+		line = await asyncio.wait_for(reader.readline(), timeout=timeout)
+		return line.decode(errors='replace').strip() if line.startswith(b'SSH-') else ''
+	except (OSError, asyncio.TimeoutError):
+		return ''
+	finally:
+		writer.close()
+
+
+async def isAliceInterface(host: str, port: int = WEB_INTERFACE_PORT, timeout: float = PROBE_TIMEOUT) -> bool:
+	"""
+	Whether Alice's web interface answers on port, its home page naming Project Alice. An open port proves nothing,
+	macOS' AirPlay receiver and Flask development servers listen on 5000 too.
+	"""
+	try:
+		reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+	except (OSError, asyncio.TimeoutError):
+		return False
+
+	async def readPage() -> bytes:
+		writer.write(f'GET / HTTP/1.0\r\nHost: {host}\r\n\r\n'.encode())
+		page = b''
+		while len(page) < WEB_PAGE_LIMIT and (chunk := await reader.read(WEB_PAGE_LIMIT - len(page))):
+			page += chunk
+		return page
+
+	try:
+		page = await asyncio.wait_for(readPage(), timeout=timeout)
+		return WEB_INTERFACE_MARKER in page.decode(errors='replace').lower()
+	except (OSError, asyncio.TimeoutError):
+		return False
+	finally:
+		writer.close()
+
+
+async def _lookupName(host: str, resolver: ThreadPoolExecutor, timeout: float) -> str:
+	loop = asyncio.get_running_loop()
+	try:
+		return (await asyncio.wait_for(loop.run_in_executor(resolver, socket.gethostbyaddr, host), timeout=timeout))[0]
+	except (OSError, UnicodeError, asyncio.TimeoutError):
+		return ''
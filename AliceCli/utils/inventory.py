@@ -0,0 +1,188 @@
+#  Copyright (c) 2021
+#
+#  This file, inventory.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import json
+import time
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Sequence
+
+from AliceCli.utils import discovery
+
+
+INVENTORY_FILE = Path(Path.home(), '.pacli/inventory.json')
+INVENTORY_TTL = 600
+INVENTORY_EXPIRY = 30 * 24 * 3600
+REVALIDATION_BUDGET = 2.0
+CONNECT_TIME_WEIGHT = 0.3  # Of the latest connection in the running average
+_LOCK = Lock()
+
+
+def loadInventory() -> Dict[str, dict]:
+	with _LOCK:
+		return _read()
+
+
+def _read() -> Dict[str, dict]:
+	if not INVENTORY_FILE.exists():
+		return dict()
+
+	try:
+		devices = json.loads(INVENTORY_FILE.read_text()).get('devices', dict())
+	except (ValueError, AttributeError):
+		return dict()
+
+	now = time.time()
+	return {address: device for address, device in devices.items() if now - device.get('lastSeen', 0) < INVENTORY_EXPIRY}
+
+
+def _write(devices: Dict[str, dict]):
+	INVENTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+	temp = INVENTORY_FILE.with_suffix('.tmp')
+	temp.write_text(json.dumps({'devices': devices}, indent=4))
+	temp.replace(INVENTORY_FILE)
+
+
+def recordDevices(found: Dict[str, str], signals: Optional[Dict[str, dict]] = None, interfaces: Optional[Dict[str, str]] = None) -> Dict[str, dict]:
+	"""
+	Merges freshly seen devices, given as {address: name}, into the inventory and returns the updated inventory.
+	signals optionally holds the fingerprint probes results per address, cached along with the device, and
+	interfaces the local interface each address was found on.
+	"""
+	macs = _macs(ipv6=any(':' in address for address in found)) if found else dict()
+	signals = signals or dict()
+	interfaces = interfaces or dict()
+	now = time.time()
+
+	with _LOCK:
+		devices = _read()
+		for address, name in found.items():
+			device = devices.setdefault(address, dict())
+			device['name'] = name or device.get('name', '')
+			device['lastSeen'] = now
+			device['fingerprint'] = macs.get(address, device.get('fingerprint', ''))
+			if address in signals:
+				device['signals'] = signals[address]
+			if interfaces.get(address):
+				device['interface'] = interfaces[address]
+		_write(devices)
+
+	return devices
+
+
+def forgetDevices(addresses: Sequence[str]):
+	with _LOCK:
+		devices = _read()
+		for address in addresses:
+			devices.pop(address, None)
+		_write(devices)
+
+
+def rememberAddresses(address: str, addresses: Sequence[str]):
+	"""
+	Records that the device at address is reachable at addresses as well, as reported by the device itself. Every
+	address of the group knows about all the others.
+	"""
+	group = list(dict.fromkeys([address, *addresses]))
+	now = time.time()
+	with _LOCK:
+		devices = _read()
+		for member in group:
+			if member not in devices and member != address:
+				continue  # Not seen on the network yet, it joins when it is
+
+			device = devices.setdefault(member, {'name': '', 'lastSeen': now, 'fingerprint': ''})
+			device['addresses'] = [other for other in group if other != member]
+		_write(devices)
+
+
+def addressesOf(address: str) -> List[str]:
+	"""
+	All the known addresses of the device at address: the ones it reported and the ones sharing its MAC, an IPv6
+	address derived from it for example. Sorted by how fast they usually connect, unmeasured ones last. Reported
+	addresses are only kept once seen on the network or when in one of our subnets, a device reports its docker
+	bridge or VPN addresses too, which lead to other hosts from here.
+	"""
+	devices = loadInventory()
+	device = devices.get(address, dict())
+	mac = device.get('fingerprint')
+	local = list(discovery.localNetworks())
+	known = [address, *(other for other in device.get('addresses', list()) if other in devices or discovery.inNetworks(other, local))]
+	known.extend(other for other, entry in devices.items() if mac and entry.get('fingerprint') == mac)
+	times = {member: devices.get(member, dict()).get('connectTime') for member in dict.fromkeys(known)}
+	return sorted(times, key=lambda member: (times[member] is None, times[member] or 0.0))
+
+
+def recordHostKey(address: str, hostKey: str):
+	"""
+	The host key the device at address presented, what its other addresses have to present too before we log in
+	through them
+	"""
+	with _LOCK:
+		devices = _read()
+		devices.setdefault(address, {'name': '', 'lastSeen': time.time(), 'fingerprint': ''})['hostKey'] = hostKey
+		_write(devices)
+
+
+def hostKeyOf(address: str) -> str:
+	return loadInventory().get(address, dict()).get('hostKey', '')
+
+
+def recordConnectTime(address: str, seconds: float):
+	with _LOCK:
+		devices = _read()
+		if address not in devices:
+			return
+
+		previous = devices[address].get('connectTime')
+		devices[address]['connectTime'] = seconds if previous is None else previous + CONNECT_TIME_WEIGHT * (seconds - previous)
+		_write(devices)
+
+
+def staleDevices(devices: Dict[str, dict], ttl: float = INVENTORY_TTL) -> List[str]:
+	now = time.time()
+	return [address for address, device in devices.items() if now - device.get('lastSeen', 0) >= ttl]
+
+
+def revalidate(addresses: Sequence[str], ports: Sequence[int] = (22,)):
+	"""
+	Probes the given known devices and refreshes the ones still answering. A device whose fingerprint changed is
+	not the same device anymore, its entry is replaced by whatever answers on that address now.
+	"""
+	alive = discovery.tcpScan(addresses, ports=ports, budget=REVALIDATION_BUDGET)
+	if not alive:
+		return
+
+	known = loadInventory()
+	macs = _macs()
+	names = dict(discovery.resolveHosts(alive))
+	changed = [address for address in alive if known.get(address, dict()).get('fingerprint') and macs.get(address) and macs[address] != known[address]['fingerprint']]
+	forgetDevices(changed)
+	recordDevices({address: names.get(address, known.get(address, dict()).get('name', '')) for address in alive})
+
+
+def revalidateInBackground(addresses: Sequence[str], ports: Sequence[int] = (22,)) -> Optional[Thread]:
+	if not addresses:
+		return None
+
+	thread = Thread(target=revalidate, args=(list(addresses), ports), daemon=True)
+	thread.start()
+	return thread
+
+
+def _macs(ipv6: bool = True) -> Dict[str, str]:
+	return {neighbor.address: neighbor.mac for neighbor in discovery.neighborTable(ipv6=ipv6)}
@@ -0,0 +1,116 @@
+#  Copyright (c) 2021
+#
+#  This file, keys.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import uuid
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from pathlib import Path
+from threading import Lock, Thread
+
+
+KEY_POOL_DIR = Path(Path.home(), '.pacli/keys')
+KEY_POOL_SIZE = 2
+KEY_ED25519 = 'ed25519'
+KEY_RSA = 'rsa'
+KEY_TYPES = [KEY_ED25519, KEY_RSA]
+RSA_BITS = 4096
+KEY_COMMENT = 'Project Alice key'
+_FILL_LOCK = Lock()
+
+
+def generateKey(keyType: str = KEY_ED25519) -> bytes:
+	"""
+	Returns a new private key in the OpenSSH format. Ed25519 keys take microseconds, RSA ones seconds, hence the pool
+	"""
+	if keyType == KEY_RSA:
+		key = rsa.generate_private_key(public_exponent=65537, key_size=RSA_BITS)
+	else:
+		key = ed25519.Ed25519PrivateKey.generate()
+
+	return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.OpenSSH, serialization.NoEncryption())
+
+
+def publicKey(privateKey: bytes, comment: str = KEY_COMMENT) -> str:
+	key = serialization.load_ssh_private_key(privateKey, password=None)
+	return f'{key.public_key().public_bytes(serialization.Encoding.OpenSSH, serialization.PublicFormat.OpenSSH).decode()} {comment}'
+
+
+def takeKey(keyType: str = KEY_ED25519) -> bytes:
+	"""
+	Hands out a pregenerated key from the pool, or generates one on the spot if the pool is empty
+	"""
+	for pooled in sorted(KEY_POOL_DIR.glob(f'{keyType}_*')):
+		claimed = pooled.with_name(f'claimed_{uuid.uuid4().hex}')
+		try:
+			# Another process may be claiming the same key, only one rename wins
+			pooled.rename(claimed)
+		except OSError:
+			continue
+
+		try:
+			return claimed.read_bytes()
+		finally:
+			claimed.unlink()
+
+	return generateKey(keyType)
+
+
+def fillPool(keyType: str = KEY_ED25519, size: int = KEY_POOL_SIZE):
+	with _FILL_LOCK:
+		KEY_POOL_DIR.mkdir(parents=True, exist_ok=True)
+		KEY_POOL_DIR.chmod(0o700)
+		for _ in range(size - len(list(KEY_POOL_DIR.glob(f'{keyType}_*')))):
+			name = f'{keyType}_{uuid.uuid4().hex}'
+			temp = Path(KEY_POOL_DIR, f'.{name}')
+			_writePrivate(temp, generateKey(keyType))
+			temp.rename(Path(KEY_POOL_DIR, name))
+
+
+def fillPoolInBackground(keyType: str = KEY_ED25519, size: int = KEY_POOL_SIZE) -> Thread:
+	thread = Thread(target=fillPool, args=(keyType, size), daemon=True)
+	thread.start()
+	return thread
+
+
+def installKey(keyFile: Path, keyType: str = KEY_ED25519) -> str:
+	"""
+	Writes a key from the pool to keyFile, and its public part next to it, and returns the public key line
+	"""
+	privateKey = takeKey(keyType)
+	public = publicKey(privateKey)
+	_writePrivate(keyFile, privateKey)
+	publicKeyFile(keyFile).write_text(f'{public}\n')
+	return public
+
+
+def publicKeyFile(keyFile: Path) -> Path:
+	return keyFile.with_name(f'{keyFile.name}.pub')
+
+
+def isLegacyKey(server: dict) -> bool:
+	"""
+	Servers set up before the key type was recorded use a 4096 bits RSA key named id_rsa_<address>
+	"""
+	return bool(server.get('keyFile')) and not server.get('keyType')
+
+
+def _writePrivate(keyFile: Path, privateKey: bytes):
+	keyFile.parent.mkdir(parents=True, exist_ok=True)
+	descriptor = os.open(str(keyFile), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+	with os.fdopen(descriptor, 'wb') as f:
+		f.write(privateKey)
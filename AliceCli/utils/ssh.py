@@ -0,0 +1,688 @@
+#  Copyright (c) 2021
+#
+#  This file, ssh.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import paramiko
+import queue
+import re
+import secrets
+import select
+import socket
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from threading import RLock, Thread, Timer
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from AliceCli.utils import configs
+
+
+AUTH_TIMEOUT = 5.0
+AUTH_WORKERS = 32
+AUTH_READY = 'ready'
+AUTH_PASSWORD = 'password'
+AUTH_REFUSED = 'refused'
+DEFAULT_USER = 'pi'
+KEY_CLASSES = (paramiko.Ed25519Key, paramiko.RSAKey, paramiko.ECDSAKey)
+SESSION_LIMIT = 4
+KEEPALIVE_INTERVAL = 15
+CHANNEL_LIMIT = 8  # OpenSSH refuses more than MaxSessions, 10 by default, channels per connection
+STDOUT = 'stdout'
+STDERR = 'stderr'
+CHUNK_SIZE = 32768
+MAX_LINE = 65536
+STEP_MARKER = '__pacli_step__'
+PORT_POLL_INTERVAL = 0.5
+BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+CANCEL_SIGNAL = 'TERM'
+RACE_DELAY = 0.25  # RFC 8305 connection attempt delay
+TIMEOUT_STATUS = 124  # What timeout(1) exits with
+
+
+class SessionPool:
+	"""
+	Authenticated SSH sessions, one per device, kept open so that switching between devices does not cost a new
+	handshake. The least recently used session is closed when more than limit are open. One of the sessions is the
+	current one, the device the CLI commands run against.
+	"""
+
+	def __init__(self, limit: int = SESSION_LIMIT, keepalive: int = KEEPALIVE_INTERVAL):
+		self.limit = max(1, limit)
+		self.keepalive = keepalive
+		self._sessions: Dict[str, paramiko.SSHClient] = OrderedDict()
+		self._current = ''
+		self._lock = RLock()
+
+
+	@property
+	def current(self) -> str:
+		with self._lock:
+			return self._current if self.session(self._current) else ''
+
+
+	def session(self, address: str = '') -> Optional[paramiko.SSHClient]:
+		"""
+		Returns the live session to address, or to the current device if no address is given, None if there is none
+		"""
+		with self._lock:
+			address = address or self._current
+			client = self._sessions.get(address)
+			if not client:
+				return None
+
+			if not isAlive(client):
+				self._discard(address)
+				return None
+
+			self._sessions.move_to_end(address)
+			return client
+
+
+	def add(self, address: str, client: paramiko.SSHClient, activate: bool = True):
+		transport = client.get_transport()
+		if transport and self.keepalive:
+			transport.set_keepalive(self.keepalive)
+
+		evicted = list()
+		with self._lock:
+			previous = self._sessions.pop(address, None)
+			if previous and previous is not client:
+				evicted.append(previous)
+
+			self._sessions[address] = client
+			if activate:
+				self._current = address
+
+			while len(self._sessions) > self.limit:
+				oldest = next(iter(self._sessions))
+				if oldest == self._current:
+					self._sessions.move_to_end(oldest)
+					oldest = next(iter(self._sessions))
+				evicted.append(self._sessions.pop(oldest))
+
+		# Closing can block on the network, do not hold the other threads back meanwhile
+		for client in evicted:
+			client.close()
+
+
+	def activate(self, address: str) -> bool:
+		with self._lock:
+			if not self.session(address):
+				return False
+			self._current = address
+			return True
+
+
+	def close(self, address: str = '') -> bool:
+		with self._lock:
+			address = address or self._current
+			client = self._discard(address)
+
+		if not client:
+			return False
+
+		client.close()
+		return True
+
+
+	def closeAll(self):
+		with self._lock:
+			clients = list(self._sessions.values())
+			self._sessions.clear()
+			self._current = ''
+
+		for client in clients:
+			client.close()
+
+
+	def addresses(self) -> List[str]:
+		with self._lock:
+			return [address for address, client in self._sessions.items() if isAlive(client)]
+
+
+	def __contains__(self, address: str) -> bool:
+		return self.session(address) is not None
+
+
+	def __len__(self) -> int:
+		return len(self.addresses())
+
+
+	def _discard(self, address: str) -> Optional[paramiko.SSHClient]:
+		client = self._sessions.pop(address, None)
+		if address == self._current:
+			self._current = ''
+		return client
+
+
+class CommandInterrupted(Exception):
+	"""
+	The command got stopped before it ended, the channel is closed and the remote process signaled
+	"""
+	pass
+
+
+class CommandTimeout(CommandInterrupted):
+	pass
+
+
+class RemoteCommand:
+	"""
+	A command running on its own channel. Any number of them can share the transport of a session, each with its
+	own input, output and exit status.
+
+	timeout is a deadline in seconds for the whole command and idleTimeout the longest it may stay silent. Either
+	one expiring cancels the command, and reading its output or waiting for it then raises CommandTimeout.
+	"""
+
+	def __init__(self, client: paramiko.SSHClient, command: str, pty: bool = False, window: Optional[int] = None, timeout: Optional[float] = None, idleTimeout: Optional[float] = None):
+		self.command = command
+		self.pty = pty
+		self.idleTimeout = idleTimeout
+		self.reason = ''
+		self.channel = client.get_transport().open_session(window_size=window)  # None is the transport's, set by its profile
+		if pty:
+			self.channel.get_pty()
+		if idleTimeout:
+			self.channel.settimeout(idleTimeout)  # Blocking reads of the files below give up too
+		self.channel.exec_command(command)
+		self.stdin = self.channel.makefile_stdin('wb')
+		self.stdout = self.channel.makefile('r')
+		self.stderr = self.channel.makefile_stderr('r')
+
+		self._timer = None
+		if timeout:
+			self._timer = Timer(timeout, self.cancel, kwargs={'reason': f'Deadline of {timeout:g}s exceeded'})
+			self._timer.daemon = True
+			self._timer.start()
+
+
+	@property
+	def done(self) -> bool:
+		return self.channel.exit_status_ready()
+
+
+	def lines(self, chunkSize: int = CHUNK_SIZE) -> Iterator[Tuple[str, str]]:
+		"""
+		Yields (stream, line) for stdout and stderr as the output arrives, reading it in chunks of up to chunkSize
+		bytes. Nothing is read ahead of the consumer: when it falls behind, the channel window fills up and the
+		remote command is held back, so memory stays bounded by the window whatever the amount of output.
+		"""
+		receive = {STDOUT: self.channel.recv, STDERR: self.channel.recv_stderr}
+		ready = {STDOUT: self.channel.recv_ready, STDERR: self.channel.recv_stderr_ready}
+		partials = {STDOUT: b'', STDERR: b''}
+		lastOutput = time.monotonic()
+
+		try:
+			while True:
+				received = False
+				for stream in (STDERR, STDOUT):
+					if not ready[stream]():
+						continue
+
+					data = receive[stream](chunkSize)
+					if not data:
+						continue
+
+					received = True
+					*complete, partials[stream] = (partials[stream] + data).split(b'\n')
+					for line in complete:
+						yield stream, line.decode(errors='replace') + '\n'
+
+					if len(partials[stream]) >= MAX_LINE:
+						yield stream, partials[stream].decode(errors='replace')
+						partials[stream] = b''
+
+				if received:
+					lastOutput = time.monotonic()
+					continue
+
+				if self.channel.eof_received or self.channel.closed:
+					if not self.channel.recv_ready() and not self.channel.recv_stderr_ready():
+						break
+					continue
+
+				wait = 1.0
+				if self.idleTimeout:
+					silence = time.monotonic() - lastOutput
+					if silence >= self.idleTimeout:
+						self.cancel(f'No output for {self.idleTimeout:g}s')
+						continue
+					wait = min(wait, self.idleTimeout - silence)
+
+				select.select([self.channel], [], [], wait)
+		except KeyboardInterrupt:
+			self.cancel('Cancelled')
+			raise
+
+		for stream, partial in partials.items():
+			if partial:
+				yield stream, partial.decode(errors='replace')
+
+		if self.reason:
+			raise CommandTimeout(self.reason)
+
+
+	def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+		"""
+		Waits for the command to exit and returns its exit status, None if it still runs after timeout seconds
+		"""
+		try:
+			if not self.channel.status_event.wait(timeout):
+				return None
+		except KeyboardInterrupt:
+			self.cancel('Cancelled')
+			raise
+
+		if self.reason:
+			raise CommandTimeout(self.reason)
+		return self.channel.exit_status
+
+
+	def cancel(self, reason: str = 'Cancelled'):
+		"""
+		Stops the command: the remote process is signaled, interrupted as well if it runs in a pseudo terminal, and
+		the channel closed, which wakes up whoever reads the output or waits for the command.
+		"""
+		if self.channel.closed or self.channel.exit_status_ready():
+			return
+
+		self.reason = reason
+		try:
+			if self.pty:
+				self.channel.sendall(b'\x03')
+			self._signal(CANCEL_SIGNAL)
+		except (OSError, EOFError, paramiko.SSHException):
+			pass  # The link is gone, closing is all we can do
+		self.channel.close()
+
+
+	def close(self):
+		if self._timer:
+			self._timer.cancel()
+		self.channel.close()
+
+
+	def _signal(self, name: str):
+		# RFC 4254 signal request, OpenSSH honors it since 7.9 but paramiko has no public API for it
+		message = paramiko.Message()
+		message.add_byte(paramiko.common.cMSG_CHANNEL_REQUEST)
+		message.add_int(self.channel.remote_chanid)
+		message.add_string('signal')
+		message.add_boolean(False)
+		message.add_string(name)
+		self.channel.transport._send_user_message(message)
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, excType, *_):
+		if excType is not None:
+			self.cancel('Cancelled')  # Nobody is reading anymore, Ctrl-C or a crash, do not leave the command running
+		self.close()
+
+
+def execute(client: paramiko.SSHClient, command: str, pty: bool = False, timeout: Optional[float] = None, idleTimeout: Optional[float] = None) -> RemoteCommand:
+	return RemoteCommand(client, command, pty, timeout=timeout, idleTimeout=idleTimeout)
+
+
+def runConcurrently(client: paramiko.SSHClient, commands: Sequence[str], onLine: Optional[Callable[[int, str, str], None]] = None, timeout: Optional[float] = None, idleTimeout: Optional[float] = None) -> List[int]:
+	"""
+	Runs commands side by side, each on its own channel of the client's transport, and returns their exit statuses
+	in order. onLine(index, stream, line) is called from the reading threads for every output line, stream being
+	STDOUT or STDERR. A command stopped by timeout or idleTimeout gets TIMEOUT_STATUS.
+	"""
+	def run(index: int, command: str) -> int:
+		with execute(client, command, timeout=timeout, idleTimeout=idleTimeout) as remote:
+			try:
+				for stream, line in remote.lines():
+					if onLine:
+						onLine(index, stream, line)
+				return remote.wait()
+			except CommandTimeout:
+				return TIMEOUT_STATUS
+
+	if not commands:
+		return list()
+
+	with ThreadPoolExecutor(max_workers=min(CHANNEL_LIMIT, len(commands)), thread_name_prefix='channel') as executor:
+		return list(executor.map(run, range(len(commands)), commands))
+
+
+class Step(NamedTuple):
+	command: str
+	description: str = ''
+	hide: bool = False
+	stopOnError: bool = False
+
+
+class StepResult(NamedTuple):
+	step: Step
+	exitStatus: Optional[int]  # None if the step never ran
+	duration: float
+
+
+def buildScript(steps: Sequence[Step], marker: str = STEP_MARKER) -> str:
+	"""
+	Chains the steps into one shell script. Each step runs in its own subshell, so it starts in the home directory
+	like a lone command would, with no input, and is framed by markers carrying its index and exit status.
+	"""
+	lines = list()
+	for index, step in enumerate(steps):
+		lines.append(f'echo {marker} start {index}')
+		lines.append(f'(\n{step.command}\n) < /dev/null')
+		lines.append(f'status=$?; echo {marker} end {index} $status')
+		if step.stopOnError:
+			lines.append('[ $status -eq 0 ] || exit $status')
+	return '\n'.join(lines) + '\n'
+
+
+def runScript(client: paramiko.SSHClient, steps: Sequence[Step], onStart: Optional[Callable[[int, Step], None]] = None, onLine: Optional[Callable[[int, str, str], None]] = None, onEnd: Optional[Callable[[StepResult], None]] = None, timeout: Optional[float] = None, idleTimeout: Optional[float] = None) -> List[StepResult]:
+	"""
+	Runs the steps as one script over a single channel, instead of paying a channel and a round trip per command.
+	The step markers are taken out of the output and turned into onStart, onEnd and the returned results. Steps a
+	stopOnError step prevented from running are reported with an exit status of None. timeout and idleTimeout
+	apply to the whole script, a step they stop is reported with TIMEOUT_STATUS and the following ones with None.
+	"""
+	results: List[Optional[StepResult]] = [None] * len(steps)
+	current = -1
+	running = False
+	started = 0.0
+	# Unique to the run, so that no step output can pass for a marker
+	marker = f'{STEP_MARKER}{secrets.token_hex(8)}'
+	markerRegex = re.compile(rf'{marker} (?:start (?P<start>\d+)|end (?P<end>\d+) (?P<status>\d+))\s*$')
+
+	with execute(client, buildScript(steps, marker), timeout=timeout, idleTimeout=idleTimeout) as remote:
+		try:
+			for stream, line in remote.lines():
+				match = markerRegex.search(line) if stream == STDOUT else None
+				index = int(match['start'] or match['end']) if match else -1
+				if not 0 <= index < len(steps):
+					# Stderr is not in sync with the markers, late lines belong to the step that just ended
+					if onLine and current >= 0:
+						onLine(current, stream, line)
+					continue
+
+				if match.start() > 0 and onLine and current >= 0:
+					# The step output did not end with a new line
+					onLine(current, stream, line[:match.start()])
+
+				if match['start']:
+					current, running, started = index, True, time.monotonic()
+					if onStart:
+						onStart(index, steps[index])
+				else:
+					results[index] = StepResult(steps[index], int(match['status']), time.monotonic() - started)
+					running = False
+					if onEnd:
+						onEnd(results[index])
+
+			remote.wait()
+		except CommandTimeout:
+			if running:
+				results[current] = StepResult(steps[current], TIMEOUT_STATUS, time.monotonic() - started)
+				if onEnd:
+					onEnd(results[current])
+
+	return [result or StepResult(step, None, 0.0) for step, result in zip(steps, results)]
+
+
+def isAlive(client: paramiko.SSHClient) -> bool:
+	transport = client.get_transport()
+	return transport is not None and transport.is_active()
+
+
+def loadPrivateKey(keyFile: Path) -> paramiko.PKey:
+	error = None
+	for keyClass in KEY_CLASSES:
+		try:
+			return keyClass.from_private_key_file(str(keyFile))
+		except (paramiko.SSHException, ValueError) as e:
+			error = e
+	raise paramiko.SSHException(f'Unsupported private key {keyFile}: {error}')
+
+
+def openSession(address: str, port: int = 22, timeout: float = AUTH_TIMEOUT, confs: dict = None, profile: Optional[dict] = None, addresses: Sequence[str] = (), hostKey: str = '') -> paramiko.SSHClient:
+	"""
+	Connects to a device with its stored key, for callers that cannot prompt for a password. The transport profile
+	saved for the device is used unless one is given. With addresses, all known addresses of the device, and its
+	host key, the one answering first carries the session, see connectDevice.
+	"""
+	server = configs.serverConfig(address, confs)
+	keyFile = configs.keyFilePath(server)
+	if not keyFile:
+		raise paramiko.AuthenticationException(f'No key stored for {address}, connect to it once with a password first')
+
+	profile = profile if profile is not None else server.get('profile')
+	client = paramiko.SSHClient()
+	client.set_missing_host_key_policy(paramiko.AutoAddPolicy)
+	connectDevice(client, address, port, addresses, hostKey, timeout, username=server.get('user', DEFAULT_USER), pkey=loadPrivateKey(keyFile), look_for_keys=False, allow_agent=False, **profileOptions(profile))
+	applyProfile(client, profile)
+	return client
+
+
+def connectDevice(client: paramiko.SSHClient, address: str, port: int = 22, addresses: Sequence[str] = (), hostKey: str = '', timeout: Optional[float] = None, **options) -> Tuple[str, Optional[float]]:
+	"""
+	Connects client to the device at address, racing all its known addresses, see raceConnect. Credentials only go
+	to another address than address once it presented hostKey, the key recorded for address, and no race is run
+	without it. A winner presenting another key is dropped and address is connected to directly. Returns the address
+	connected through and how long its TCP connection took, None if there was no race.
+	"""
+	if len(addresses) > 1 and hostKey:
+		path, sock, elapsed = raceConnect(addresses, port, timeout or AUTH_TIMEOUT)
+		if path == address:
+			client.connect(hostname=address, port=port, timeout=timeout, sock=sock, **options)
+			return path, elapsed
+
+		entry = paramiko.hostkeys.HostKeyEntry.from_line(f'{hostKeyName(address, port)} {hostKey}')
+		client.get_host_keys().add(entry.hostnames[0], entry.key.get_name(), entry.key)
+		try:
+			client.connect(hostname=address, port=port, timeout=timeout, sock=sock, **options)
+			return path, elapsed
+		except paramiko.BadHostKeyException:
+			client.close()  # Some other host answering on an address the device once had
+		finally:
+			client.get_host_keys().clear()
+
+	client.connect(hostname=address, port=port, timeout=timeout, **options)
+	return address, None
+
+
+def hostKeyName(address: str, port: int = 22) -> str:
+	return address if port == 22 else f'[{address}]:{port}'
+
+
+def serverKey(client: paramiko.SSHClient) -> str:
+	"""
+	The host key the device presented, as recorded in known_hosts files: key type and base64 data
+	"""
+	key = client.get_transport().get_remote_server_key()
+	return f'{key.get_name()} {key.get_base64()}'
+
+
+def raceConnect(addresses: Sequence[str], port: int = 22, timeout: float = AUTH_TIMEOUT, delay: float = RACE_DELAY) -> Tuple[str, socket.socket, float]:
+	"""
+	Happy Eyeballs, RFC 8305: TCP connects to the addresses of one device in the given order, each one started delay
+	seconds after the previous one, or as soon as it failed. The first connection established wins and is returned
+	as (address, socket, seconds it took), the others are closed as they come. Raises OSError if none connects.
+	"""
+	results = queue.Queue()
+
+	def attempt(address: str):
+		started = time.monotonic()
+		try:
+			results.put((address, socket.create_connection((address, port), timeout=timeout), time.monotonic() - started))
+		except OSError as e:
+			results.put((address, None, e))
+
+	def closeLosers(count: int):
+		for _ in range(count):
+			_, sock, _ = results.get()
+			if sock:
+				sock.close()
+
+	remaining = list(dict.fromkeys(addresses))
+	pending = 0
+	errors = dict()
+	while remaining or pending:
+		if remaining:
+			Thread(target=attempt, args=(remaining.pop(0),), daemon=True).start()
+			pending += 1
+
+		try:
+			address, sock, outcome = results.get(timeout=delay if remaining else None)
+		except queue.Empty:
+			continue  # Too slow, give the next address its chance too
+
+		pending -= 1
+		if sock:
+			sock.settimeout(None)
+			Thread(target=closeLosers, args=(pending,), daemon=True).start()
+			return address, sock, outcome
+		errors[address] = outcome
+
+	raise OSError(f'No address answered on port {port}: ' + ', '.join(f'{address} ({error})' for address, error in errors.items()))
+
+
+def profileOptions(profile: Optional[dict]) -> dict:
+	"""
+	SSHClient.connect arguments enforcing the cipher and compression of a transport profile
+	"""
+	if not profile:
+		return dict()
+
+	options = {'compress': profile.get('compress', False)}
+	if profile.get('cipher') in supportedCiphers():
+		options['disabled_algorithms'] = {'ciphers': [cipher for cipher in supportedCiphers() if cipher != profile['cipher']]}
+	return options
+
+
+def applyProfile(client: paramiko.SSHClient, profile: Optional[dict]):
+	"""
+	Sets the window and packet sizes of a transport profile, for the channels opened from now on
+	"""
+	transport = client.get_transport()
+	if not profile or not transport:
+		return
+
+	transport.default_window_size = profile.get('window', transport.default_window_size)
+	transport.default_max_packet_size = profile.get('packet', transport.default_max_packet_size)
+
+
+def supportedCiphers() -> Tuple[str, ...]:
+	# noinspection PyProtectedMember
+	return paramiko.Transport._preferred_ciphers
+
+
+def waitForPort(address: str, port: int = 22, timeout: float = 60, interval: float = PORT_POLL_INTERVAL) -> bool:
+	"""
+	Polls until address accepts TCP connections on port, for at most timeout seconds
+	"""
+	deadline = time.monotonic() + timeout
+	while (remaining := deadline - time.monotonic()) > 0:
+		try:
+			with socket.create_connection((address, port), timeout=min(AUTH_TIMEOUT, remaining)):
+				return True
+		except OSError:
+			time.sleep(max(0.0, min(interval, deadline - time.monotonic())))
+	return False
+
+
+def waitForPortClosed(address: str, port: int = 22, timeout: float = 60, interval: float = PORT_POLL_INTERVAL) -> bool:
+	"""
+	Polls until address stops accepting TCP connections on port, for at most timeout seconds
+	"""
+	deadline = time.monotonic() + timeout
+	while (remaining := deadline - time.monotonic()) > 0:
+		try:
+			with socket.create_connection((address, port), timeout=min(AUTH_TIMEOUT, remaining)):
+				pass
+		except OSError:
+			return True
+		time.sleep(max(0.0, min(interval, deadline - time.monotonic())))
+	return False
+
+
+def bootId(client: paramiko.SSHClient) -> Optional[str]:
+	"""
+	The kernel draws a new boot id at every boot, telling a rebooted device from one that did not go down yet. None
+	if the device does not tell, not running Linux for example.
+	"""
+	with execute(client, f'cat {BOOT_ID_FILE}') as remote:
+		output = remote.stdout.read().decode(errors='replace').strip()
+		return output if remote.wait() == 0 and output else None
+
+
+def checkAuthentication(address: str, port: int = 22, timeout: float = AUTH_TIMEOUT, confs: dict = None) -> str:
+	"""
+	Tries the stored key of the device without opening a session and tells whether it is ready to use, needs a
+	password or refuses us altogether. Everything, from TCP connect to authentication, is bounded by timeout.
+	"""
+	server = configs.serverConfig(address, confs)
+	user = server.get('user', DEFAULT_USER)
+	keyFile = configs.keyFilePath(server)
+
+	try:
+		sock = socket.create_connection((address, port), timeout=timeout)
+	except OSError:
+		return AUTH_REFUSED
+
+	transport = paramiko.Transport(sock)
+	transport.banner_timeout = timeout
+	transport.auth_timeout = timeout
+	try:
+		transport.start_client(timeout=timeout)
+
+		if keyFile:
+			try:
+				transport.auth_publickey(user, loadPrivateKey(keyFile))
+				if transport.is_authenticated():
+					return AUTH_READY
+			except paramiko.AuthenticationException:
+				pass  # Stale key, let's see if a password would do
+
+		try:
+			transport.auth_none(user)
+			return AUTH_READY if transport.is_authenticated() else AUTH_REFUSED
+		except paramiko.BadAuthenticationType as e:
+			return AUTH_PASSWORD if 'password' in e.allowed_types or 'keyboard-interactive' in e.allowed_types else AUTH_REFUSED
+	except (paramiko.SSHException, OSError, EOFError):
+		return AUTH_REFUSED
+	finally:
+		transport.close()
+
+
+def checkAuthentications(addresses: Iterable[str], port: int = 22, timeout: float = AUTH_TIMEOUT) -> Iterator[Tuple[str, str]]:
+	"""
+	Runs checkAuthentication for every address in parallel and yields (address, status) as they complete, so that
+	the whole batch costs about one handshake
+	"""
+	addresses = list(dict.fromkeys(addresses))
+	if not addresses:
+		return
+
+	confs = configs.loadConfigs()
+	with ThreadPoolExecutor(max_workers=min(AUTH_WORKERS, len(addresses)), thread_name_prefix='auth') as executor:
+		futures = {executor.submit(checkAuthentication, address, port, timeout, confs): address for address in addresses}
+		for future in as_completed(futures):
+			yield futures[future], future.result()
+
+
+def authenticationStatuses(addresses: Iterable[str], port: int = 22, timeout: float = AUTH_TIMEOUT) -> Dict[str, str]:
+	return dict(checkAuthentications(addresses, port, timeout))
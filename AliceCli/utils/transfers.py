@@ -0,0 +1,253 @@
+#  Copyright (c) 2021
+#
+#  This file, transfers.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import hashlib
+import json
+import os
+import paramiko
+import posixpath
+import shlex
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+from typing import Callable, List, Optional, Sequence
+
+from AliceCli.utils import ssh
+
+
+CHUNK_SIZE = 8 * 1024 * 1024
+BLOCK_SIZE = 32768
+TRANSFER_WORKERS = 4
+JOURNAL_DIR = Path(Path.home(), '.pacli/transfers')
+PART_SUFFIX = '.part'
+HASH_BUFFER = 1024 * 1024
+
+
+class TransferError(Exception):
+	pass
+
+
+class _Journal:
+	"""
+	Remembers which chunks of a transfer made it, so that an interrupted transfer of the same file, unchanged, to the
+	same place resumes with the missing chunks only
+	"""
+
+	def __init__(self, *identity):
+		key = hashlib.sha1('|'.join(str(part) for part in identity).encode()).hexdigest()
+		self.file = Path(JOURNAL_DIR, f'{key}.json')
+		self.lock = Lock()
+		try:
+			self.done = set(json.loads(self.file.read_text())['done'])
+		except (OSError, ValueError, KeyError):
+			self.done = set()
+
+
+	def complete(self, chunk: int):
+		with self.lock:
+			self.done.add(chunk)
+			self.file.parent.mkdir(parents=True, exist_ok=True)
+			temp = self.file.with_suffix('.tmp')
+			temp.write_text(json.dumps({'done': sorted(self.done)}))
+			temp.replace(self.file)
+
+
+	def forget(self):
+		self.file.unlink(missing_ok=True)
+
+
+def upload(client: paramiko.SSHClient, local: Path, remote: str, workers: int = TRANSFER_WORKERS, onProgress: Optional[Callable[[int], None]] = None, verify: bool = True) -> str:
+	"""
+	Uploads local to remote and returns the remote path. The file is split in CHUNK_SIZE chunks written in parallel,
+	each over its own SFTP channel with pipelined writes, into a part file renamed once complete and, with verify,
+	once its remote hash matches.
+	"""
+	local = Path(local)
+	size = local.stat().st_size
+	with paramiko.SFTPClient.from_transport(client.get_transport()) as sftp:
+		remote = _remotePath(sftp, remote, local.name)
+		part = remote + PART_SUFFIX
+		journal = _Journal('upload', _peer(client), local.resolve(), local.stat().st_mtime_ns, size, remote)
+
+		if not journal.done or not _exists(sftp, part):
+			journal.done.clear()
+			with sftp.open(part, 'wb'):
+				pass
+			sftp.truncate(part, size)
+
+		pending = _pending(size, journal, onProgress)
+		_parallel(client, pending, workers, lambda channel, chunk: _uploadChunk(channel, local, part, size, chunk, journal, onProgress))
+
+		if verify:
+			_verify(localHash(local), remoteHash(client, part), remote)
+
+		if _exists(sftp, remote):
+			sftp.remove(remote)
+		sftp.rename(part, remote)
+
+	journal.forget()
+	return remote
+
+
+def download(client: paramiko.SSHClient, remote: str, local: Path, workers: int = TRANSFER_WORKERS, onProgress: Optional[Callable[[int], None]] = None, verify: bool = True) -> Path:
+	"""
+	Downloads remote to local, the counterpart of upload, reading chunks in parallel with prefetched requests
+	"""
+	local = Path(local)
+	with paramiko.SFTPClient.from_transport(client.get_transport()) as sftp:
+		remote = _remotePath(sftp, remote)
+		attributes = sftp.stat(remote)
+
+	if local.is_dir():
+		local = Path(local, posixpath.basename(remote))
+
+	size = attributes.st_size
+	part = local.with_name(local.name + PART_SUFFIX)
+	journal = _Journal('download', _peer(client), remote, attributes.st_mtime, size, local.resolve())
+
+	if not journal.done or not part.exists():
+		journal.done.clear()
+		with part.open('wb') as f:
+			f.truncate(size)
+
+	pending = _pending(size, journal, onProgress)
+	_parallel(client, pending, workers, lambda channel, chunk: _downloadChunk(channel, remote, part, size, chunk, journal, onProgress))
+
+	if verify:
+		_verify(remoteHash(client, remote), localHash(part), remote)
+
+	os.replace(part, local)
+	journal.forget()
+	return local
+
+
+def remoteSize(client: paramiko.SSHClient, remote: str) -> int:
+	with paramiko.SFTPClient.from_transport(client.get_transport()) as sftp:
+		return sftp.stat(_remotePath(sftp, remote)).st_size
+
+
+def localHash(path: Path) -> str:
+	digest = hashlib.sha256()
+	with Path(path).open('rb') as f:
+		while data := f.read(HASH_BUFFER):
+			digest.update(data)
+	return digest.hexdigest()
+
+
+def remoteHash(client: paramiko.SSHClient, path: str) -> str:
+	with ssh.execute(client, f'sha256sum -- {shlex.quote(path)}') as remote:
+		output = remote.stdout.read().decode(errors='replace')
+		if remote.wait() != 0 or not output:
+			raise TransferError(f'Could not hash {path} on the device: {remote.stderr.read().decode(errors="replace").strip()}')
+	return output.split()[0]
+
+
+def _verify(expected: str, actual: str, path: str):
+	if expected != actual:
+		raise TransferError(f'{path} is corrupted, sha256 {actual} instead of {expected}')
+
+
+def _pending(size: int, journal: _Journal, onProgress: Optional[Callable[[int], None]]) -> List[int]:
+	chunks = range((size + CHUNK_SIZE - 1) // CHUNK_SIZE)
+	if onProgress:
+		resumed = sum(min(CHUNK_SIZE, size - chunk * CHUNK_SIZE) for chunk in chunks if chunk in journal.done)
+		if resumed:
+			onProgress(resumed)
+	return [chunk for chunk in chunks if chunk not in journal.done]
+
+
+def _parallel(client: paramiko.SSHClient, chunks: Sequence[int], workers: int, transfer: Callable[[paramiko.SFTPClient, int], None]):
+	"""
+	Spreads the chunks over up to workers SFTP channels of the same transport
+	"""
+	if not chunks:
+		return
+
+	def work(assigned: Sequence[int]):
+		with paramiko.SFTPClient.from_transport(client.get_transport()) as channel:
+			for chunk in assigned:
+				transfer(channel, chunk)
+
+	workers = max(1, min(workers, len(chunks), ssh.CHANNEL_LIMIT))
+	with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transfer') as executor:
+		# Consuming the results raises the first failure, if any
+		list(executor.map(work, [chunks[index::workers] for index in range(workers)]))
+
+
+def _uploadChunk(sftp: paramiko.SFTPClient, local: Path, part: str, size: int, chunk: int, journal: _Journal, onProgress: Optional[Callable[[int], None]]):
+	offset = chunk * CHUNK_SIZE
+	remaining = min(CHUNK_SIZE, size - offset)
+	with local.open('rb') as source, sftp.open(part, 'r+b') as target:
+		# Do not wait for each write to be acknowledged, errors surface when closing
+		target.set_pipelined(True)
+		source.seek(offset)
+		target.seek(offset)
+		while remaining > 0:
+			data = source.read(min(BLOCK_SIZE, remaining))
+			if not data:
+				raise TransferError(f'{local} changed while uploading it')
+			target.write(data)
+			remaining -= len(data)
+			if onProgress:
+				onProgress(len(data))
+	journal.complete(chunk)
+
+
+def _downloadChunk(sftp: paramiko.SFTPClient, remote: str, part: Path, size: int, chunk: int, journal: _Journal, onProgress: Optional[Callable[[int], None]]):
+	offset = chunk * CHUNK_SIZE
+	end = min(offset + CHUNK_SIZE, size)
+	blocks = [(position, min(BLOCK_SIZE, end - position)) for position in range(offset, end, BLOCK_SIZE)]
+	with sftp.open(remote, 'rb') as source, part.open('r+b') as target:
+		target.seek(offset)
+		# readv sends all the read requests ahead and hands the blocks back in order
+		for data in source.readv(blocks):
+			target.write(data)
+			if onProgress:
+				onProgress(len(data))
+	journal.complete(chunk)
+
+
+def _remotePath(sftp: paramiko.SFTPClient, remote: str, name: str = '') -> str:
+	"""
+	SFTP paths are relative to the home directory but do not know ~. A directory gets name appended.
+	"""
+	if remote == '~' or remote.startswith('~/'):
+		remote = remote[2:]
+
+	if name and (not remote or remote.endswith('/') or _isDirectory(sftp, remote)):
+		remote = posixpath.join(remote, name)
+	return remote or '.'
+
+
+def _isDirectory(sftp: paramiko.SFTPClient, path: str) -> bool:
+	try:
+		return stat.S_ISDIR(sftp.stat(path).st_mode)
+	except IOError:
+		return False
+
+
+def _exists(sftp: paramiko.SFTPClient, path: str) -> bool:
+	try:
+		sftp.stat(path)
+		return True
+	except IOError:
+		return False
+
+
+def _peer(client: paramiko.SSHClient) -> str:
+	return '{}:{}'.format(*client.get_transport().getpeername()[:2])
@@ -0,0 +1,130 @@
+#  Copyright (c) 2021
+#
+#  This file, tuning.py, is part of Project Alice CLI.
+#
+#  Project Alice CLI is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import paramiko
+import statistics
+import time
+from typing import Callable, NamedTuple, Optional
+
+from AliceCli.utils import configs, ssh
+
+
+CANDIDATE_CIPHERS = ['aes128-ctr', 'aes128-gcm@openssh.com', 'aes256-ctr']
+CANDIDATE_COMPRESSION = [False, True]
+CANDIDATE_WINDOWS = [512 * 1024, 2 * 1024 * 1024, 8 * 1024 * 1024]
+CANDIDATE_PACKETS = [16384, 32768]
+# Half text, which compresses well, half random bytes, which does not, like our logs next to our archives
+BENCHMARK_COMMAND = 'seq 1 150000; head -c 1048576 /dev/urandom'
+LATENCY_PROBES = 3
+# Round trips a typical command sequence pays, weighing latency against throughput in the score
+ROUND_TRIPS = 10
+DEFAULT_PROFILE = {
+	'cipher'  : 'aes128-ctr',
+	'compress': False,
+	'window'  : paramiko.common.DEFAULT_WINDOW_SIZE,
+	'packet'  : paramiko.common.DEFAULT_MAX_PACKET_SIZE
+}
+
+
+class Benchmark(NamedTuple):
+	profile: dict
+	latency: float  # Seconds per command round trip
+	throughput: float  # Bytes per second
+	received: int
+
+	@property
+	def score(self) -> float:
+		"""
+		Estimated seconds to run ROUND_TRIPS commands and bring one benchmark payload back, the lower the better
+		"""
+		return ROUND_TRIPS * self.latency + self.received / max(self.throughput, 1)
+
+
+def benchmark(address: str, port: int = 22, profile: Optional[dict] = None, command: str = BENCHMARK_COMMAND) -> Benchmark:
+	"""
+	Opens a session with the profile and measures command latency and the download rate of the command's output
+	"""
+	profile = {**DEFAULT_PROFILE, **(profile or dict())}
+	client = ssh.openSession(address, port, profile=profile)
+	try:
+		latencies = list()
+		for _ in range(LATENCY_PROBES):
+			start = time.monotonic()
+			with ssh.execute(client, 'true') as remote:
+				remote.wait()
+			latencies.append(time.monotonic() - start)
+
+		channel = client.get_transport().open_session(window_size=profile['window'], max_packet_size=profile['packet'])
+		try:
+			start = time.monotonic()
+			channel.exec_command(command)
+			received = 0
+			while data := channel.recv(ssh.CHUNK_SIZE):
+				received += len(data)
+			elapsed = max(time.monotonic() - start, 1e-6)
+		finally:
+			channel.close()
+	finally:
+		client.close()
+
+	return Benchmark(profile, statistics.median(latencies), received / elapsed, received)
+
+
+def tune(address: str, port: int = 22, onBenchmark: Optional[Callable[[Benchmark], None]] = None, command: str = BENCHMARK_COMMAND) -> Benchmark:
+	"""
+	Benchmarks candidate settings one at a time, keeping each one that beats the best profile so far. Settings are
+	tried in the order they matter most on a slow link: cipher, compression, window, then packet size.
+	"""
+	supported = ssh.supportedCiphers()
+	candidates = [
+		('cipher', [cipher for cipher in CANDIDATE_CIPHERS if cipher in supported]),
+		('compress', CANDIDATE_COMPRESSION),
+		('window', CANDIDATE_WINDOWS),
+		('packet', CANDIDATE_PACKETS)
+	]
+
+	best = benchmark(address, port, DEFAULT_PROFILE, command)
+	if onBenchmark:
+		onBenchmark(best)
+
+	for setting, values in candidates:
+		for value in values:
+			if best.profile[setting] == value:
+				continue
+
+			try:
+				result = benchmark(address, port, {**best.profile, setting: value}, command)
+			except (paramiko.SSHException, OSError):
+				continue  # The device does not support that setting
+
+			if onBenchmark:
+				onBenchmark(result)
+			if result.score < best.score:
+				best = result
+
+	return best
+
+
+def saveProfile(address: str, result: Benchmark):
+	confs = configs.loadConfigs()
+	confs['servers'].setdefault(address, dict())['profile'] = {
+		**result.profile,
+		'latency'   : round(result.latency, 4),
+		'throughput': round(result.throughput),
+		'tuned'     : time.time()
+	}
+	configs.saveConfigs(confs)
@@ -23,7 +23,7 @@ import time
 from InquirerPy import inquirer
 from InquirerPy.validator import PasswordValidator
 
-from AliceCli.utils import commons
+from AliceCli.utils import agent, commons, daemon, facts, ssh
 from AliceCli.utils.decorators import checkConnection
 
 
@@ -91,6 +91,7 @@ def changeHostname(ctx: click.Context, hostname: str):
 
 	commons.waitAnimation()
 	commons.sshCmd(f"sudo hostnamectl set-hostname '{hostname}'")
+	commons.forgetFacts()
 	ctx.invoke(reboot, ctx, return_to_main_menu=False)
 
 	commons.waitAnimation()
@@ -110,10 +111,11 @@ def reboot(ctx: click.Context, return_to_main_menu: bool = True):  # NOSONAR
 	click.secho('Rebooting device, please wait', fg='yellow')
 
 	commons.waitAnimation()
+	address = commons.SESSIONS.current
+	bootId = ssh.bootId(commons.SESSIONS.session())
 	commons.sshCmd('sudo reboot')
-	address = commons.CONNECTED_TO
 	ctx.invoke(commons.disconnect)
-	rebooted = commons.tryReconnect(ctx, address)
+	rebooted = commons.tryReconnect(ctx, address, bootId, afterReboot=True)
 
 	if not rebooted:
 		commons.printError('Failed rebooting device')
@@ -146,6 +148,7 @@ def updateSystem(ctx: click.Context):
 
 	commons.waitAnimation()
 	commons.sshCmd('sudo apt-get update && sudo apt-get upgrade -y')
+	commons.forgetFacts()
 	commons.printSuccess('Device updated!')
 	commons.returnToMainMenu(ctx, pause=True)
 
@@ -158,6 +161,7 @@ def upgradeSystem(ctx: click.Context):
 
 	commons.waitAnimation()
 	commons.sshCmd('sudo apt-get update && sudo apt-get dist-upgrade -y')
+	commons.forgetFacts()
 	commons.printSuccess('Device upgraded!')
 	ctx.invoke(reboot)
 
@@ -242,18 +246,19 @@ def aliceLogs(ctx: click.Context):
 @click.pass_context
 @checkConnection
 def displayLogs(ctx: click.Context, file: str):
+	commons.printInfo('Press Ctrl-C to stop following the logs')
+	address = commons.SESSIONS.current  # Once the link is dead, the pool has no current device anymore
 	# noinspection PyBroadException
 	try:
-		commons.sshCmd(f'tail -n 250 -f {file} & {{ read ; kill %1; }}')
+		commons.sshCmd(f'tail -n 250 -f {file}')
+	except KeyboardInterrupt:
+		pass  # The remote tail is stopped along with its channel
 	except:
-		# noinspection PyBroadException
-		try:
-			commons.SSH.exec_command('\r')
-		except:
-			address = commons.CONNECTED_TO
+		session = commons.SESSIONS.session()
+		if not session or not ssh.isAlive(session):
 			ctx.invoke(commons.disconnect)
 			if commons.tryReconnect(ctx, address):
-				ctx.invoke(displayLogs, file)
+				ctx.invoke(displayLogs, file=file)
 			else:
 				commons.printError('Connection to Alice lost')
 
@@ -266,15 +271,156 @@ def displayLogs(ctx: click.Context, file: str):
 def disableRespeakerLeds(ctx: click.Context):
 	click.echo('Turning off Respeaker always on leds')
 	commons.waitAnimation()
-	click.echo('Make sure we have pip')
-	commons.sshCmd('sudo apt-get install python3-pip -y')
-	click.echo('Install pixel ring our savior')
-	commons.sshCmd('sudo pip3 install pixel_ring')  # sudo is required here, that's bad, but we uninstall directly after
-	click.echo('Testing the leds and turning off')
-	commons.sshCmd('pixel_ring_check', hide=True)
-	time.sleep(3)
-	click.echo('Uninstall pixel ring as we don\'t need it anymore')
-	commons.sshCmd('sudo pip3 uninstall pixel_ring -y')
+	commons.sshScript([
+		ssh.Step('sudo apt-get install python3-pip -y', 'Make sure we have pip'),
+		ssh.Step('sudo pip3 install pixel_ring', 'Install pixel ring our savior'),  # sudo is required here, that's bad, but we uninstall directly after
+		ssh.Step('pixel_ring_check; sleep 3', 'Testing the leds and turning off', hide=True),
+		ssh.Step('sudo pip3 uninstall pixel_ring -y', 'Uninstall pixel ring as we don\'t need it anymore')
+	])
 	commons.stopAnimation()
 	commons.printSuccess('Should be done!')
 	commons.returnToMainMenu(ctx, pause=True)
+
+
+@click.command(name='facts')
+@click.option('-r', '--refresh', is_flag=True, help='Probe the device again instead of using the cached facts')
+@click.pass_context
+@checkConnection
+def deviceFacts(ctx: click.Context, refresh: bool):
+	found = commons.deviceFacts(refresh=refresh)
+	gathered = time.strftime('%Y-%m-%d %H:%M', time.localtime(facts.gatheredAt(commons.SESSIONS.current)))
+	click.secho(f'Facts about {commons.SESSIONS.current}, gathered {gathered}', fg='yellow')
+	for key, value in found.items():
+		click.echo(f'{key:>15}: {value}')
+
+	commons.returnToMainMenu(ctx, pause=True)
+
+
+@click.command(name='status')
+@click.pass_context
+@checkConnection
+def deviceStatus(ctx: click.Context):
+	"""
+	Alice's service, install and configuration, the busiest processes and the audio devices, all asked in one go
+	"""
+	remote = commons.remoteAgent()
+	if not remote:
+		commons.printError('The remote agent could not start, is python3 installed on the device? Asking the shell instead')
+		_shellStatus()
+		commons.returnToMainMenu(ctx, pause=True)
+		return
+
+	try:
+		service, install, config, processes, audio = remote.batch([
+			('service', {'name': 'ProjectAlice'}),
+			('stat', {'path': '~/ProjectAlice'}),
+			('stat', {'path': '~/ProjectAlice/config.json'}),
+			('processes', dict()),
+			('audio', dict())
+		])
+	except agent.AgentError as e:
+		commons.printError(f'The remote agent failed: {e}. Asking the shell instead')
+		_shellStatus()
+		commons.returnToMainMenu(ctx, pause=True)
+		return
+
+	click.secho(f'Status of {commons.SESSIONS.current}', fg='yellow')
+	if isinstance(service, dict):
+		click.echo(f'Alice service: {service["active"]}, {service["enabled"]}')
+	if isinstance(install, dict):
+		click.echo(f'Alice installed: {"yes" if install["exists"] else "no"}')
+	if isinstance(config, dict) and config['exists']:
+		click.echo(f'Configuration modified: {time.strftime("%Y-%m-%d %H:%M", time.localtime(config["mtime"]))}')
+
+	if isinstance(processes, list):
+		click.echo('Busiest processes:')
+		for process in sorted(processes, key=lambda found: found['rss'], reverse=True)[:5]:
+			click.echo(f'{process["pid"]:>8} {process["rss"] // 1048576:>5}MB {process["command"][:60]}')
+
+	if isinstance(audio, list):
+		click.echo('Audio devices:')
+		for device in audio:
+			directions = ', '.join(direction for direction in ('playback', 'capture') if device[direction])
+			click.echo(f'    card {device["card"]} device {device["device"]}: {device["name"]} ({directions})')
+
+	commons.returnToMainMenu(ctx, pause=True)
+
+
+def _shellStatus():
+	"""
+	What deviceStatus shows, asked to the shell for when the agent cannot tell
+	"""
+	stdout, _ = commons.sshCmdWithReturn('; '.join([
+		'echo "Alice service: $(systemctl is-active ProjectAlice), $(systemctl is-enabled ProjectAlice 2>/dev/null)"',
+		'echo "Alice installed: $(test -d ~/ProjectAlice/ && echo yes || echo no)"',
+		'[ -f ~/ProjectAlice/config.json ] && echo "Configuration modified: $(date -r ~/ProjectAlice/config.json \'+%Y-%m-%d %H:%M\')"',
+		'echo "Busiest processes:"',
+		'ps -eo pid=,rss=,args= --sort=-rss | head -5 | awk \'{printf "%8s %5dMB %s\\n", $1, $2 / 1024, substr($0, index($0, $3), 60)}\'',
+		'echo "Audio devices:"',
+		'{ aplay -l; arecord -l; } 2>/dev/null | grep ^card | sort -u | sed "s/^/    /"'
+	]), timeout=facts.PROBE_TIMEOUT)
+
+	click.secho(f'Status of {commons.SESSIONS.current}', fg='yellow')
+	click.echo(stdout.read().decode(errors='replace'), nl=False)
+
+
+@click.command(name='daemon')
+@click.option('-a', '--action', required=True, type=click.Choice(['start', 'stop', 'status'], case_sensitive=False))
+def controlDaemon(action: str):
+	if not daemon.isSupported():
+		commons.printError('The control daemon needs UNIX sockets, which this system does not have')
+		return
+
+	action = action.lower()
+	if action == 'start':
+		if daemon.start():
+			commons.printSuccess('Control daemon running')
+		else:
+			commons.printError('Failed starting the control daemon')
+	elif action == 'stop':
+		if daemon.stop():
+			commons.printSuccess('Control daemon stopped')
+		else:
+			commons.printInfo('The control daemon was not running')
+	else:
+		state = daemon.status()
+		if state:
+			commons.printInfo(f'Control daemon running with pid {state["pid"]}, connected to: {", ".join(state["sessions"]) or "no device"}')
+		else:
+			commons.printInfo('The control daemon is not running')
+
+
+@click.command(name='run')
+@click.option('-i', '--ip_address', required=True, type=str)
+@click.option('-p', '--port', required=False, type=int, default=22)
+@click.option('-c', '--command', required=True, type=str)
+@click.option('-t', '--timeout', required=False, type=click.FloatRange(min=0, min_open=True), default=None, help='Deadline in seconds for the command')
+@click.option('--idle_timeout', required=False, type=click.FloatRange(min=0, min_open=True), default=None, help='Longest time in seconds the command may stay silent')
+@click.pass_context
+def runCommand(ctx: click.Context, ip_address: str, port: int, command: str, timeout: float, idle_timeout: float):
+	"""
+	Runs a command on a device and exits with its exit status, 124 if it got stopped by a timeout. Meant for
+	scripts: the session held by the control daemon is used if it runs, otherwise the device's stored key.
+	"""
+	def echo(stream: str, line: str):
+		click.echo(line, nl=False, err=stream == ssh.STDERR)
+
+	try:
+		exitStatus = daemon.run(ip_address, command, echo, port, timeout=timeout, idleTimeout=idle_timeout)
+		if exitStatus is None:
+			client = ssh.openSession(ip_address, port)
+			try:
+				with ssh.execute(client, command, timeout=timeout, idleTimeout=idle_timeout) as remote:
+					for stream, line in remote.lines():
+						echo(stream, line)
+					exitStatus = remote.wait()
+			finally:
+				client.close()
+	except ssh.CommandTimeout as e:
+		click.secho(f'✘ {e}', fg='red', err=True)
+		exitStatus = ssh.TIMEOUT_STATUS
+	except Exception as e:
+		click.secho(f'✘ {e}', fg='red', err=True)
+		exitStatus = 255
+
+	ctx.exit(exitStatus)
@@ -40,6 +40,7 @@ setup(
 	install_requires=[
 		'click~=8.0.3',
 		'paramiko~=2.8.1',
+		'cryptography~=36.0',
 		'InquirerPy~=0.3.1',
 		'networkscan~=1.0.9',
 		'pyyaml~=6.0',
@@ -67,6 +68,6 @@ setup(
 	],
     entry_points='''
         [console_scripts]
-        alice=AliceCli.AliceCli:cli
+        alice=AliceCli.launcher:main
     '''
 )